@@ -1,3 +1,4 @@
+import os
 import re
 
 # Iphone file names
@@ -19,6 +20,10 @@ DEFAULT_SQLITE_OUTPUT_PATH = 'iPhone_database_'
 """
 Default Sqlite 3 output path template
 """
+BACKUP_ID_LENGTH = 16
+"""
+Number of hex characters of the backup path hash used as the backup id (names the per backup databases)
+"""
 IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME = 'Manifest.db'
 """
 Iphone manifest.db file name (no need to change unless changes are made to the IOS database structure)
@@ -27,20 +32,197 @@ IPHONE_BACKUP_MANIFEST_TABLE_NAME = 'Files'
 """
 Iphone manifest.db table name (no need to change unless changes are made to the IOS database structure)
 """
+IPHONE_BACKUP_MANIFEST_COLUMNS_LIST_FORM = ['fileID', 'domain', 'relativePath', 'flags', 'file']
+"""
+Iphone manifest.db Files table columns (in list form, the file column holds the NSKeyedArchiver MBFile blob)
+"""
+IPHONE_BACKUP_SHARD_DIRECTORY_NAMES = [f"{shard_index:02x}" for shard_index in range(256)]
+"""
+Names of the two hex character shard directories the iphone backup stores content files in (first two characters of the fileID)
+"""
+DEFAULT_SHARD_SCAN_WORKERS = 8
+"""
+Number of threads used to list the backup shard directories (set to 1 to list them sequentially)
+"""
+DEFAULT_SQL_FETCH_SIZE = 5000
+"""
+Number of rows fetched per fetchmany call when streaming rows out of a database
+"""
+SQL_MAX_VARIABLE_NUMBER = 999
+"""
+Maximum number of ? parameters bound by one SQL statement (the limit of SQLite releases before 3.32), longer IN lists are queried in batches
+"""
+DEFAULT_SQL_INSERT_BATCH_SIZE = 10000
+"""
+Number of rows written per executemany call (and per transaction) when bulk inserting into the main storage database
+"""
 
-# Ordering of Columns list is as follows: file_ID, domain, relative_Path, flags, file, file_Type, absolute_Path
-# TODO: Make order of list not matter
-# DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM = DEFAULT_SQL_STORAGE_COLUMNS.strip('(').strip(')').split(',')
-DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM = ['file_ID', 'domain', 'relative_Path', 'flags', 'absolute_Path', 'file_Type', 'file']
+# Ordering of Columns list is as follows: file_ID, domain, relative_Path, flags, absolute_Path, file_Type, file
+# New columns must be appended to the end, existing file databases gain them via ALTER TABLE
+DEFAULT_SQL_STORAGE_COLUMN_DEFINITIONS = {
+    'file_ID': 'TEXT PRIMARY KEY',
+    'domain': 'TEXT',
+    'relative_Path': 'TEXT',
+    'flags': 'INTEGER',
+    'absolute_Path': 'TEXT',
+    'file_Type': 'TEXT',
+    'file': 'BLOB',
+    'file_Size': 'INTEGER',
+    'file_Mode': 'INTEGER',
+    'file_Inode': 'INTEGER',
+    'file_User_ID': 'INTEGER',
+    'file_Group_ID': 'INTEGER',
+    'file_Last_Modified': 'INTEGER',
+    'file_Last_Status_Change': 'INTEGER',
+    'file_Birth': 'INTEGER',
+    'file_Protection_Class': 'INTEGER',
+    'file_SHA256': 'TEXT',
+    'file_MD5': 'TEXT',
+    'file_SHA1': 'TEXT',
+    'file_Presumed_SHA256': 'TEXT',
+    'file_Signature': 'TEXT',
+    'file_Blob_Decoded': 'INTEGER'
+}
+"""
+Column names to SQL column definitions of the main storage database
+"""
+DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM = list(DEFAULT_SQL_STORAGE_COLUMN_DEFINITIONS)
 """
 Default storage columns for the main storage database (in list form)
 """
-# TODO: Make this string dependent on the list form version (DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM)
-# DEFAULT_SQL_STORAGE_COLUMNS = f"'({','.join(DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM)})'"
-DEFAULT_SQL_STORAGE_COLUMNS = '(file_ID, domain, relative_Path, flags, absolute_Path, file_Type, file)'
+DEFAULT_SQL_STORAGE_COLUMNS = f"({', '.join(DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM)})"
 """
 Default storage columns for the main storage database (in string form with formatting)
 """
+DEFAULT_SQL_STORAGE_TABLE_SCHEMA = f"({', '.join(f'{column} {definition}' for column, definition in DEFAULT_SQL_STORAGE_COLUMN_DEFINITIONS.items())})"
+"""
+Table schema (columns with definitions) used to create the main storage database table
+"""
+DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM = DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[:6]
+"""
+Main storage database columns read into storage_master['iphone_file_contents'] (the raw manifest file blob and decoded metadata are left out)
+"""
+DEFAULT_SQL_STORAGE_EXPORT_COLUMNS_LIST_FORM = [column for column in DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM if column not in ('file', 'file_Blob_Decoded')]
+"""
+Main storage database columns written by the json lines export (every column except the raw manifest file blob and its decoding status)
+"""
+MANIFEST_FILE_BLOB_COLUMNS = {
+    'file_Size': 'Size',
+    'file_Mode': 'Mode',
+    'file_Inode': 'InodeNumber',
+    'file_User_ID': 'UserID',
+    'file_Group_ID': 'GroupID',
+    'file_Last_Modified': 'LastModified',
+    'file_Last_Status_Change': 'LastStatusChange',
+    'file_Birth': 'Birth',
+    'file_Protection_Class': 'ProtectionClass'
+}
+"""
+Main storage database columns decoded from the manifest.db file blob (NSKeyedArchiver MBFile plist) to the MBFile key they hold (timestamps are unix seconds)
+"""
+FILE_TIMESTAMP_COLUMNS = ['file_Last_Modified', 'file_Last_Status_Change', 'file_Birth']
+"""
+Main storage database columns holding unix timestamps (shown as ISO 8601 UTC dates by the query subcommand)
+"""
+FILE_HASH_COLUMNS = {
+    'sha256': 'file_SHA256',
+    'md5': 'file_MD5',
+    'sha1': 'file_SHA1'
+}
+"""
+Supported content hash algorithms (hashlib names) to the main storage database column holding the hex digest
+"""
+MANIFEST_FILE_BLOB_DECODED_COLUMN = 'file_Blob_Decoded'
+"""
+Main storage database column recording whether the file blob was decoded (1) or failed to decode (0), NULL until the blob is first decoded
+"""
+FILE_PRESUMED_SHA256_COLUMN = 'file_Presumed_SHA256'
+"""
+Main storage database column holding the sha256 digest an earlier backup of the case recorded for the same file (same domain, relative path and manifest metadata),
+presumed from the manifest metadata without reading the file, so never used in place of the verified digest (file_SHA256)
+"""
+FILE_SIGNATURE_COLUMN = 'file_Signature'
+"""
+Main storage database column holding the file type detected from the file signature ('' when no signature matched, NULL until the file is read)
+"""
+DEFAULT_SQL_STORAGE_DERIVED_COLUMNS_LIST_FORM = list(MANIFEST_FILE_BLOB_COLUMNS) + [MANIFEST_FILE_BLOB_DECODED_COLUMN] + list(FILE_HASH_COLUMNS.values()) + [FILE_PRESUMED_SHA256_COLUMN, FILE_SIGNATURE_COLUMN]
+"""
+Main storage database columns derived from the file blob or contents, reset to NULL (and so recomputed) when the manifest row changes
+"""
+DEFAULT_SQL_METADATA_TABLE_NAME = 'iminer_metadata'
+"""
+Key/value table in the main storage database recording which backup (Status.plist UUID and Date) the file table was indexed from
+"""
+DEFAULT_SQL_HASH_CACHE_TABLE_NAME = 'iminer_hash_cache'
+"""
+Table in the main storage database caching content hashes keyed on (absolute path, size, modification time)
+"""
+DEFAULT_SQL_STORAGE_SCHEMA_VERSION = '1'
+"""
+Schema version of the main storage database, file tables from older schema versions are rebuilt from scratch
+"""
+DEFAULT_SQL_STORAGE_INDEXES = {
+    'domain_relative_path_index': ['domain', 'relative_Path'],
+    'relative_path_index': ['relative_Path'],
+    'file_size_index': ['file_Size'],
+    'file_last_modified_index': ['file_Last_Modified'],
+    'file_type_size_index': ['file_Type', 'file_Size']
+}
+"""
+Indexes created on the main storage database after bulk loading (index name suffix to indexed columns)
+"""
+FILE_TABLE_COLUMN_STORAGE_TYPES = {
+    'file_ID': 'hex',
+    'domain': 'category',
+    'relative_Path': 'string',
+    'flags': 'category',
+    'absolute_Path': 'path',
+    'file_Type': 'category'
+}
+"""
+How each column of the in memory file table (storage_master['iphone_file_contents']) is stored (see file_table.FileTable)
+"""
+FILE_TABLE_HEX_BYTE_LENGTH = 20
+"""
+Length in bytes of the hex values packed by the file table (fileIDs are sha1 hex digests)
+"""
+DEFAULT_SQL_FILE_FULL_TEXT_COLUMNS = ['domain', 'relative_Path']
+"""
+File table columns indexed by the file path full text (FTS5) table
+"""
+DEFAULT_SQL_SMS_FULL_TEXT_TABLE_NAME = 'iminer_sms_full_text'
+"""
+Name of the full text (FTS5) table holding the sms.db message bodies
+"""
+DEFAULT_SQL_FULL_TEXT_TOKENIZER = 'unicode61 remove_diacritics 2'
+"""
+FTS5 tokenizer of the full text tables (paths are split on punctuation such as '/', '.' and '_' so every path component is a search term)
+"""
+DEFAULT_FULL_TEXT_SEARCH_LIMIT = 50
+"""
+Default maximum number of ranked hits returned by a full text search
+"""
+FULL_TEXT_SEARCH_TARGETS = ['files', 'sms']
+"""
+Names of the full text indexes that can be searched
+"""
+
+# Storage master sections (in output order)
+STORAGE_MASTER_SECTIONS = [
+    'iphone_system_information',
+    'iphone_applications',
+    'iphone_iTunes_information',
+    'iphone_iBooks_information',
+    'iphone_backup_information',
+    'iphone_status_information',
+    'iphone_file_contents',
+    'paired_devices',
+    'voicemail_information',
+    'sms_message_information'
+]
+"""
+Storage master section names, each section is only computed when it is first accessed
+"""
 
 # Default file output paths
 DEFAULT_XML_OUTPUT_PATH = 'xml_output.xml'
@@ -51,6 +233,198 @@ DEFAULT_TXT_OUTPUT_PATH = 'txt_output.txt'
 """
 Default filename/path for the txt output files
 """
+DEFAULT_JSONL_OUTPUT_PATH = 'jsonl_output.jsonl'
+"""
+Default filename/path for the json lines output files
+"""
+DEFAULT_PROFILE_OUTPUT_PATH = 'profile.json'
+"""
+Default filename/path for the profile (per stage metrics) JSON output files
+"""
+
+# Profiling
+PROFILE_STAGES = [
+    'parse_plist_files',
+    'load_storage_master_sections',
+    'analyse_iphone_content_files',
+    'backup_shard_index',
+    'synchronise_file_database',
+    'insert_table_rows',
+    'decode_file_blobs',
+    'find_known_case_contents',
+    'classify_file_types',
+    'create_file_database_indexes',
+    'register_case_contents',
+    'get_database_rows_iphone_content_files',
+    'manifest_search_index',
+    'build_full_text_indexes',
+    'parse_indexed_files',
+    'hash_iphone_content_files',
+    'display_all_information',
+    'create_xml_file',
+    'create_text_file',
+    'create_jsonl_file'
+]
+"""
+Names of the profiled stages (any of them can be run under cProfile with --profile_cprofile_stage)
+"""
+
+# Evidence database access
+DEFAULT_SQL_EVIDENCE_MMAP_SIZE = 256 * 1024 * 1024
+"""
+Bytes of each backup database file (manifest.db, sms.db...) read through memory mapping
+"""
+DEFAULT_SQL_EVIDENCE_CACHE_SIZE = 64 * 1024
+"""
+Page cache size in KiB of each read only backup database connection
+"""
+
+# Backup diff
+BACKUP_DIFF_CHANGE_TYPES = ['added', 'removed', 'modified']
+"""
+Kinds of file changes reported when diffing two backups of the same device
+"""
+
+# Query subcommand
+DEFAULT_QUERY_COLUMNS = ['domain', 'relative_Path', 'file_Type', 'file_Size', 'file_Last_Modified']
+"""
+Default file database columns shown by the query subcommand
+"""
+QUERY_OUTPUT_FORMATS = ['tsv', 'jsonl']
+"""
+Output formats of the query subcommand (tab separated values with a header line, or json lines)
+"""
+FILE_SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+"""
+Size suffixes accepted by the query subcommand size filters (e.g. 10M)
+"""
+
+# Case content index
+DEFAULT_CASE_DATABASE_PATH = 'iminer_case.db'
+"""
+Default filename/path of the case database (content addressed index shared by every backup of a case)
+"""
+CASE_CONTENTS_TABLE_NAME = 'case_contents'
+"""
+Case database table of unique contents (sha256) and their analysis results
+"""
+CASE_CONTENT_OCCURRENCES_TABLE_NAME = 'case_content_occurrences'
+"""
+Case database table of every (backup, file) each content occurs at
+"""
+DEFAULT_CASE_DATABASE_TIMEOUT = 300
+"""
+Seconds to wait for the case database lock (backups processed in parallel share it)
+"""
+CASE_CONTENT_EXPORTS_TABLE_NAME = 'case_content_exports'
+"""
+Case database table of where each content was exported to (exports of later backups hard link to these copies)
+"""
+CASE_ARTIFACT_CHUNKS_TABLE_NAME = 'case_artifact_chunks'
+"""
+Case database table of the rows extracted from backup databases (e.g. sms.db), keyed on the database content hash
+"""
+CASE_CONTENT_METADATA_COLUMNS = ['file_Size', 'file_Last_Modified', 'file_Last_Status_Change', 'file_Inode']
+"""
+Decoded manifest metadata columns that, with the domain and relative path, recognise a file unchanged since an earlier backup of the case
+"""
+
+# Parallel processing
+DEFAULT_JOBS = 1
+"""
+Default number of backups processed at once (values above 1 use a process pool)
+"""
+DEFAULT_WORKER_OUTPUT_POLL_SECONDS = 0.1
+"""
+Interval in seconds the output of the --jobs workers is printed at
+"""
+DEFAULT_OUTPUT_BUFFER_SIZE = 1024 * 1024
+"""
+Size in characters of the blocks the txt and xml writers build up before writing to the output file
+"""
+DEFAULT_STD_OUT_BLOCK_SIZE = 64 * 1024
+"""
+Size in characters of the blocks written (and flushed) to std output when displaying information
+"""
+DEFAULT_FILE_BLOB_DECODE_WORKERS = os.cpu_count() or 1
+"""
+Number of processes used to decode the manifest.db file blobs (set to 1 to decode in process)
+"""
+DEFAULT_FILE_BLOB_DECODE_BATCH_SIZE = 5000
+"""
+Number of file blobs sent to a decoding process at once
+"""
+DEFAULT_HASH_ALGORITHMS = ['sha256']
+"""
+Content hash algorithms always computed when hashing the backup files (more can be added from FILE_HASH_COLUMNS)
+"""
+DEFAULT_HASH_WORKERS = 8
+"""
+Number of threads hashing backup files at once (hashlib releases the GIL while hashing)
+"""
+DEFAULT_HASH_READ_SIZE = 1024 * 1024
+"""
+Size in bytes of the buffered reads used to hash files smaller than DEFAULT_HASH_MMAP_THRESHOLD
+"""
+DEFAULT_HASH_MMAP_THRESHOLD = 64 * 1024 * 1024
+"""
+Files of at least this many bytes are hashed through a read only memory map instead of buffered reads
+"""
+FILE_SIGNATURE_READ_SIZE = 512
+"""
+Number of bytes read from the start of each file to detect its type from its signature (magic bytes)
+"""
+FILE_SIGNATURES = [
+    ('sqlite', 0, b'SQLite format 3\x00'),
+    ('plist', 0, b'bplist'),
+    ('jpg', 0, b'\xff\xd8\xff'),
+    ('png', 0, b'\x89PNG\r\n\x1a\n'),
+    ('gif', 0, b'GIF87a'),
+    ('gif', 0, b'GIF89a'),
+    ('pdf', 0, b'%PDF-'),
+    ('zip', 0, b'PK\x03\x04'),
+    ('gz', 0, b'\x1f\x8b\x08'),
+    ('tiff', 0, b'II*\x00'),
+    ('tiff', 0, b'MM\x00*'),
+    ('amr', 0, b'#!AMR'),
+    ('caf', 0, b'caff'),
+    ('mp3', 0, b'ID3'),
+    ('wav', 8, b'WAVE'),
+    ('webp', 8, b'WEBP'),
+    ('realm', 16, b'T-DB')
+]
+"""
+File type to (offset, magic bytes) signatures, checked in order (bitmaps, ISO base media files and xml plists are detected separately)
+"""
+FILE_SIGNATURE_BMP_HEADER_SIZES = [12, 40, 52, 56, 64, 108, 124]
+"""
+Valid bitmap DIB header sizes (the 'BM' magic bytes alone are too short to tell bitmaps from text files)
+"""
+FILE_SIGNATURE_FTYP_BRANDS = {
+    b'heic': 'heic', b'heix': 'heic', b'hevc': 'heic', b'heim': 'heic', b'heis': 'heic', b'mif1': 'heic', b'msf1': 'heic',
+    b'qt  ': 'mov',
+    b'M4A ': 'm4a', b'M4B ': 'm4a',
+    b'M4V ': 'mp4', b'isom': 'mp4', b'iso2': 'mp4', b'mp41': 'mp4', b'mp42': 'mp4', b'avc1': 'mp4', b'3gp4': '3gp', b'3gp5': '3gp'
+}
+"""
+ISO base media file ('ftyp' box at offset 4) major brands to file type
+"""
+DEFAULT_FILE_SIGNATURE_WORKERS = 8
+"""
+Number of threads reading file signatures at once
+"""
+DEFAULT_ARTIFACT_EXTRACTION_WORKERS = 4
+"""
+Number of threads used to extract artifacts (paired devices, voicemail, sms...) from the backup databases at once
+"""
+DEFAULT_EXPORT_WORKERS = 8
+"""
+Number of threads copying files at once when exporting backup files
+"""
+DEFAULT_EXPORT_COPY_BUFFER_SIZE = 1024 * 1024
+"""
+Buffer size in bytes of exported file copies that can not be done by the kernel (copy_file_range/sendfile)
+"""
 
 # Formatting
 # TODO: Change this variable to allow for dynamic column scaling
@@ -68,6 +442,10 @@ XML_IGNORE_CHARACTER_STRING = 'IMINER-TAG-IGNORE--'
 """
 XML tag appending string if the tag begins with an illegal character (a number or punctuation)
 """
+XML_ILLEGAL_CHARACTERS_PATTERN = '[\x00-\x08\x0b\x0c\x0e-\x1f]'
+"""
+Regular expression matching the control characters that are not allowed in XML 1.0 documents
+"""
 REGEX_CAMEL_CASE_SEARCH_EXPRESSION = re.compile("(?!^)([A-Z]+)")
 """
 Regular expression to check for CamelCase characters other then first letter (used for conversion to snake_case)
@@ -100,4 +478,8 @@ Default sqlite database table name for the sms information database
 SMS_MESSAGE_INFORMATION_DB_PATH = 'Library/SMS/sms.db'
 """
 Default relative path in the IOS file system of the database file
+"""
+SMS_MESSAGE_INFORMATION_DB_TEXT_COLUMN = 'text'
+"""
+Column of the sms information database table holding the message body (indexed for full text search)
 """
\ No newline at end of file
@@ -0,0 +1,65 @@
+import Constants
+import concurrent.futures
+import time
+import traceback
+
+
+class ArtifactExtractionScheduler:
+    """
+    Artifact Extraction Scheduler class.
+    Runs registered artifact extractors (e.g. paired devices, voicemail, sms) concurrently on a thread pool,
+    isolating failures of single extractors and recording how long each extractor took.
+    """
+    def __init__(self, max_workers=Constants.DEFAULT_ARTIFACT_EXTRACTION_WORKERS):
+        """
+        Initialization method.
+        :param max_workers: Number of extractor threads (1 runs the extractors one after another).
+        """
+        self.max_workers = max_workers
+        self.extractors = {}
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+
+    def register_extractor(self, name, extractor):
+        """
+        Register an artifact extractor.
+        :param name: Extractor name (used as the storage master section name of its result).
+        :param extractor: Function without arguments returning the extracted artifact.
+        """
+        self.extractors[name] = extractor
+
+    def run_extractor(self, name):
+        """
+        Run a single extractor, timing it and catching any error.
+        :param name: Extractor name.
+        :return: Tuple of (name, result, error traceback or None, seconds taken).
+        """
+        start_time = time.perf_counter()
+        try:
+            result = self.extractors[name]()
+            error = None
+        except Exception as exception:
+            result = f"{name} extraction failed: {exception}"
+            error = traceback.format_exc()
+        return name, result, error, time.perf_counter() - start_time
+
+    def run(self):
+        """
+        Run all registered extractors.
+        :rtype: Dictionary
+        :return: Extractor name to result (in registration order), failed extractors map to an error message.
+        """
+        if self.max_workers > 1 and len(self.extractors) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                extractor_outcomes = list(executor.map(self.run_extractor, self.extractors))
+        else:
+            extractor_outcomes = [self.run_extractor(name) for name in self.extractors]
+
+        for name, result, error, seconds in extractor_outcomes:
+            self.results[name] = result
+            self.timings[name] = seconds
+            if error is not None:
+                self.errors[name] = error
+
+        return self.results
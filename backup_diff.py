@@ -0,0 +1,138 @@
+import Constants
+import evidence_connection_manager
+import manifest_file_decoder
+import os
+import sqlite3
+
+
+class BackupDiff:
+    """
+    Backup Diff class.
+    Compares two backups of the same device by merge joining their manifest.db Files tables, both read in fileID order,
+    so added, removed and modified files are found in a single linear pass without loading either manifest into memory.
+    """
+    def __init__(self, old_backup_path, new_backup_path, fetch_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Initialization method.
+        :param old_backup_path: Path to the older iphone backup directory.
+        :param new_backup_path: Path to the newer iphone backup directory.
+        :param fetch_size: Number of manifest rows to fetch per fetchmany call.
+        """
+        self.old_backup_path = old_backup_path
+        self.new_backup_path = new_backup_path
+        self.fetch_size = fetch_size
+        self.evidence_connections = evidence_connection_manager.EvidenceConnectionManager()
+        self.statistics = {change_type: 0 for change_type in Constants.BACKUP_DIFF_CHANGE_TYPES}
+        self.statistics['unchanged'] = 0
+
+    def iterate_sorted_manifest_rows(self, backup_path):
+        """
+        Stream the manifest.db Files rows of a backup ordered by fileID (served from the fileID primary key index).
+        :param backup_path: Path to the iphone backup directory.
+        :return: Generator of (fileID, domain, relativePath, flags, file) tuples.
+        """
+        manifest_columns = Constants.IPHONE_BACKUP_MANIFEST_COLUMNS_LIST_FORM
+        manifest_db_file_path = os.path.join(backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME)
+        manifest_db_cursor = self.evidence_connections.get_connection(manifest_db_file_path).cursor()
+        manifest_db_cursor.execute(
+            f"SELECT {', '.join(manifest_columns)} FROM {Constants.IPHONE_BACKUP_MANIFEST_TABLE_NAME} ORDER BY {manifest_columns[0]}"
+        )
+        try:
+            while True:
+                rows = manifest_db_cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            manifest_db_cursor.close()
+
+    def get_changed_fields(self, old_row, new_row):
+        """
+        Compare two manifest rows of the same fileID.
+        File blobs are only decoded when their bytes differ, the decoded metadata (size, timestamps...) is then compared field by field.
+        Blobs that differ only in properties without a storage column (extended attributes, encryption key...) are reported as a file blob change.
+        :param old_row: Manifest row of the older backup.
+        :param new_row: Manifest row of the newer backup.
+        :return: List of changed storage column names (empty if the file is unchanged).
+        """
+        storage_columns = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM
+        changed_fields = [storage_columns[column_index] for column_index in (1, 2, 3) if old_row[column_index] != new_row[column_index]]
+        if old_row[4] == new_row[4]:
+            return changed_fields
+
+        old_mbfile = manifest_file_decoder.decode_manifest_file_blob(old_row[4])
+        new_mbfile = manifest_file_decoder.decode_manifest_file_blob(new_row[4])
+        if old_mbfile is None or new_mbfile is None:
+            changed_fields.append(storage_columns[6])
+            return changed_fields
+
+        changed_blob_fields = [
+            column for column, mbfile_key in Constants.MANIFEST_FILE_BLOB_COLUMNS.items() if old_mbfile.get(mbfile_key) != new_mbfile.get(mbfile_key)
+        ]
+        changed_fields.extend(changed_blob_fields if changed_blob_fields else [storage_columns[6]])
+        return changed_fields
+
+    def create_change(self, change_type, manifest_row, changed_fields=()):
+        """
+        Create a change record and count it in self.statistics.
+        :param change_type: One of Constants.BACKUP_DIFF_CHANGE_TYPES.
+        :param manifest_row: Manifest row the change is about (the newer one for modified files).
+        :param changed_fields: Changed storage column names of a modified file.
+        :rtype: Dictionary
+        """
+        self.statistics[change_type] += 1
+        storage_columns = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM
+        return {
+            'change': change_type,
+            storage_columns[0]: manifest_row[0],
+            storage_columns[1]: manifest_row[1],
+            storage_columns[2]: manifest_row[2],
+            'changed_fields': list(changed_fields)
+        }
+
+    def iterate_changes(self):
+        """
+        Merge join both manifests on fileID, yielding every added, removed and modified file in fileID order.
+        :return: Generator of change dictionaries (change, file_ID, domain, relative_Path, changed_fields), or False if a manifest.db could not be read.
+        """
+        try:
+            old_rows = self.iterate_sorted_manifest_rows(self.old_backup_path)
+            new_rows = self.iterate_sorted_manifest_rows(self.new_backup_path)
+            old_row = next(old_rows, None)
+            new_row = next(new_rows, None)
+        except sqlite3.DatabaseError as error:
+            print(f"Manifest database could not be opened, check the backups are not encrypted ({error}).")
+            return False
+
+        return self.merge_rows(old_rows, new_rows, old_row, new_row)
+
+    def merge_rows(self, old_rows, new_rows, old_row, new_row):
+        """
+        Merge join two fileID ordered manifest row streams (see iterate_changes).
+        :param old_rows: Remaining rows of the older manifest.
+        :param new_rows: Remaining rows of the newer manifest.
+        :param old_row: Current row of the older manifest (None when exhausted).
+        :param new_row: Current row of the newer manifest (None when exhausted).
+        :return: Generator of change dictionaries.
+        """
+        while old_row is not None or new_row is not None:
+            if new_row is None or (old_row is not None and old_row[0] < new_row[0]):
+                yield self.create_change('removed', old_row)
+                old_row = next(old_rows, None)
+            elif old_row is None or new_row[0] < old_row[0]:
+                yield self.create_change('added', new_row)
+                new_row = next(new_rows, None)
+            else:
+                changed_fields = self.get_changed_fields(old_row, new_row)
+                if changed_fields:
+                    yield self.create_change('modified', new_row, changed_fields)
+                else:
+                    self.statistics['unchanged'] += 1
+                old_row = next(old_rows, None)
+                new_row = next(new_rows, None)
+
+    def close(self):
+        """
+        Close the manifest.db connections.
+        """
+        self.evidence_connections.close_connections()
@@ -0,0 +1,88 @@
+import Constants
+import concurrent.futures
+import os
+
+
+class BackupShardIndex:
+    """
+    Backup Shard Index class.
+    Lists the 256 shard directories of an iphone backup once and keeps an in-memory map of fileID to file information,
+    so resolving a fileID to its absolute path is a dictionary lookup instead of filesystem calls per file.
+    File sizes and modification times are only read (and then kept) when they are asked for.
+    """
+    def __init__(self, backup_path, max_workers=Constants.DEFAULT_SHARD_SCAN_WORKERS):
+        """
+        Initialization method, scan the shard directories of the given backup.
+        :param backup_path: Path to the iphone backup directory.
+        :param max_workers: Number of threads to list the shard directories with (1 lists them sequentially).
+        """
+        self.backup_path = backup_path
+        self.max_workers = max_workers
+        self.files = {}
+        self.file_stats = {}
+        self.scan()
+
+    def scan_shard_directory(self, shard_directory_name):
+        """
+        List a single shard directory.
+        :param shard_directory_name: Two hex character shard directory name.
+        :return: Dictionary of fileID to absolute path for every file in the directory.
+        """
+        shard_files = {}
+        try:
+            with os.scandir(os.path.join(self.backup_path, shard_directory_name)) as directory_entries:
+                for directory_entry in directory_entries:
+                    # The file type comes with the directory listing on most filesystems, so no stat call is made per file
+                    if directory_entry.is_file():
+                        shard_files[directory_entry.name] = directory_entry.path
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return shard_files
+
+    def scan(self):
+        """
+        (Re)scan all shard directories of the backup into self.files.
+        :return: Number of files found.
+        """
+        self.files = {}
+        self.file_stats = {}
+        if self.max_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for shard_files in executor.map(self.scan_shard_directory, Constants.IPHONE_BACKUP_SHARD_DIRECTORY_NAMES):
+                    self.files.update(shard_files)
+        else:
+            for shard_directory_name in Constants.IPHONE_BACKUP_SHARD_DIRECTORY_NAMES:
+                self.files.update(self.scan_shard_directory(shard_directory_name))
+        return len(self.files)
+
+    def get_absolute_path(self, fileID):
+        """
+        Get the absolute path of a content file from its fileID.
+        :param fileID: FileID of the file.
+        :return: Absolute path or '' if the file is not in the backup.
+        """
+        return self.files.get(fileID, '')
+
+    def get_file_stat(self, fileID):
+        """
+        Get the size and modification time of a content file, read on the first call for the file and kept for later calls.
+        :param fileID: FileID of the file.
+        :return: Tuple of (size, modification time) or None if the file is not in the backup (or can no longer be read).
+        """
+        file_stat = self.file_stats.get(fileID)
+        if file_stat is None:
+            absolute_path = self.files.get(fileID)
+            if absolute_path is None:
+                return None
+            try:
+                stat_result = os.stat(absolute_path)
+            except OSError:
+                return None
+            file_stat = self.file_stats[fileID] = (stat_result.st_size, stat_result.st_mtime)
+        return file_stat
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, fileID):
+        return fileID in self.files
@@ -0,0 +1,6 @@
+"""
+.. module:: benchmarks
+   :synopsis: Synthetic backup generator and stage by stage benchmarks for iminer
+
+Run from the repository root, e.g. ``python -m benchmarks.run_benchmarks --files 100000 --messages 50000``
+"""
@@ -0,0 +1,153 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+import Constants
+import iminer
+import iphone_parser
+import manifest_search_index
+from benchmarks import synthetic_backup
+
+"""
+.. module:: run_benchmarks.py
+   :synopsis: Time each iminer stage against a synthetic backup and write the results as JSON
+"""
+
+
+class StageTimer:
+    """
+    Stage Timer class.
+    Times benchmark stages and keeps the results (seconds, rows and rows per second) in stage order.
+    """
+    def __init__(self):
+        """
+        Initialization method.
+        """
+        self.stages = {}
+
+    def time_stage(self, stage_name, stage_function, row_count=None):
+        """
+        Run and time a single stage.
+        :param stage_name: Name of the stage in the results.
+        :param stage_function: Function without arguments running the stage.
+        :param row_count: Number of rows the stage processes (rows per second is only reported when given).
+        :return: Return value of the stage function.
+        """
+        start_time = time.perf_counter()
+        stage_result = stage_function()
+        seconds = time.perf_counter() - start_time
+
+        self.stages[stage_name] = {'seconds': seconds}
+        if row_count is not None:
+            self.stages[stage_name]['rows'] = row_count
+            self.stages[stage_name]['rows_per_second'] = row_count / seconds if seconds > 0 else 0.0
+        print(f"{stage_name:<45}{seconds:>10.3f}s")
+        return stage_result
+
+
+def get_code_version():
+    """
+    Return the git commit of the benchmarked code, so results from different versions can be compared.
+    :return: Commit hash (with a -dirty suffix for uncommitted changes) or '' outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(backup_path, file_count, message_count):
+    """
+    Time every iminer stage against the given backup (databases and outputs are written to the current directory).
+    :param backup_path: Synthetic backup directory.
+    :param file_count: Number of manifest.db rows in the backup.
+    :param message_count: Number of sms.db messages in the backup.
+    :rtype: Dictionary
+    :return: Stage name to timing results.
+    """
+    stage_timer = StageTimer()
+    iphone_parser_instance = iphone_parser.IPhoneParser(
+        backup_path,
+        iminer.parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_INFO_NAME)),
+        iminer.parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_MANIFEST_NAME)),
+        iminer.parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_STATUS_NAME))
+    )
+
+    stage_timer.time_stage('parse', iphone_parser_instance.parse)
+    stage_timer.time_stage('analyse_iphone_content_files', iphone_parser_instance.analyse_iphone_content_files, file_count)
+    stage_timer.time_stage('analyse_iphone_content_files_no_op_rerun', iphone_parser_instance.analyse_iphone_content_files, file_count)
+    stage_timer.time_stage('get_database_rows_iphone_content_files', iphone_parser_instance.get_database_rows_iphone_content_files, file_count)
+    iphone_parser_instance.manifest_search_index = stage_timer.time_stage(
+        'manifest_search_index',
+        lambda: manifest_search_index.ManifestSearchIndex(iphone_parser_instance.storage_master['iphone_file_contents']),
+        file_count
+    )
+    stage_timer.time_stage('parse_indexed_files', iphone_parser_instance.parse_indexed_files)
+
+    storage_master = iphone_parser_instance.get_storage_master()
+    stage_timer.time_stage('create_text_file', lambda: iminer.create_text_file(storage_master, 'benchmark_output.txt'), file_count + message_count)
+    stage_timer.time_stage('create_xml_file', lambda: iminer.create_xml_file(storage_master, 'benchmark_output.xml'), file_count + message_count)
+    stage_timer.time_stage('display_all_information', lambda: iminer.write_chunks(io.StringIO(), iminer.iterate_storage_master_txt(storage_master)), file_count + message_count)
+
+    iphone_parser_instance.database_handle.close_databases()
+    return stage_timer.stages
+
+
+def main():
+    """
+    Benchmark entry point, generates a synthetic backup, times every stage and writes the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark iminer stages against a synthetic IPhone backup.')
+    parser.add_argument('--files', help='Number of content files in the synthetic backup', type=int, default=10000)
+    parser.add_argument('--messages', help='Number of sms.db messages in the synthetic backup', type=int, default=10000)
+    parser.add_argument('--voicemails', help='Number of voicemail.db voicemails in the synthetic backup', type=int, default=100)
+    parser.add_argument('--seed', help='Random seed of the synthetic backup', type=int, default=0)
+    parser.add_argument('--work_path', help='Directory for the synthetic backup, databases and outputs (default a temporary directory)')
+    parser.add_argument('--keep', help='Keep the work directory after the run', action='store_true')
+    parser.add_argument('--output_path', help='Path of the JSON results file', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output_path)
+    work_path = os.path.abspath(args.work_path) if args.work_path else tempfile.mkdtemp(prefix='iminer_benchmark_')
+    backup_path = os.path.join(work_path, 'backup')
+    original_working_directory = os.getcwd()
+
+    try:
+        generate_start_time = time.perf_counter()
+        synthetic_backup.create_synthetic_backup(backup_path, args.files, args.messages, args.voicemails, args.seed)
+        print(f"{'generate_synthetic_backup':<45}{time.perf_counter() - generate_start_time:>10.3f}s")
+
+        os.chdir(work_path)
+        stages = run_benchmarks(backup_path, args.files, args.messages)
+    finally:
+        os.chdir(original_working_directory)
+        if not args.keep and not args.work_path:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'code_version': get_code_version(),
+        'python_version': platform.python_version(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'parameters': {'files': args.files, 'messages': args.messages, 'voicemails': args.voicemails, 'seed': args.seed},
+        'stages': stages
+    }
+    with open(output_path, 'w') as file_pointer:
+        json.dump(results, file_pointer, indent=4)
+    print(f"Benchmark results written to '{output_path}'")
+
+
+if __name__ == '__main__':
+    main()
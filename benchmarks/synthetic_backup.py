@@ -0,0 +1,210 @@
+import datetime
+import hashlib
+import os
+import plistlib
+import random
+import sqlite3
+import Constants
+
+"""
+.. module:: synthetic_backup.py
+   :synopsis: Generate synthetic iPhone backups of a configurable size (no real evidence needed for benchmarking)
+"""
+
+SYNTHETIC_BACKUP_DATE = datetime.datetime(2020, 1, 1)
+"""
+Backup date written into the synthetic plists (fixed so generated backups are reproducible)
+"""
+SYNTHETIC_FILE_HEADERS = [
+    ('jpg', b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'),
+    ('plist', b'bplist00'),
+    ('', b'SQLite format 3\x00'),
+    ('heic', b'\x00\x00\x00\x18ftypheic'),
+    ('txt', b'synthetic text file ')
+]
+"""
+Extension and file header of the synthetic content files (cycled through)
+"""
+SYNTHETIC_DOMAINS = ['HomeDomain', 'MediaDomain', 'CameraRollDomain', 'AppDomain-net.whatsapp.WhatsApp',
+                     'AppDomain-com.burbn.instagram', 'AppDomainGroup-group.com.apple.notes', 'SystemPreferencesDomain']
+"""
+Domains the synthetic content files are spread over
+"""
+
+
+def get_file_ID(domain, relative_path):
+    """
+    Return the fileID of a file the way iOS backups derive it (sha1 of 'domain-relativePath')
+    :param domain: IOS domain of the file
+    :param relative_path: Relative path of the file within the domain
+    :return: Hex fileID
+    """
+    return hashlib.sha1(f"{domain}-{relative_path}".encode('utf-8')).hexdigest()
+
+
+def create_mbfile_blob(size, timestamp, inode_number):
+    """
+    Create a manifest.db file blob (NSKeyedArchiver MBFile plist) like the ones iOS writes
+    :param size: File size in bytes
+    :param timestamp: Unix timestamp used for the modification, status change and birth times
+    :param inode_number: Inode number of the file
+    :return: Binary plist blob
+    """
+    return plistlib.dumps({
+        '$version': 100000,
+        '$archiver': 'NSKeyedArchiver',
+        '$top': {'root': plistlib.UID(1)},
+        '$objects': [
+            '$null',
+            {
+                '$class': plistlib.UID(3), 'Size': size, 'Mode': 33188, 'InodeNumber': inode_number, 'UserID': 501, 'GroupID': 501,
+                'LastModified': timestamp, 'LastStatusChange': timestamp, 'Birth': timestamp, 'ProtectionClass': 3, 'Flags': 0,
+                'RelativePath': plistlib.UID(2)
+            },
+            'relative path',
+            {'$classname': 'MBFile', '$classes': ['MBFile', 'NSObject']}
+        ]
+    }, fmt=plistlib.FMT_BINARY)
+
+
+def write_plist_files(backup_path):
+    """
+    Write synthetic Info.plist, Manifest.plist and Status.plist files with every key iminer reads
+    :param backup_path: Backup directory
+    """
+    info_plist = {
+        'Applications': {'com.apple.Maps': {}, 'net.whatsapp.WhatsApp': {}},
+        'Installed Applications': ['net.whatsapp.WhatsApp', 'uk.co.bbc.news', 'com.burbn.instagram'],
+        'Build Version': '17A577', 'Device Name': 'Synthetic iPhone', 'Display Name': 'Synthetic iPhone',
+        'GUID': '00000000000000000000000000000000', 'ICCID': '89440000000000000000', 'IMEI': '350000000000000',
+        'Last Backup Date': SYNTHETIC_BACKUP_DATE, 'Phone Number': '+44 7000 000000', 'Product Name': 'iPhone 8',
+        'Product Type': 'iPhone10,1', 'Product Version': '13.1', 'Serial Number': 'SYNTHETIC0000',
+        'Target Identifier': 'synthetic', 'Target Type': 'Device', 'Unique Identifier': 'SYNTHETIC-UDID',
+        'iTunes Files': {}, 'iTunes Settings': {}, 'iTunes Version': '12.10'
+    }
+    manifest_plist = {
+        'BackupKeyBag': b'synthetic', 'Version': '10.0', 'Date': SYNTHETIC_BACKUP_DATE, 'SystemDomainsVersion': '24.0',
+        'WasPasscodeSet': True, 'Lockdown': {'DeviceName': 'Synthetic iPhone'}, 'Applications': {}, 'IsEncrypted': False
+    }
+    status_plist = {
+        'IsFullBackup': False, 'Version': '3.3', 'UUID': 'SYNTHETIC-BACKUP-UUID', 'Date': SYNTHETIC_BACKUP_DATE,
+        'BackupState': 'new', 'SnapshotState': 'finished'
+    }
+    for file_name, plist in ((Constants.PLIST_FILE_INFO_NAME, info_plist),
+                             (Constants.PLIST_FILE_MANIFEST_NAME, manifest_plist),
+                             (Constants.PLIST_FILE_STATUS_NAME, status_plist)):
+        with open(os.path.join(backup_path, file_name), 'wb') as file_pointer:
+            plistlib.dump(plist, file_pointer)
+
+
+def get_content_file_path(backup_path, file_ID):
+    """
+    Return the shard directory path of a content file, creating the shard directory if needed
+    :param backup_path: Backup directory
+    :param file_ID: FileID of the file
+    :return: Absolute path of the content file
+    """
+    shard_directory = os.path.join(backup_path, file_ID[:2])
+    os.makedirs(shard_directory, exist_ok=True)
+    return os.path.join(shard_directory, file_ID)
+
+
+def write_sms_database(database_path, message_count, random_generator):
+    """
+    Write a synthetic sms.db with message_count messages
+    :param database_path: Path of the database file
+    :param message_count: Number of messages
+    :param random_generator: Random generator
+    """
+    words = ['meeting', 'tomorrow', 'call', 'me', 'when', 'you', 'are', 'free', "don't", 'forget', 'the', 'keys', 'ok', 'thanks']
+    database_connection = sqlite3.connect(database_path)
+    database_connection.execute('''CREATE TABLE message (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT UNIQUE NOT NULL, text TEXT,
+        handle_id INTEGER DEFAULT 0, service TEXT, date INTEGER, date_read INTEGER, date_delivered INTEGER, is_delivered INTEGER DEFAULT 0,
+        is_from_me INTEGER DEFAULT 0, is_read INTEGER DEFAULT 0, cache_has_attachments INTEGER DEFAULT 0)''')
+    database_connection.executemany(
+        'INSERT INTO message (guid, text, handle_id, service, date, date_read, date_delivered, is_delivered, is_from_me, is_read) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+            (f"SYNTHETIC-{message_index}", ' '.join(random_generator.choices(words, k=random_generator.randint(3, 20))),
+             random_generator.randint(1, 200), 'iMessage', 600000000000000000 + message_index, 0, 0, 1, message_index % 2, 1)
+            for message_index in range(message_count)
+        )
+    )
+    database_connection.commit()
+    database_connection.close()
+
+
+def write_voicemail_database(database_path, voicemail_count):
+    """
+    Write a synthetic voicemail.db with voicemail_count voicemails
+    :param database_path: Path of the database file
+    :param voicemail_count: Number of voicemails
+    """
+    database_connection = sqlite3.connect(database_path)
+    database_connection.execute('''CREATE TABLE voicemail (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, remote_uid INTEGER, date INTEGER,
+        token TEXT, sender TEXT, callback_num TEXT, duration INTEGER, expiration INTEGER, trashed_date INTEGER, flags INTEGER)''')
+    database_connection.executemany(
+        'INSERT INTO voicemail (remote_uid, date, token, sender, callback_num, duration, expiration, trashed_date, flags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((voicemail_index, 1577836800 + voicemail_index, 'Complete', '+447000000000', '+447000000000', 30, 0, 0, 3)
+         for voicemail_index in range(voicemail_count))
+    )
+    database_connection.commit()
+    database_connection.close()
+
+
+def write_paired_devices_database(database_path):
+    """
+    Write a synthetic paired bluetooth devices database
+    :param database_path: Path of the database file
+    """
+    database_connection = sqlite3.connect(database_path)
+    database_connection.execute('CREATE TABLE PairedDevices (Uuid TEXT PRIMARY KEY, Name TEXT, Address TEXT, ResolvedAddress TEXT, LastSeenTime INTEGER)')
+    database_connection.execute("INSERT INTO PairedDevices VALUES ('00000000-0000-0000-0000-000000000000', 'Synthetic Headphones', 'Public 00:00:00:00:00:00', '', 1577836800)")
+    database_connection.commit()
+    database_connection.close()
+
+
+def create_synthetic_backup(backup_path, file_count, message_count, voicemail_count=100, seed=0):
+    """
+    Create a synthetic iPhone backup: Info/Manifest/Status plists, a Manifest.db with file_count rows and their shard
+    directory content files, and sms.db, voicemail.db and paired devices databases referenced from the manifest.
+    :param backup_path: Backup directory to create (must not exist or be empty)
+    :param file_count: Number of content files (on top of the artifact databases)
+    :param message_count: Number of sms.db messages
+    :param voicemail_count: Number of voicemail.db voicemails
+    :param seed: Random seed (the same arguments and seed always give the same backup)
+    :return: Backup path
+    """
+    random_generator = random.Random(seed)
+    os.makedirs(backup_path, exist_ok=True)
+    write_plist_files(backup_path)
+
+    manifest_rows = []
+    artifact_databases = [
+        ('HomeDomain', Constants.SMS_MESSAGE_INFORMATION_DB_PATH, lambda path: write_sms_database(path, message_count, random_generator)),
+        ('HomeDomain', Constants.VOICEMAIL_INFORMATION_DB_PATH, lambda path: write_voicemail_database(path, voicemail_count)),
+        ('SysSharedContainerDomain-systemgroup.com.apple.bluetooth', Constants.PAIRED_BLUETOOTH_DEVICES_DB_PATH, write_paired_devices_database)
+    ]
+    for domain, relative_path, write_database in artifact_databases:
+        file_ID = get_file_ID(domain, relative_path)
+        content_file_path = get_content_file_path(backup_path, file_ID)
+        write_database(content_file_path)
+        manifest_rows.append((file_ID, domain, relative_path, 1, create_mbfile_blob(os.path.getsize(content_file_path), 1577836800, len(manifest_rows))))
+
+    for file_index in range(file_count):
+        extension, file_header = SYNTHETIC_FILE_HEADERS[file_index % len(SYNTHETIC_FILE_HEADERS)]
+        domain = SYNTHETIC_DOMAINS[file_index % len(SYNTHETIC_DOMAINS)]
+        relative_path = f"Library/Synthetic/{file_index % 97}/file_{file_index}{'.' + extension if extension else ''}"
+        file_ID = get_file_ID(domain, relative_path)
+        file_contents = file_header + random_generator.randbytes(random_generator.randint(0, 4096))
+
+        with open(get_content_file_path(backup_path, file_ID), 'wb') as file_pointer:
+            file_pointer.write(file_contents)
+        manifest_rows.append((file_ID, domain, relative_path, 1, create_mbfile_blob(len(file_contents), 1577836800 + file_index, len(manifest_rows))))
+
+    manifest_connection = sqlite3.connect(os.path.join(backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME))
+    manifest_connection.execute(f'''CREATE TABLE {Constants.IPHONE_BACKUP_MANIFEST_TABLE_NAME}
+        (fileID TEXT PRIMARY KEY, domain TEXT, relativePath TEXT, flags INTEGER, file BLOB)''')
+    manifest_connection.executemany(f"INSERT INTO {Constants.IPHONE_BACKUP_MANIFEST_TABLE_NAME} VALUES (?, ?, ?, ?, ?)", manifest_rows)
+    manifest_connection.commit()
+    manifest_connection.close()
+    return backup_path
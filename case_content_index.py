@@ -0,0 +1,233 @@
+import Constants
+import contextlib
+import json
+import os
+import sqlite3
+
+
+class CaseContentIndex:
+    """
+    Case Content Index class.
+    Case level content addressed store shared by every backup of a case: maps each content hash (sha256) to every
+    (backup, domain, relative path) it occurs at, and keeps the analysis results of each unique content once,
+    so duplicate files (system frameworks, shared app data...) are only analysed the first time their content is seen.
+    Contents are never hashed for the case, only verified content hashes (file_SHA256) are recorded and used to reuse analysis results.
+    Files matching an earlier backup of the case on domain, relative path and manifest metadata (size, timestamps and inode) only get a presumed content hash.
+    """
+    def __init__(self, case_database_path=Constants.DEFAULT_CASE_DATABASE_PATH):
+        """
+        Initialization method, open (or create) the case database.
+        :param case_database_path: Path of the case database file, shared by every backup of the case.
+        """
+        self.case_database_path = case_database_path
+        self.contents_table_name = Constants.CASE_CONTENTS_TABLE_NAME
+        self.occurrences_table_name = Constants.CASE_CONTENT_OCCURRENCES_TABLE_NAME
+        self.exports_table_name = Constants.CASE_CONTENT_EXPORTS_TABLE_NAME
+        self.artifact_chunks_table_name = Constants.CASE_ARTIFACT_CHUNKS_TABLE_NAME
+        self.case_database_connection = self.connect_case_database()
+        self.case_database_cursor = self.case_database_connection.cursor()
+
+        self.initialize_case_database()
+
+    def connect_case_database(self):
+        """
+        Open a new connection to the case database (artifact extractor threads use their own connections).
+        :rtype: sqlite3.Connection
+        """
+        # Several backups can be processed in parallel against the same case database
+        return sqlite3.connect(self.case_database_path, timeout=Constants.DEFAULT_CASE_DATABASE_TIMEOUT, uri=True)
+
+    def initialize_case_database(self):
+        """
+        Create the case tables and indexes if they do not exist yet.
+        """
+        sql_command = f"""CREATE TABLE IF NOT EXISTS {self.contents_table_name}
+            (sha256 TEXT PRIMARY KEY, file_Size INTEGER, file_Signature TEXT, backup_ID TEXT, absolute_Path TEXT)"""
+        self.case_database_cursor.execute(sql_command)
+        metadata_column_definitions = ''.join(f", {column} INTEGER" for column in Constants.CASE_CONTENT_METADATA_COLUMNS)
+        sql_command = f"""CREATE TABLE IF NOT EXISTS {self.occurrences_table_name}
+            (backup_ID TEXT, file_ID TEXT, sha256 TEXT, domain TEXT, relative_Path TEXT{metadata_column_definitions}, PRIMARY KEY (backup_ID, file_ID)) WITHOUT ROWID"""
+        self.case_database_cursor.execute(sql_command)
+
+        sql_command = f"CREATE INDEX IF NOT EXISTS {self.occurrences_table_name}_sha256_index ON {self.occurrences_table_name} (sha256)"
+        self.case_database_cursor.execute(sql_command)
+        sql_command = f"CREATE INDEX IF NOT EXISTS {self.occurrences_table_name}_path_index ON {self.occurrences_table_name} (relative_Path, domain)"
+        self.case_database_cursor.execute(sql_command)
+        sql_command = f"""CREATE TABLE IF NOT EXISTS {self.exports_table_name}
+            (sha256 TEXT, file_Last_Modified INTEGER, export_Path TEXT, PRIMARY KEY (sha256, file_Last_Modified)) WITHOUT ROWID"""
+        self.case_database_cursor.execute(sql_command)
+        sql_command = f"""CREATE TABLE IF NOT EXISTS {self.artifact_chunks_table_name}
+            (sha256 TEXT, table_Name TEXT, chunk_Index INTEGER, column_Names TEXT, rows BLOB, PRIMARY KEY (sha256, table_Name, chunk_Index)) WITHOUT ROWID"""
+        self.case_database_cursor.execute(sql_command)
+        self.case_database_connection.commit()
+
+    def get_content_signatures(self, sha256_digests):
+        """
+        Get the detected file type of contents already analysed in the case.
+        :param sha256_digests: Content sha256 hex digests (looked up in batches of Constants.SQL_MAX_VARIABLE_NUMBER digests).
+        :rtype: Dictionary
+        :return: sha256 digest to file signature for every analysed content.
+        """
+        sha256_digests = list(set(sha256_digests))
+        content_signatures = {}
+        for batch_start in range(0, len(sha256_digests), Constants.SQL_MAX_VARIABLE_NUMBER):
+            digest_batch = sha256_digests[batch_start:batch_start + Constants.SQL_MAX_VARIABLE_NUMBER]
+            sql_command = f"""SELECT sha256, file_Signature FROM {self.contents_table_name}
+                WHERE file_Signature IS NOT NULL AND sha256 IN ({', '.join('?' * len(digest_batch))})"""
+            content_signatures.update(self.case_database_cursor.execute(sql_command, digest_batch))
+        return content_signatures
+
+    def fill_presumed_content_hashes(self, database_handle):
+        """
+        Set the presumed content hash (Constants.FILE_PRESUMED_SHA256_COLUMN) of every present file of a backup file table that is recorded in the case
+        with the same domain, relative path and manifest metadata (Constants.CASE_CONTENT_METADATA_COLUMNS), without reading the file.
+        The manifest metadata can be unchanged while the content is not, so presumed hashes are never used to reuse analysis results.
+        :param database_handle: IphoneFileDatabase holding the (decoded) file table of the backup.
+        :return: Number of files whose content hash was presumed from the case.
+        """
+        table_name = database_handle.file_database_table_name
+        presumed_sha256_column = Constants.FILE_PRESUMED_SHA256_COLUMN
+        match_condition = ' AND '.join(
+            f"occurrences.{column} = {table_name}.{column}" for column in ['relative_Path', 'domain', *Constants.CASE_CONTENT_METADATA_COLUMNS]
+        )
+        database_handle.commit_database_changes()
+        self.case_database_cursor.execute("ATTACH DATABASE ? AS backup", (database_handle.file_database_file_path,))
+        try:
+            sql_command = f"""UPDATE backup.{table_name}
+                SET {presumed_sha256_column} = (SELECT occurrences.sha256 FROM main.{self.occurrences_table_name} AS occurrences WHERE {match_condition} LIMIT 1)
+                WHERE {presumed_sha256_column} IS NULL AND {Constants.CASE_CONTENT_METADATA_COLUMNS[0]} IS NOT NULL AND absolute_Path IS NOT NULL AND absolute_Path != ''
+                AND EXISTS (SELECT 1 FROM main.{self.occurrences_table_name} AS occurrences WHERE {match_condition})"""
+            presumed_content_count = self.case_database_cursor.execute(sql_command).rowcount
+            self.case_database_connection.commit()
+        except:
+            self.case_database_connection.rollback()
+            raise
+        finally:
+            self.case_database_cursor.execute("DETACH DATABASE backup")
+
+        return presumed_content_count
+
+    def register_backup_contents(self, database_handle, backup_id):
+        """
+        Record every hashed file of a backup file table in the case (replacing what was recorded for the backup before).
+        Contents not seen in the case yet are added with their analysis results, copied across inside SQLite.
+        :param database_handle: IphoneFileDatabase holding the (hashed and classified) file table of the backup.
+        :param backup_id: Id of the backup (IPhoneParser.id).
+        :rtype: Dictionary
+        :return: Registration statistics (hashed files of the backup, contents new to the case and files left out as they have no content hash).
+        """
+        table_name = database_handle.file_database_table_name
+        sha256_column = Constants.FILE_HASH_COLUMNS['sha256']
+        metadata_columns = ', '.join(Constants.CASE_CONTENT_METADATA_COLUMNS)
+        database_handle.commit_database_changes()
+        self.case_database_cursor.execute("ATTACH DATABASE ? AS backup", (database_handle.file_database_file_path,))
+        try:
+            self.case_database_cursor.execute("BEGIN IMMEDIATE")
+            self.case_database_cursor.execute(f"DELETE FROM {self.occurrences_table_name} WHERE backup_ID = ?", (backup_id,))
+            sql_command = f"""INSERT INTO {self.occurrences_table_name} (backup_ID, file_ID, sha256, domain, relative_Path, {metadata_columns})
+                SELECT ?, file_ID, {sha256_column}, domain, relative_Path, {metadata_columns} FROM backup.{table_name} WHERE {sha256_column} IS NOT NULL"""
+            occurrence_count = self.case_database_cursor.execute(sql_command, (backup_id,)).rowcount
+
+            sql_command = f"""INSERT OR IGNORE INTO {self.contents_table_name} (sha256, file_Size, file_Signature, backup_ID, absolute_Path)
+                SELECT {sha256_column}, file_Size, file_Signature, ?, absolute_Path FROM backup.{table_name}
+                WHERE {sha256_column} IS NOT NULL GROUP BY {sha256_column}"""
+            new_content_count = self.case_database_cursor.execute(sql_command, (backup_id,)).rowcount
+
+            sql_command = f"""SELECT COUNT(*) FROM backup.{table_name}
+                WHERE {sha256_column} IS NULL AND absolute_Path IS NOT NULL AND absolute_Path != ''"""
+            unhashed_file_count, = self.case_database_cursor.execute(sql_command).fetchone()
+            self.case_database_connection.commit()
+        except:
+            self.case_database_connection.rollback()
+            raise
+        finally:
+            self.case_database_cursor.execute("DETACH DATABASE backup")
+
+        return {'occurrences': occurrence_count, 'new_contents': new_content_count, 'unhashed': unhashed_file_count}
+
+    def get_content_occurrences(self, sha256_digest):
+        """
+        Get every place a content occurs at across the backups of the case.
+        :param sha256_digest: Content sha256 hex digest.
+        :return: List of (backup_ID, file_ID, domain, relative_Path) tuples.
+        """
+        sql_command = f"SELECT backup_ID, file_ID, domain, relative_Path FROM {self.occurrences_table_name} WHERE sha256 = ?"
+        return self.case_database_cursor.execute(sql_command, (sha256_digest,)).fetchall()
+
+    def get_exported_contents(self, content_keys):
+        """
+        Get the export paths of contents already exported from a backup of the case (see record_exported_contents).
+        :param content_keys: (sha256, last modified) tuples (looked up in batches binding at most Constants.SQL_MAX_VARIABLE_NUMBER values).
+        :rtype: Dictionary
+        :return: (sha256, last modified) to absolute export path for every recorded content.
+        """
+        content_keys = list(set(content_keys))
+        batch_size = Constants.SQL_MAX_VARIABLE_NUMBER // 2
+        exported_contents = {}
+        for batch_start in range(0, len(content_keys), batch_size):
+            key_batch = content_keys[batch_start:batch_start + batch_size]
+            sql_command = f"""SELECT sha256, file_Last_Modified, export_Path FROM {self.exports_table_name}
+                WHERE (sha256, file_Last_Modified) IN (VALUES {', '.join(['(?, ?)'] * len(key_batch))})"""
+            rows = self.case_database_cursor.execute(sql_command, [value for content_key in key_batch for value in content_key])
+            exported_contents.update(((sha256, last_modified), export_path) for sha256, last_modified, export_path in rows)
+        return exported_contents
+
+    def record_exported_contents(self, exported_contents):
+        """
+        Record where contents were exported to, so exports of later backups can link to the copies instead of copying them again.
+        :param exported_contents: Iterable of (sha256, last modified, export path) tuples.
+        """
+        sql_command = f"INSERT OR REPLACE INTO {self.exports_table_name} (sha256, file_Last_Modified, export_Path) VALUES (?, ?, ?)"
+        self.case_database_cursor.executemany(sql_command, (
+            (sha256, last_modified, os.path.abspath(export_path)) for sha256, last_modified, export_path in exported_contents
+        ))
+        self.case_database_connection.commit()
+
+    def iterate_artifact_chunks(self, sha256_digest, table_name):
+        """
+        Yield the rows of a backup database table already extracted from the same database content in the case (see store_artifact_chunks), one chunk at a time.
+        Can be called from any thread, each call reads through its own connection.
+        :param sha256_digest: Content sha256 hex digest of the database file.
+        :param table_name: Extracted table name.
+        :return: Generator of (column names, row chunk encoded by iPhone_file_database.encode_row_chunk) tuples (nothing if the table has not been extracted in the case).
+        """
+        sql_command = f"""SELECT column_Names, rows FROM {self.artifact_chunks_table_name}
+            WHERE sha256 = ? AND table_Name = ? ORDER BY chunk_Index"""
+        with contextlib.closing(self.connect_case_database()) as case_database_connection:
+            for column_names, chunk_rows in case_database_connection.execute(sql_command, (sha256_digest, table_name)):
+                yield tuple(json.loads(column_names)), chunk_rows
+
+    def store_artifact_chunks(self, sha256_digest, table_name, column_names, encoded_chunks):
+        """
+        Record the extracted rows of a backup database table for its database content.
+        Can be called from any thread, each call writes through its own connection.
+        :param sha256_digest: Content sha256 hex digest of the database file.
+        :param table_name: Extracted table name.
+        :param column_names: Column names of the rows.
+        :param encoded_chunks: Iterable of JSON encoded row chunks (see iPhone_file_database.ChunkedTableRows.iterate_encoded_chunks), never pickled as the case database is shared.
+        """
+        sql_command = f"""INSERT OR IGNORE INTO {self.artifact_chunks_table_name} (sha256, table_Name, chunk_Index, column_Names, rows)
+            VALUES (?, ?, ?, ?, ?)"""
+        encoded_column_names = json.dumps(list(column_names))
+        with contextlib.closing(self.connect_case_database()) as case_database_connection:
+            with case_database_connection:
+                case_database_connection.executemany(sql_command, (
+                    (sha256_digest, table_name, chunk_index, encoded_column_names, chunk_rows) for chunk_index, chunk_rows in enumerate(encoded_chunks)
+                ))
+
+    def get_case_statistics(self):
+        """
+        Count the files, unique contents and duplicated contents recorded in the case.
+        :rtype: Dictionary
+        """
+        occurrence_count, = self.case_database_cursor.execute(f"SELECT COUNT(*) FROM {self.occurrences_table_name}").fetchone()
+        content_count, = self.case_database_cursor.execute(f"SELECT COUNT(*) FROM {self.contents_table_name}").fetchone()
+        sql_command = f"SELECT COUNT(*) FROM (SELECT 1 FROM {self.occurrences_table_name} GROUP BY sha256 HAVING COUNT(*) > 1)"
+        duplicated_content_count, = self.case_database_cursor.execute(sql_command).fetchone()
+        return {'occurrences': occurrence_count, 'contents': content_count, 'duplicated_contents': duplicated_content_count}
+
+    def close(self):
+        """
+        Close the case database.
+        """
+        self.case_database_connection.close()
@@ -0,0 +1,106 @@
+import Constants
+import concurrent.futures
+import hashlib
+import mmap
+import os
+
+
+def hash_file(file_path, algorithms=Constants.DEFAULT_HASH_ALGORITHMS):
+    """
+    Hash the contents of a file with every given algorithm in a single pass over the file.
+    Large files are read through a read only memory map, smaller ones with large buffered reads.
+    :param file_path: Path of the file to hash.
+    :param algorithms: Hashlib algorithm names (e.g. sha256, md5, sha1).
+    :rtype: Dictionary
+    :return: Algorithm name to hex digest.
+    """
+    file_hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(file_path, 'rb') as file_pointer:
+        file_size = os.fstat(file_pointer.fileno()).st_size
+        if file_size >= Constants.DEFAULT_HASH_MMAP_THRESHOLD:
+            with mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                for file_hash in file_hashes.values():
+                    file_hash.update(file_map)
+        else:
+            read_buffer = bytearray(Constants.DEFAULT_HASH_READ_SIZE)
+            read_view = memoryview(read_buffer)
+            while True:
+                read_size = file_pointer.readinto(read_buffer)
+                if not read_size:
+                    break
+                for file_hash in file_hashes.values():
+                    file_hash.update(read_view[:read_size])
+
+    return {algorithm: file_hash.hexdigest() for algorithm, file_hash in file_hashes.items()}
+
+
+def hash_file_database_contents(database_handle, backup_shard_index, algorithms=Constants.DEFAULT_HASH_ALGORITHMS,
+                                max_workers=Constants.DEFAULT_HASH_WORKERS, page_size=Constants.DEFAULT_SQL_FETCH_SIZE, cached_only=False, file_IDs=None):
+    """
+    Hash every resolved file of the file table and store the digests in the file table hash columns.
+    Digests are cached on (absolute path, size, modification time), so re-runs only hash files that changed.
+    :param database_handle: IphoneFileDatabase holding the file table.
+    :param backup_shard_index: BackupShardIndex of the backup (provides the size and modification time of every file).
+    :param algorithms: Hashlib algorithm names to compute (keys of Constants.FILE_HASH_COLUMNS).
+    :param max_workers: Number of hashing threads.
+    :param page_size: Number of file rows handled at once.
+    :param cached_only: Only fill in digests found in the hash cache, files that are not cached are not read.
+    :param file_IDs: Only hash the files with these fileIDs (every resolved file when None, at most Constants.SQL_MAX_VARIABLE_NUMBER - 2 fileIDs).
+    :rtype: Dictionary
+    :return: Hash statistics (files hashed, files served from the cache, files that failed to hash).
+    """
+    file_ID_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]
+    absolute_path_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[4]
+    hash_columns = [Constants.FILE_HASH_COLUMNS[algorithm] for algorithm in algorithms]
+    statistics = {'hashed': 0, 'cached': 0, 'failed': 0}
+
+    condition = f"{absolute_path_column} IS NOT NULL AND {absolute_path_column} != ''"
+    if cached_only:
+        condition += f" AND ({' OR '.join(f'{hash_column} IS NULL' for hash_column in hash_columns)})"
+    parameters = ()
+    if file_IDs is not None:
+        parameters = tuple(file_IDs)
+        condition += f" AND {file_ID_column} IN ({', '.join('?' * len(parameters))})"
+    pages = database_handle.iterate_file_table_pages([file_ID_column, absolute_path_column, *hash_columns], condition, page_size, parameters)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in pages:
+            hash_cache_entries = database_handle.get_hash_cache_entries(row[1] for row in page)
+            updated_rows = []
+            files_to_hash = []
+
+            for file_ID, absolute_path, *stored_hashes in page:
+                file_stat = backup_shard_index.get_file_stat(file_ID)
+                if file_stat is None:
+                    continue
+
+                hash_cache_entry = hash_cache_entries.get(absolute_path)
+                if hash_cache_entry is not None and hash_cache_entry[:2] == file_stat \
+                        and all(hash_cache_entry[2][algorithm] is not None for algorithm in algorithms):
+                    statistics['cached'] += 1
+                    cached_hashes = [hash_cache_entry[2][algorithm] for algorithm in algorithms]
+                    if cached_hashes != stored_hashes:
+                        updated_rows.append((*cached_hashes, file_ID))
+                elif not cached_only:
+                    files_to_hash.append((file_ID, absolute_path, file_stat))
+
+            hash_cache_rows = []
+            file_hash_futures = [executor.submit(hash_file, absolute_path, algorithms) for file_ID, absolute_path, file_stat in files_to_hash]
+            for (file_ID, absolute_path, file_stat), file_hash_future in zip(files_to_hash, file_hash_futures):
+                try:
+                    file_hashes = file_hash_future.result()
+                except OSError:
+                    statistics['failed'] += 1
+                    continue
+
+                statistics['hashed'] += 1
+                # Keep digests of other algorithms already cached for the same file version
+                hash_cache_entry = hash_cache_entries.get(absolute_path)
+                if hash_cache_entry is not None and hash_cache_entry[:2] == file_stat:
+                    file_hashes = {**hash_cache_entry[2], **file_hashes}
+                hash_cache_rows.append((absolute_path, *file_stat, file_hashes))
+                updated_rows.append((*(file_hashes[algorithm] for algorithm in algorithms), file_ID))
+
+            database_handle.update_hash_cache(hash_cache_rows)
+            database_handle.update_file_table_rows(hash_columns, updated_rows)
+
+    return statistics
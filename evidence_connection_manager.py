@@ -0,0 +1,70 @@
+import Constants
+import os
+import pathlib
+import sqlite3
+import threading
+
+
+class EvidenceConnectionManager:
+    """
+    Evidence Connection Manager class.
+    Opens the sqlite databases of an iphone backup (manifest.db, sms.db...) read only and immutable, so the evidence
+    is never written to or locked, with memory mapped page reads and a larger page cache.
+    Connections are reused, one per database file shared by every thread (the connections are read only), so repeated
+    artifact queries do not reconnect and per run worker threads do not leave connections behind.
+    """
+    def __init__(self, mmap_size=Constants.DEFAULT_SQL_EVIDENCE_MMAP_SIZE, cache_size=Constants.DEFAULT_SQL_EVIDENCE_CACHE_SIZE):
+        """
+        Initialization method.
+        :param mmap_size: Bytes of each database file to memory map (PRAGMA mmap_size).
+        :param cache_size: Page cache size per connection in KiB (PRAGMA cache_size).
+        """
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.connections = {}
+        self.connections_lock = threading.Lock()
+
+    @staticmethod
+    def get_database_uri(db_file_path):
+        """
+        Get the read only, immutable sqlite URI of a database file.
+        :param db_file_path: Path of the database file.
+        :return: URI string (usable with sqlite3.connect(..., uri=True) and ATTACH DATABASE on URI enabled connections).
+        """
+        return f"{pathlib.Path(os.path.abspath(db_file_path)).as_uri()}?mode=ro&immutable=1"
+
+    def connect(self, db_file_path):
+        """
+        Open a new read only connection to a database file with the evidence pragmas applied.
+        :param db_file_path: Path of the database file.
+        :rtype: sqlite3.Connection
+        """
+        db_database_connection = sqlite3.connect(self.get_database_uri(db_file_path), uri=True, check_same_thread=False)
+        db_database_connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        db_database_connection.execute(f"PRAGMA cache_size = {-int(self.cache_size)}")
+        db_database_connection.execute("PRAGMA query_only = 1")
+        return db_database_connection
+
+    def get_connection(self, db_file_path):
+        """
+        Get the connection to a database file, opening it on first use (any thread can use it, each through its own cursors).
+        :param db_file_path: Path of the database file.
+        :rtype: sqlite3.Connection
+        """
+        connection_key = os.path.abspath(db_file_path)
+        with self.connections_lock:
+            db_database_connection = self.connections.get(connection_key)
+            if db_database_connection is None:
+                db_database_connection = self.connect(db_file_path)
+                self.connections[connection_key] = db_database_connection
+        return db_database_connection
+
+    def close_connections(self):
+        """
+        Close every connection opened by the manager.
+        """
+        with self.connections_lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+        for db_database_connection in connections:
+            db_database_connection.close()
@@ -0,0 +1,199 @@
+import Constants
+import concurrent.futures
+import os
+import shutil
+
+
+def get_export_path(output_directory, domain, relative_path):
+    """
+    Get the path a backup file is exported to (output_directory/domain/relative_Path).
+    Paths that would escape the output directory (absolute paths, '..' components...) are refused.
+    :param output_directory: Export root directory.
+    :param domain: IOS domain of the file.
+    :param relative_path: Relative path of the file within the domain.
+    :return: Export path or None if the domain or relative path is not safe to recreate.
+    """
+    path_components = [domain or '', *(relative_path or '').split('/')]
+    path_components = [path_component for path_component in path_components if path_component not in ('', '.')]
+    for path_component in path_components:
+        if path_component == '..' or os.sep in path_component or (os.altsep and os.altsep in path_component) \
+                or os.path.splitdrive(path_component)[0]:
+            return None
+    if len(path_components) < 2:
+        return None
+    return os.path.join(output_directory, *path_components)
+
+
+def copy_file_contents(source_path, destination_path):
+    """
+    Copy a file, letting the kernel move the data where possible: os.copy_file_range (can reflink or copy server side),
+    then os.sendfile, then a plain buffered copy.
+    :param source_path: Path of the file to copy.
+    :param destination_path: Path of the copy (overwritten if it exists).
+    :return: Number of bytes copied.
+    """
+    with open(source_path, 'rb') as source_file, open(destination_path, 'wb') as destination_file:
+        file_size = os.fstat(source_file.fileno()).st_size
+        for kernel_copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if kernel_copy is None:
+                continue
+            try:
+                copied_byte_count = 0
+                while copied_byte_count < file_size:
+                    if kernel_copy is os.sendfile:
+                        byte_count = os.sendfile(destination_file.fileno(), source_file.fileno(), copied_byte_count, file_size - copied_byte_count)
+                    else:
+                        byte_count = os.copy_file_range(source_file.fileno(), destination_file.fileno(), file_size - copied_byte_count,
+                                                        copied_byte_count, copied_byte_count)
+                    if byte_count == 0:
+                        break
+                    copied_byte_count += byte_count
+                if copied_byte_count == file_size:
+                    return copied_byte_count
+            except OSError:
+                pass
+            # Not supported for this file system or file pair, start again with the next method
+            destination_file.seek(0)
+            destination_file.truncate()
+
+        source_file.seek(0)
+        shutil.copyfileobj(source_file, destination_file, Constants.DEFAULT_EXPORT_COPY_BUFFER_SIZE)
+        return destination_file.tell()
+
+
+def export_file(source_path, destination_path, last_modified):
+    """
+    Export a single backup file, creating its parent directories and setting its modification time.
+    :param source_path: Path of the content file within the backup.
+    :param destination_path: Export path.
+    :param last_modified: Modification time (unix time) decoded from the manifest, None keeps the backup file's own modification time.
+    :return: Number of bytes copied.
+    """
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    byte_count = copy_file_contents(source_path, destination_path)
+    if last_modified is None:
+        last_modified = os.stat(source_path).st_mtime
+    os.utime(destination_path, (last_modified, last_modified))
+    return byte_count
+
+
+def link_duplicate_file(exported_path, destination_path):
+    """
+    Export a duplicate file as a hard link to an already exported copy of the same content (copied if linking is not possible).
+    :param exported_path: Path of the exported copy.
+    :param destination_path: Export path of the duplicate.
+    :return: Number of bytes copied (0 when linked).
+    """
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(exported_path, destination_path)
+        return 0
+    except OSError:
+        shutil.copy2(exported_path, destination_path)
+        return os.path.getsize(destination_path)
+
+
+def is_exported_copy_current(export_path, file_size, last_modified):
+    """
+    Check that an earlier exported copy is still in place, unchanged (same size and modification time as the file being exported).
+    :param export_path: Path of the exported copy.
+    :param file_size: Size of the file being exported (decoded from the manifest).
+    :param last_modified: Modification time of the file being exported (decoded from the manifest).
+    :rtype: Bool
+    """
+    try:
+        stat_result = os.stat(export_path)
+    except OSError:
+        return False
+    return stat_result.st_size == file_size and int(stat_result.st_mtime) == last_modified
+
+
+def export_file_database_contents(database_handle, backup_path, output_directory, condition='1', parameters=(),
+                                  max_workers=Constants.DEFAULT_EXPORT_WORKERS, page_size=Constants.DEFAULT_SQL_FETCH_SIZE, link_duplicates=False,
+                                  case_content_index=None):
+    """
+    Export the resolved files of the file table matching a condition into a domain/relative_Path tree, copying with a thread pool.
+    :param database_handle: IphoneFileDatabase holding the file table.
+    :param backup_path: Path to the iphone backup directory (content files are read from its shard directories).
+    :param output_directory: Export root directory.
+    :param condition: SQL condition selecting the rows to export (see IphoneFileDatabase.get_file_filter_condition).
+    :param parameters: Values bound to the condition placeholders.
+    :param max_workers: Number of copying threads.
+    :param page_size: Number of file rows handled at once.
+    :param link_duplicates: Hard link files with the same content (sha256) and modification time to the first exported copy instead of copying them again.
+    :param case_content_index: CaseContentIndex recording the copies exported from every backup of the case, with link_duplicates contents
+        already exported from another backup are linked to that copy (optional).
+    :rtype: Dictionary
+    :return: Export statistics (files copied, files linked, unsafe paths skipped, failed files and bytes copied).
+    """
+    file_ID_column, domain_column, relative_path_column, flags_column, absolute_path_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[:5]
+    statistics = {'copied': 0, 'linked': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    exported_contents = {}
+
+    pages = database_handle.iterate_file_table_pages(
+        [file_ID_column, domain_column, relative_path_column, absolute_path_column, 'file_Size', 'file_Last_Modified', Constants.FILE_HASH_COLUMNS['sha256']],
+        f"{absolute_path_column} IS NOT NULL AND {absolute_path_column} != '' AND ({condition})",
+        page_size,
+        parameters
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in pages:
+            file_copies = []
+            duplicate_files = []
+            case_exported_contents = {}
+            if link_duplicates and case_content_index is not None:
+                case_exported_contents = case_content_index.get_exported_contents(
+                    (row[6], row[5]) for row in page if row[6] is not None and row[5] is not None
+                )
+            for file_ID, domain, relative_path, absolute_path, file_size, last_modified, sha256 in page:
+                destination_path = get_export_path(output_directory, domain, relative_path)
+                if destination_path is None:
+                    print(f"Skipped {domain}/{relative_path}, the path is not safe to recreate")
+                    statistics['skipped'] += 1
+                    continue
+
+                # Read from this backup's shard directory, the stored absolute path is relative to where the backup was indexed from
+                source_path = os.path.join(backup_path, os.path.basename(os.path.dirname(absolute_path)), os.path.basename(absolute_path))
+                content_key = (sha256, last_modified)
+                if link_duplicates and sha256 is not None and content_key not in exported_contents:
+                    case_export_path = case_exported_contents.get(content_key)
+                    if case_export_path is not None and case_export_path != os.path.abspath(destination_path) \
+                            and is_exported_copy_current(case_export_path, file_size, last_modified):
+                        exported_contents[content_key] = case_export_path
+                if link_duplicates and sha256 is not None and content_key in exported_contents:
+                    duplicate_files.append((exported_contents[content_key], destination_path))
+                    continue
+                if link_duplicates and sha256 is not None:
+                    exported_contents[content_key] = destination_path
+                file_copies.append((source_path, destination_path, last_modified, sha256))
+
+            copy_futures = [executor.submit(export_file, *file_copy[:3]) for file_copy in file_copies]
+            failed_paths = set()
+            copied_contents = []
+            for (source_path, destination_path, last_modified, sha256), copy_future in zip(file_copies, copy_futures):
+                try:
+                    statistics['bytes'] += copy_future.result()
+                    statistics['copied'] += 1
+                    if sha256 is not None and last_modified is not None:
+                        copied_contents.append((sha256, last_modified, destination_path))
+                except OSError as error:
+                    print(f"Failed to export {source_path} to {destination_path}: {error}")
+                    statistics['failed'] += 1
+                    failed_paths.add(destination_path)
+            if case_content_index is not None:
+                case_content_index.record_exported_contents(copied_contents)
+
+            # Duplicates are linked once the copies they point to are complete
+            for exported_path, destination_path in duplicate_files:
+                try:
+                    if exported_path in failed_paths:
+                        raise OSError('the first copy of this content failed to export')
+                    statistics['bytes'] += link_duplicate_file(exported_path, destination_path)
+                    statistics['linked'] += 1
+                except OSError as error:
+                    print(f"Failed to export {destination_path}: {error}")
+                    statistics['failed'] += 1
+
+    return statistics
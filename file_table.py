@@ -0,0 +1,276 @@
+import Constants
+import array
+import collections.abc
+import os
+import sys
+
+
+class StringColumn:
+    """
+    String Column class.
+    Stores strings utf-8 encoded back to back in a single buffer with an end offset per row,
+    instead of one python string object per row.
+    """
+    def __init__(self):
+        """
+        Initialization method.
+        """
+        self.data = bytearray()
+        self.ends = array.array('I')
+        self.none_rows = set()
+
+    def append(self, value):
+        """
+        Append a value to the column.
+        :param value: String value (or None).
+        """
+        if value is None:
+            self.none_rows.add(len(self.ends))
+        else:
+            self.data += value.encode('utf-8', 'surrogatepass')
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, row_index):
+        if row_index in self.none_rows:
+            return None
+        start = self.ends[row_index - 1] if row_index > 0 else 0
+        return self.data[start:self.ends[row_index]].decode('utf-8', 'surrogatepass')
+
+    def __len__(self):
+        return len(self.ends)
+
+
+class CategoryColumn:
+    """
+    Category Column class.
+    Stores each distinct value once (strings are interned) and a small integer code per row,
+    for columns with few distinct values such as domains, flags and file types.
+    """
+    def __init__(self):
+        """
+        Initialization method.
+        """
+        self.values = []
+        self.value_codes = {}
+        self.codes = array.array('I')
+
+    def append(self, value):
+        """
+        Append a value to the column.
+        :param value: Hashable value (or None).
+        """
+        code = self.value_codes.get(value)
+        if code is None:
+            code = self.value_codes[value] = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+        self.codes.append(code)
+
+    def __getitem__(self, row_index):
+        return self.values[self.codes[row_index]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class HexColumn:
+    """
+    Hex Column class.
+    Stores fixed length lowercase hex strings (e.g. sha1 fileIDs) as raw bytes, half their encoded length,
+    any other value is kept as is in an overflow dictionary.
+    """
+    def __init__(self, byte_length=Constants.FILE_TABLE_HEX_BYTE_LENGTH):
+        """
+        Initialization method.
+        :param byte_length: Number of bytes per value (hex string length / 2).
+        """
+        self.byte_length = byte_length
+        self.data = bytearray()
+        self.overflow = {}
+
+    def append(self, value):
+        """
+        Append a value to the column.
+        :param value: Hex string value (or any other value, stored uncompressed).
+        """
+        try:
+            raw_value = bytes.fromhex(value)
+        except (TypeError, ValueError):
+            raw_value = None
+        if raw_value is None or len(raw_value) != self.byte_length or raw_value.hex() != value:
+            self.overflow[len(self)] = value
+            raw_value = bytes(self.byte_length)
+        self.data += raw_value
+
+    def __getitem__(self, row_index):
+        if row_index in self.overflow:
+            return self.overflow[row_index]
+        start = row_index * self.byte_length
+        return self.data[start:start + self.byte_length].hex()
+
+    def __len__(self):
+        return len(self.data) // self.byte_length
+
+
+class PathColumn:
+    """
+    Path Column class.
+    Stores paths split into their directory (a category, backup files share their 256 shard directories)
+    and their file name (hex, backup content files are named after their fileID).
+    """
+    def __init__(self):
+        """
+        Initialization method.
+        """
+        self.directories = CategoryColumn()
+        self.file_names = HexColumn()
+
+    def append(self, value):
+        """
+        Append a value to the column.
+        :param value: Path string (or None).
+        """
+        if value is None:
+            self.directories.append(None)
+            self.file_names.append(None)
+            return
+        split_index = max(value.rfind('/'), value.rfind(os.sep)) + 1
+        self.directories.append(value[:split_index])
+        self.file_names.append(value[split_index:])
+
+    def __getitem__(self, row_index):
+        directory = self.directories[row_index]
+        if directory is None:
+            return None
+        return directory + self.file_names[row_index]
+
+    def __len__(self):
+        return len(self.directories)
+
+
+FILE_TABLE_COLUMN_TYPES = {
+    'string': StringColumn,
+    'category': CategoryColumn,
+    'hex': HexColumn,
+    'path': PathColumn
+}
+"""
+Column storage classes by the storage type names used in Constants.FILE_TABLE_COLUMN_STORAGE_TYPES
+"""
+
+
+class FileRecord(collections.abc.Mapping):
+    """
+    File Record class.
+    Read only dictionary like view of one row of a FileTable, values are read from the table columns when accessed.
+    """
+    __slots__ = ('file_table', 'row_index')
+
+    def __init__(self, file_table, row_index):
+        """
+        Initialization method.
+        :param file_table: FileTable holding the row.
+        :param row_index: Index of the row within the table.
+        """
+        self.file_table = file_table
+        self.row_index = row_index
+
+    def __getitem__(self, column_name):
+        return self.file_table.get_value(self.row_index, column_name)
+
+    def __iter__(self):
+        return iter(self.file_table.column_names)
+
+    def __len__(self):
+        return len(self.file_table.column_names)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class FileTable(collections.abc.Sequence):
+    """
+    File Table class.
+    Compact column oriented table of the indexed iphone content files (storage_master['iphone_file_contents']).
+    Rows are returned as FileRecord mapping views, so it can be iterated and indexed like the list of row dictionaries it replaces.
+    """
+    def __init__(self, column_names=Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM):
+        """
+        Initialization method, create an empty table.
+        :param column_names: Column names of the table, their storage is chosen from Constants.FILE_TABLE_COLUMN_STORAGE_TYPES (string by default).
+        """
+        self.column_names = tuple(column_names)
+        self.columns = {
+            column_name: FILE_TABLE_COLUMN_TYPES[Constants.FILE_TABLE_COLUMN_STORAGE_TYPES.get(column_name, 'string')]()
+            for column_name in self.column_names
+        }
+        self.row_count = 0
+
+    @classmethod
+    def from_rows(cls, rows, column_names=Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM):
+        """
+        Create a table from row tuples or row dictionaries.
+        :param rows: Iterable of row tuples (values ordered as in column_names) or row mappings keyed on column_names.
+        :param column_names: Column names of the table.
+        :rtype: FileTable
+        """
+        file_table = cls(column_names)
+        file_table.extend(
+            tuple(row[column_name] for column_name in file_table.column_names) if isinstance(row, collections.abc.Mapping) else row
+            for row in rows
+        )
+        return file_table
+
+    def append(self, row):
+        """
+        Append a row to the table.
+        :param row: Row tuple (values ordered as in column_names).
+        """
+        for column, value in zip(self.columns.values(), row):
+            column.append(value)
+        self.row_count += 1
+
+    def extend(self, rows):
+        """
+        Append rows to the table.
+        :param rows: Iterable of row tuples (values ordered as in column_names).
+        """
+        for row in rows:
+            self.append(row)
+
+    def get_value(self, row_index, column_name):
+        """
+        Get a single value of the table.
+        :param row_index: Index of the row.
+        :param column_name: Name of the column.
+        :return: Stored value.
+        """
+        return self.columns[column_name][row_index]
+
+    def iterate_column(self, column_name):
+        """
+        Yield the values of one column in row order (without creating row views).
+        :param column_name: Name of the column.
+        :return: Generator of column values.
+        """
+        column = self.columns[column_name]
+        for row_index in range(self.row_count):
+            yield column[row_index]
+
+    def __getitem__(self, row_index):
+        if isinstance(row_index, slice):
+            return [FileRecord(self, index) for index in range(*row_index.indices(self.row_count))]
+        if row_index < 0:
+            row_index += self.row_count
+        if not 0 <= row_index < self.row_count:
+            raise IndexError('file table index out of range')
+        return FileRecord(self, row_index)
+
+    def __iter__(self):
+        for row_index in range(self.row_count):
+            yield FileRecord(self, row_index)
+
+    def __len__(self):
+        return self.row_count
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.row_count} rows, columns={list(self.column_names)!r})"
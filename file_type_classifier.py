@@ -0,0 +1,109 @@
+import Constants
+import concurrent.futures
+import struct
+
+
+def get_file_extension(relative_path):
+    """
+    Return the extension of a relative path (text after the last '.') or '' if it has none.
+    :param relative_path: Relative path of the file.
+    :rtype: String
+    """
+    return relative_path.split('.')[-1] if '.' in relative_path else ''
+
+
+def is_bmp_file_header(file_header):
+    """
+    Check a file header is a bitmap header, the 'BM' magic bytes followed by consistent file size, pixel data offset and DIB header size fields.
+    :param file_header: First bytes of the file.
+    :rtype: Bool
+    """
+    if not file_header.startswith(b'BM') or len(file_header) < 18:
+        return False
+
+    file_size, reserved, pixel_data_offset, dib_header_size = struct.unpack_from('<IIII', file_header, 2)
+    return dib_header_size in Constants.FILE_SIGNATURE_BMP_HEADER_SIZES and reserved == 0 \
+        and 14 + dib_header_size <= pixel_data_offset <= file_size
+
+
+def classify_file_header(file_header):
+    """
+    Detect a file type from the first bytes of a file.
+    :param file_header: First Constants.FILE_SIGNATURE_READ_SIZE bytes of the file.
+    :rtype: String
+    :return: Detected file type (e.g. sqlite, plist, jpg, heic) or '' if no signature matched.
+    """
+    for file_type, offset, magic_bytes in Constants.FILE_SIGNATURES:
+        if file_header.startswith(magic_bytes, offset):
+            return file_type
+
+    if is_bmp_file_header(file_header):
+        return 'bmp'
+
+    if file_header.startswith(b'ftyp', 4):
+        return Constants.FILE_SIGNATURE_FTYP_BRANDS.get(file_header[8:12], 'mp4')
+
+    stripped_file_header = file_header.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if stripped_file_header.startswith(b'<?xml') or stripped_file_header.startswith(b'<!DOCTYPE') or stripped_file_header.startswith(b'<plist'):
+        return 'plist' if b'<plist' in file_header or b'PropertyList' in file_header else 'xml'
+
+    return ''
+
+
+def classify_file(file_path):
+    """
+    Detect a file type by reading only the first Constants.FILE_SIGNATURE_READ_SIZE bytes of the file.
+    :param file_path: Path of the file.
+    :rtype: String
+    :return: Detected file type, '' if no signature matched or None if the file could not be read.
+    """
+    try:
+        with open(file_path, 'rb') as file_pointer:
+            return classify_file_header(file_pointer.read(Constants.FILE_SIGNATURE_READ_SIZE))
+    except OSError:
+        return None
+
+
+def classify_file_database_contents(database_handle, max_workers=Constants.DEFAULT_FILE_SIGNATURE_WORKERS, page_size=Constants.DEFAULT_SQL_FETCH_SIZE,
+                                    case_content_index=None):
+    """
+    Detect the type of every resolved file of the file table that has not been classified yet from its signature.
+    The detected type is stored in Constants.FILE_SIGNATURE_COLUMN and replaces the extension based file_Type (files without a known signature keep their extension).
+    Files that cannot be read are left unclassified, so they are tried again on the next run.
+    Hashed files are classified once per unique content, duplicates (and contents already analysed in the case) reuse the result.
+    :param database_handle: IphoneFileDatabase holding the file table.
+    :param max_workers: Number of threads reading file signatures.
+    :param page_size: Number of file rows handled at once.
+    :param case_content_index: CaseContentIndex holding the signatures of contents analysed in other backups (optional).
+    :return: Number of files classified.
+    """
+    file_ID_column, domain_column, relative_path_column, flags_column, absolute_path_column, file_type_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[:6]
+    sha256_column = Constants.FILE_HASH_COLUMNS['sha256']
+    pages = database_handle.iterate_file_table_pages(
+        [file_ID_column, relative_path_column, absolute_path_column, sha256_column],
+        f"{Constants.FILE_SIGNATURE_COLUMN} IS NULL AND {absolute_path_column} IS NOT NULL AND {absolute_path_column} != ''",
+        page_size
+    )
+
+    classified_file_count = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in pages:
+            # Files without a content hash are keyed on their path, so they are always read
+            content_signatures = {}
+            if case_content_index is not None:
+                content_signatures = case_content_index.get_content_signatures(sha256 for file_ID, relative_path, absolute_path, sha256 in page if sha256 is not None)
+            contents_to_classify = {}
+            for file_ID, relative_path, absolute_path, sha256 in page:
+                content_key = sha256 or absolute_path
+                if content_key not in content_signatures:
+                    contents_to_classify.setdefault(content_key, absolute_path)
+            content_signatures.update(zip(contents_to_classify, executor.map(classify_file, contents_to_classify.values())))
+
+            updated_rows = []
+            for file_ID, relative_path, absolute_path, sha256 in page:
+                file_signature = content_signatures[sha256 or absolute_path]
+                if file_signature is not None:
+                    updated_rows.append((file_signature, file_signature or get_file_extension(relative_path), file_ID))
+            database_handle.update_file_table_rows([Constants.FILE_SIGNATURE_COLUMN, file_type_column], updated_rows)
+            classified_file_count += len(updated_rows)
+    return classified_file_count
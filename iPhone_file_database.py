@@ -1,6 +1,14 @@
 import sqlite3
 import Constants
+import base64
+import evidence_connection_manager
+import itertools
+import json
+import os
 import re
+import stage_profiler
+import tempfile
+import time
 
 
 class IphoneFileDatabase:
@@ -9,39 +17,349 @@ class IphoneFileDatabase:
     Manages the main storage database for file storage.
     Also parses and reads the manifest.db file in the IPhone backup to get file contents stored within the IPhone.
     """
-    def __init__(self, iphone_backup_path, iPhone_backup_object_id):
+    def __init__(self, iphone_backup_path, iPhone_backup_object_id, profiler=None):
         """
         Initialization method, initialize all required values and databases for the database.
         :param iphone_backup_path: Path to the iphone backup path directory.
         :param iPhone_backup_object_id: Backup id for the iphone object (used in naming the databases to ensure database collisions do not happen).
-        .. warnings also:: Ensure that the iPhone_backup_object_id is always unique, this is not currently done automatically and could lead to overwriting an existing database file if multiple databases are being used..
+        :param profiler: StageProfiler recording per stage metrics, defaults to a disabled profiler.
+        .. warnings also:: Ensure that the iPhone_backup_object_id is unique per backup (IPhoneParser.get_backup_id derives one from the backup path), otherwise backups will share and overwrite the same database file.
         """
         self.iphone_backup_object_id = iPhone_backup_object_id
+        self.iphone_backup_path = os.path.abspath(iphone_backup_path)
+        self.profiler = profiler if profiler is not None else stage_profiler.NULL_STAGE_PROFILER
 
-        self.manifest_db_database_file_path = f"{iphone_backup_path}\{Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME}"
-        self.manifest_db_database_connection = sqlite3.connect(self.manifest_db_database_file_path)
+        # Backup databases are evidence, they are only ever opened read only (connections are shared per thread)
+        self.evidence_connections = evidence_connection_manager.EvidenceConnectionManager()
+        self.manifest_db_database_file_path = os.path.join(iphone_backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME)
+        self.manifest_db_database_connection = self.evidence_connections.get_connection(self.manifest_db_database_file_path)
         self.manifest_db_database_cursor = self.manifest_db_database_connection.cursor()
         self.manifest_db_table_name = Constants.IPHONE_BACKUP_MANIFEST_TABLE_NAME
 
         self.file_database_file_path = f"{Constants.DEFAULT_SQLITE_OUTPUT_PATH}_{iPhone_backup_object_id}.db"
-        self.file_database_connection = sqlite3.connect(self.file_database_file_path)
+        self.file_database_connection = sqlite3.connect(self.file_database_file_path, uri=True)
         self.file_database_cursor = self.file_database_connection.cursor()
         self.file_database_table_name = f"iPhone_database_{self.iphone_backup_object_id}"
+        self.file_full_text_table_name = f"{self.file_database_table_name}_full_text"
+        self.last_insert_statistics = {}
+        self.last_synchronise_statistics = {}
+        self.column_name_cache = {}
 
         self.initialize_file_database()
 
     def initialize_file_database(self):
         """
         Initialize the file database (used for storing information about the files within the machine).
+        Existing file tables are kept so later runs can re-index incrementally, unless they were created by an older schema version.
         """
-        # TODO: Change the string formatting, insecure method of assignment
-        sql_command = f"DROP TABLE IF EXISTS {self.file_database_table_name}"
+        sql_command = f"CREATE TABLE IF NOT EXISTS {Constants.DEFAULT_SQL_METADATA_TABLE_NAME} (key TEXT PRIMARY KEY, value TEXT)"
         self.file_database_cursor.execute(sql_command)
 
-        sql_command = f'''CREATE TABLE {self.file_database_table_name} {Constants.DEFAULT_SQL_STORAGE_COLUMNS}'''
+        if self.get_metadata_value('schema_version') != Constants.DEFAULT_SQL_STORAGE_SCHEMA_VERSION:
+            for table_name in (self.file_database_table_name, self.file_full_text_table_name, Constants.DEFAULT_SQL_SMS_FULL_TEXT_TABLE_NAME):
+                sql_command = f"DROP TABLE IF EXISTS {table_name}"
+                self.file_database_cursor.execute(sql_command)
+            sql_command = f"DELETE FROM {Constants.DEFAULT_SQL_METADATA_TABLE_NAME} WHERE substr(key, 1, ?) = ?"
+            self.file_database_cursor.execute(sql_command, (len(self.get_metadata_key('')), self.get_metadata_key('')))
+            self.set_metadata_value('schema_version', Constants.DEFAULT_SQL_STORAGE_SCHEMA_VERSION)
+
+        sql_command = f"CREATE TABLE IF NOT EXISTS {self.file_database_table_name} {Constants.DEFAULT_SQL_STORAGE_TABLE_SCHEMA}"
+        self.file_database_cursor.execute(sql_command)
+
+        sql_command = f"""CREATE TABLE IF NOT EXISTS {Constants.DEFAULT_SQL_HASH_CACHE_TABLE_NAME}
+            (absolute_Path TEXT PRIMARY KEY, size INTEGER, mtime REAL, {', '.join(f'{algorithm} TEXT' for algorithm in Constants.FILE_HASH_COLUMNS)})"""
         self.file_database_cursor.execute(sql_command)
 
+        # Add any columns appended to the schema since the table was created
+        existing_columns = [column_information[1] for column_information in self.file_database_cursor.execute(f"PRAGMA table_info({self.file_database_table_name})")]
+        for column, definition in Constants.DEFAULT_SQL_STORAGE_COLUMN_DEFINITIONS.items():
+            if column not in existing_columns:
+                self.file_database_cursor.execute(f"ALTER TABLE {self.file_database_table_name} ADD COLUMN {column} {definition}")
+
+        self.file_database_connection.commit()
+
+    def get_metadata_key(self, key):
+        """
+        Scope a metadata key to the file table of this backup, so file tables sharing a database file never share metadata.
+        :param key: Metadata key (e.g. backup_uuid).
+        :rtype: String
+        :return: Key as stored in the metadata table.
+        """
+        return f"{self.file_database_table_name}.{key}"
+
+    def get_metadata_value(self, key):
+        """
+        Get a value from the file database metadata table.
+        :param key: Metadata key (scoped to the file table, see get_metadata_key).
+        :return: Stored value or None if not set.
+        """
+        sql_command = f"SELECT value FROM {Constants.DEFAULT_SQL_METADATA_TABLE_NAME} WHERE key = ?"
+        row = self.file_database_cursor.execute(sql_command, (self.get_metadata_key(key),)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_metadata_value(self, key, value):
+        """
+        Set a value in the file database metadata table (not committed).
+        :param key: Metadata key (scoped to the file table, see get_metadata_key).
+        :param value: Value to store (stored as a string).
+        """
+        sql_command = f"INSERT OR REPLACE INTO {Constants.DEFAULT_SQL_METADATA_TABLE_NAME} (key, value) VALUES (?, ?)"
+        self.file_database_cursor.execute(sql_command, (self.get_metadata_key(key), str(value)))
+
+    def is_file_database_current(self, backup_uuid, backup_date):
+        """
+        Check whether the file table was already indexed from this exact backup (same Status.plist UUID and Date).
+        :param backup_uuid: Status.plist UUID of the backup.
+        :param backup_date: Status.plist Date of the backup.
+        :rtype: Bool
+        """
+        return self.get_metadata_value('backup_uuid') == str(backup_uuid) and self.get_metadata_value('backup_date') == str(backup_date)
+
+    def synchronise_file_database(self, backup_uuid, backup_date, build_rows):
+        """
+        Bring the file table in line with the backup manifest.db, only touching what changed since the last run.
+        A different backup UUID clears the table first, an unchanged UUID and Date is a no-op.
+        New fileIDs are inserted, fileIDs no longer in the manifest are deleted and rows whose flags or file blob changed are updated.
+        When the backup was moved since the last run, the absolute paths of the kept rows are resolved again against the new location.
+        :param backup_uuid: Status.plist UUID of the backup.
+        :param backup_date: Status.plist Date of the backup.
+        :param build_rows: Function converting manifest rows (fileID, domain, relativePath, flags) into file table rows (first six storage columns).
+        :return: Dictionary of synchronise statistics, or False if the manifest.db could not be read.
+        """
+        statistics = {'inserted': 0, 'removed': 0, 'changed': 0, 'relocated': 0, 'up_to_date': False}
+        stored_backup_path = self.get_metadata_value('backup_path')
+        if stored_backup_path is not None and stored_backup_path != self.iphone_backup_path \
+                and self.get_metadata_value('backup_uuid') == str(backup_uuid):
+            statistics['relocated'] = self.relocate_file_table_rows(build_rows)
+        self.set_metadata_value('backup_path', self.iphone_backup_path)
+        self.file_database_connection.commit()
+
+        if self.is_file_database_current(backup_uuid, backup_date):
+            statistics['up_to_date'] = True
+            self.last_synchronise_statistics = statistics
+            return statistics
+
+        if self.get_metadata_value('backup_uuid') != str(backup_uuid):
+            self.file_database_cursor.execute(f"DELETE FROM {self.file_database_table_name}")
+
+        table_name = self.file_database_table_name
+        manifest_columns = Constants.IPHONE_BACKUP_MANIFEST_COLUMNS_LIST_FORM
+        storage_columns = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM
+        self.file_database_connection.commit()
+        try:
+            manifest_db_uri = self.evidence_connections.get_database_uri(self.manifest_db_database_file_path)
+            self.file_database_cursor.execute("ATTACH DATABASE ? AS manifest", (manifest_db_uri,))
+        except sqlite3.DatabaseError:
+            print(f"Database file {self.manifest_db_database_file_path} could not be opened, check if it is encrypted.")
+            return False
+
+        try:
+            self.file_database_cursor.execute("DROP TABLE IF EXISTS temp.iminer_new_files")
+            sql_command = f"""CREATE TEMP TABLE iminer_new_files AS
+                SELECT {', '.join(manifest_columns[:4])} FROM manifest.{self.manifest_db_table_name}
+                WHERE {manifest_columns[0]} NOT IN (SELECT {storage_columns[0]} FROM main.{table_name})"""
+            self.file_database_cursor.execute(sql_command)
+        except sqlite3.DatabaseError:
+            print(f"Database file {self.manifest_db_database_file_path} could not be opened, check if it is encrypted.")
+            self.file_database_connection.rollback()
+            self.file_database_cursor.execute("DETACH DATABASE manifest")
+            return False
+
+        try:
+            sql_command = f"""DELETE FROM main.{table_name}
+                WHERE {storage_columns[0]} NOT IN (SELECT {manifest_columns[0]} FROM manifest.{self.manifest_db_table_name})"""
+            statistics['removed'] = self.file_database_cursor.execute(sql_command).rowcount
+
+            # Changed rows also have their derived columns (decoded blob metadata...) reset so they are recomputed
+            # (correlated subqueries on the manifest.db primary key rather than UPDATE FROM, which needs SQLite 3.33)
+            derived_column_resets = ''.join(f", {column} = NULL" for column in Constants.DEFAULT_SQL_STORAGE_DERIVED_COLUMNS_LIST_FORM)
+            manifest_file_match = f"FROM manifest.{self.manifest_db_table_name} AS manifest_files WHERE manifest_files.{manifest_columns[0]} = {table_name}.{storage_columns[0]}"
+            sql_command = f"""UPDATE main.{table_name} SET {storage_columns[3]} = (SELECT manifest_files.{manifest_columns[3]} {manifest_file_match}),
+                {storage_columns[6]} = (SELECT manifest_files.{manifest_columns[4]} {manifest_file_match}){derived_column_resets}
+                WHERE EXISTS (SELECT 1 {manifest_file_match}
+                AND ({table_name}.{storage_columns[3]} IS NOT manifest_files.{manifest_columns[3]} OR {table_name}.{storage_columns[6]} IS NOT manifest_files.{manifest_columns[4]}))"""
+            statistics['changed'] = self.file_database_cursor.execute(sql_command).rowcount
+            self.file_database_connection.commit()
+
+            new_files_cursor = self.file_database_connection.cursor()
+            new_files_cursor.execute(f"SELECT {', '.join(manifest_columns[:4])} FROM temp.iminer_new_files")
+            statistics['inserted'] = self.insert_table_rows(build_rows(self.fetch_cursor_rows(new_files_cursor)), storage_columns[:6])['rows']
+
+            # Copy the file blobs of the new rows across inside SQLite rather than passing them through python
+            sql_command = f"""UPDATE main.{table_name} SET {storage_columns[6]} = (SELECT manifest_files.{manifest_columns[4]} {manifest_file_match})
+                WHERE {table_name}.{storage_columns[0]} IN (SELECT {manifest_columns[0]} FROM temp.iminer_new_files)"""
+            self.file_database_cursor.execute(sql_command)
+
+            self.set_metadata_value('backup_uuid', backup_uuid)
+            self.set_metadata_value('backup_date', backup_date)
+            self.file_database_cursor.execute("DROP TABLE temp.iminer_new_files")
+            self.file_database_connection.commit()
+        finally:
+            self.file_database_cursor.execute("DETACH DATABASE manifest")
+
+        self.last_synchronise_statistics = statistics
+        return statistics
+
+    def relocate_file_table_rows(self, build_rows):
+        """
+        Resolve the absolute path (and extension based file type) of every file table row again, after the backup was moved.
+        File types detected from the file signature are kept, they depend on the content rather than the location.
+        :param build_rows: Function converting manifest rows (fileID, domain, relativePath, flags) into file table rows (first six storage columns).
+        :return: Number of rows whose absolute path changed.
+        """
+        file_ID_column, domain_column, relative_path_column, flags_column, absolute_path_column, file_type_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[:6]
+        sql_command = f"""UPDATE {self.file_database_table_name} SET {absolute_path_column} = ?,
+            {file_type_column} = CASE WHEN {Constants.FILE_SIGNATURE_COLUMN} IS NULL THEN ? ELSE {file_type_column} END
+            WHERE {file_ID_column} = ? AND {absolute_path_column} IS NOT ?"""
+
+        relocated_row_count = 0
+        for page in self.iterate_file_table_pages([file_ID_column, domain_column, relative_path_column, flags_column]):
+            relocated_rows = [(row[4], row[5], row[0], row[4]) for row in build_rows(page)]
+            self.file_database_cursor.execute("BEGIN")
+            try:
+                self.file_database_cursor.executemany(sql_command, relocated_rows)
+            except:
+                self.file_database_connection.rollback()
+                raise
+            relocated_row_count += self.file_database_cursor.rowcount
+            self.file_database_connection.commit()
+        return relocated_row_count
+
+    def create_file_database_indexes(self, analyse=False):
+        """
+        Create the lookup indexes on the file database (run after bulk loading, building them afterwards is faster than maintaining them per insert).
+        :param analyse: Refresh the query planner statistics of the file table (after its rows changed), so queries pick the most selective index.
+        """
+        for index_name, index_columns in Constants.DEFAULT_SQL_STORAGE_INDEXES.items():
+            sql_command = f"CREATE INDEX IF NOT EXISTS {self.file_database_table_name}_{index_name} ON {self.file_database_table_name} ({', '.join(index_columns)})"
+            self.file_database_cursor.execute(sql_command)
+
+        if analyse:
+            self.file_database_cursor.execute(f"ANALYZE {self.file_database_table_name}")
+
+        self.file_database_connection.commit()
+
+    def does_table_exist(self, table_name):
+        """
+        Check whether a table (or virtual table) exists in the file database.
+        :param table_name: Table name to look for.
+        :rtype: Bool
+        """
+        sql_command = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        return self.file_database_cursor.execute(sql_command, (table_name,)).fetchone() is not None
+
+    def build_file_full_text_index(self, rebuild=False):
+        """
+        Build the FTS5 full text index over the domain and relative path of every file in the file table.
+        The index is an external content table reading the file table by rowid, so paths are not stored twice.
+        It is only (re)built when it does not exist yet or rebuild is set (the file table changed).
+        :param rebuild: Rebuild an existing index.
+        :return: True if the index was built, None if it was already up to date or False if SQLite has no FTS5 support.
+        """
+        table_exists = self.does_table_exist(self.file_full_text_table_name)
+        if table_exists and not rebuild:
+            return None
+
+        sql_command = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {self.file_full_text_table_name}
+            USING fts5({', '.join(Constants.DEFAULT_SQL_FILE_FULL_TEXT_COLUMNS)}, content='{self.file_database_table_name}', content_rowid='rowid',
+            tokenize="{Constants.DEFAULT_SQL_FULL_TEXT_TOKENIZER}")"""
+        try:
+            self.file_database_cursor.execute(sql_command)
+        except sqlite3.OperationalError:
+            print("SQLite was built without FTS5, full text search is not available.")
+            return False
+
+        self.file_database_cursor.execute(f"INSERT INTO {self.file_full_text_table_name} ({self.file_full_text_table_name}) VALUES ('rebuild')")
+        self.file_database_connection.commit()
+        return True
+
+    def build_sms_full_text_index(self, sms_db_file_path, source_key):
+        """
+        Build the FTS5 full text index over the message bodies of the backup sms.db, copying them across inside SQLite.
+        The index is skipped when it was already built from the same source (source_key, e.g. path, size and mtime of the sms.db).
+        :param sms_db_file_path: Absolute path of the sms.db file within the backup.
+        :param source_key: String identifying the indexed sms.db version.
+        :return: Number of indexed messages (0 if the index was already up to date) or False if it could not be built.
+        """
+        table_name = Constants.DEFAULT_SQL_SMS_FULL_TEXT_TABLE_NAME
+        if self.get_metadata_value('sms_full_text_source') == source_key and self.does_table_exist(table_name):
+            return 0
+
         self.file_database_connection.commit()
+        try:
+            self.file_database_cursor.execute("ATTACH DATABASE ? AS sms", (self.evidence_connections.get_database_uri(sms_db_file_path),))
+        except sqlite3.DatabaseError:
+            print(f"Database file {sms_db_file_path} could not be opened, check if it is encrypted.")
+            return False
+
+        try:
+            self.file_database_cursor.execute(f"DROP TABLE IF EXISTS main.{table_name}")
+            sql_command = f"""CREATE VIRTUAL TABLE main.{table_name}
+                USING fts5({Constants.SMS_MESSAGE_INFORMATION_DB_TEXT_COLUMN}, tokenize="{Constants.DEFAULT_SQL_FULL_TEXT_TOKENIZER}")"""
+            self.file_database_cursor.execute(sql_command)
+
+            # The index rowid is the message rowid, so hits can be joined back to the sms.db message table
+            text_column = Constants.SMS_MESSAGE_INFORMATION_DB_TEXT_COLUMN
+            sql_command = f"""INSERT INTO main.{table_name} (rowid, {text_column})
+                SELECT rowid, {text_column} FROM sms.{Constants.SMS_MESSAGE_INFORMATION_DB_TABLE} WHERE {text_column} IS NOT NULL"""
+            message_count = self.file_database_cursor.execute(sql_command).rowcount
+            self.set_metadata_value('sms_full_text_source', source_key)
+            self.file_database_connection.commit()
+        except sqlite3.OperationalError as error:
+            self.file_database_connection.rollback()
+            print(f"Could not build the sms full text index from {sms_db_file_path}: {error}")
+            return False
+        finally:
+            self.file_database_cursor.execute("DETACH DATABASE sms")
+
+        return message_count
+
+    def quote_full_text_query(self, query):
+        """
+        Turn a plain search string into an FTS5 query matching every whitespace separated term.
+        Each term is quoted so punctuation (e.g. "sms.db") is matched as a phrase instead of parsed as query syntax, a trailing * keeps prefix matching.
+        :param query: Plain search string.
+        :return: FTS5 MATCH query string.
+        """
+        quoted_terms = []
+        for term in query.split():
+            prefix = term.endswith('*')
+            term = term.rstrip('*')
+            if term:
+                quoted_terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+        return ' '.join(quoted_terms)
+
+    def search_full_text(self, query, target='files', limit=Constants.DEFAULT_FULL_TEXT_SEARCH_LIMIT):
+        """
+        Search a full text index, best matches (bm25 rank) first.
+        :param query: FTS5 MATCH query (see quote_full_text_query for plain search strings).
+        :param target: Index to search, 'files' (domain and relative path) or 'sms' (message bodies).
+        :param limit: Maximum number of hits to return.
+        :return: List of hit dictionaries (file columns or message rowid, text and snippet, plus 'rank') or False if the index has not been built.
+        """
+        if target == 'files':
+            full_text_table_name = self.file_full_text_table_name
+            columns = Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM
+            sql_command = f"""SELECT {', '.join(f'files.{column}' for column in columns)}, {full_text_table_name}.rank
+                FROM {full_text_table_name} JOIN {self.file_database_table_name} AS files ON files.rowid = {full_text_table_name}.rowid
+                WHERE {full_text_table_name} MATCH ? ORDER BY {full_text_table_name}.rank LIMIT ?"""
+        else:
+            full_text_table_name = Constants.DEFAULT_SQL_SMS_FULL_TEXT_TABLE_NAME
+            columns = ['message_rowid', Constants.SMS_MESSAGE_INFORMATION_DB_TEXT_COLUMN, 'snippet']
+            sql_command = f"""SELECT rowid, {Constants.SMS_MESSAGE_INFORMATION_DB_TEXT_COLUMN}, snippet({full_text_table_name}, 0, '[', ']', '...', 16), rank
+                FROM {full_text_table_name} WHERE {full_text_table_name} MATCH ? ORDER BY rank LIMIT ?"""
+
+        if not self.does_table_exist(full_text_table_name):
+            print(f"The {target} full text index has not been built, index the backup first.")
+            return False
+
+        try:
+            rows = self.file_database_cursor.execute(sql_command, (query, limit)).fetchall()
+        except sqlite3.OperationalError as error:
+            print(f"Invalid full text query {query!r}: {error}")
+            return []
+
+        return [dict(zip([*columns, 'rank'], row)) for row in rows]
 
     def separate_data(self, information_dictionary):
         """
@@ -69,11 +387,210 @@ class IphoneFileDatabase:
         Inserts a row into the main database for the object.
         :param information_dictionary_to_add: Information dictionary containing information on the new row to add to the main object database.
         """
-        column_string, value_string = self.separate_data(information_dictionary_to_add)
+        if isinstance(information_dictionary_to_add, dict):
+            column_string = ", ".join(information_dictionary_to_add.keys())
+            placeholder_string = ", ".join('?' * len(information_dictionary_to_add))
+            sql_command = f"INSERT INTO {self.file_database_table_name} ({column_string}) VALUES ({placeholder_string});"
+            self.file_database_cursor.execute(sql_command, tuple(information_dictionary_to_add.values()))
 
-        if (column_string != False) or (value_string != False):
-            sql_command = f"INSERT INTO {self.file_database_table_name} ({column_string}) VALUES ({value_string});"
-            self.file_database_cursor.execute(sql_command)
+    def insert_table_rows(self, information_rows, columns=None, batch_size=Constants.DEFAULT_SQL_INSERT_BATCH_SIZE):
+        """
+        Bulk insert rows into the main database for the object.
+        Rows are written with parameter bound executemany calls, each batch inside its own explicit transaction.
+        :param information_rows: Iterable of row tuples (values ordered as in columns), can be a generator.
+        :param columns: Column names the row values map to, defaults to Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM.
+        :param batch_size: Number of rows to write per executemany call and transaction.
+        :rtype: Dictionary
+        :return: Insert statistics (rows inserted, seconds taken and rows per second).
+        """
+        columns = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM if columns is None else columns
+        sql_command = f"INSERT INTO {self.file_database_table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});"
+
+        # Close any implicit transaction left open by previous single row inserts before starting explicit ones
+        self.file_database_connection.commit()
+
+        row_count = 0
+        start_time = time.perf_counter()
+        information_rows = iter(information_rows)
+        with self.profiler.stage('insert_table_rows') as stage_metrics:
+            while True:
+                batch = list(itertools.islice(information_rows, batch_size))
+                if not batch:
+                    break
+
+                self.file_database_cursor.execute("BEGIN")
+                try:
+                    self.file_database_cursor.executemany(sql_command, batch)
+                except:
+                    self.file_database_connection.rollback()
+                    raise
+                self.file_database_connection.commit()
+                row_count += len(batch)
+            stage_metrics.add_rows(row_count)
+
+        seconds = time.perf_counter() - start_time
+        self.last_insert_statistics = {
+            'rows': row_count,
+            'seconds': seconds,
+            'rows_per_second': row_count / seconds if seconds > 0 else 0.0
+        }
+        return self.last_insert_statistics
+
+    def iterate_file_table_pages(self, columns, condition='1', page_size=Constants.DEFAULT_SQL_FETCH_SIZE, parameters=()):
+        """
+        Yield rows of the file table in pages using keyset pagination on rowid.
+        Each page is fully read before it is yielded, so the caller can update the rows of a page before asking for the next.
+        :param columns: Columns to select.
+        :param condition: SQL condition rows must match (e.g. "file_Size IS NULL").
+        :param page_size: Maximum number of rows per page.
+        :param parameters: Values bound to the ? placeholders of the condition.
+        :return: Generator of lists of row tuples (values ordered as in columns).
+        """
+        sql_command = f"SELECT rowid, {', '.join(columns)} FROM {self.file_database_table_name} WHERE rowid > ? AND ({condition}) ORDER BY rowid LIMIT ?"
+        last_rowid = -1 << 63
+        while True:
+            rows = self.file_database_cursor.execute(sql_command, (last_rowid, *parameters, page_size)).fetchall()
+            if not rows:
+                break
+
+            last_rowid = rows[-1][0]
+            yield [row[1:] for row in rows]
+
+    def get_file_filter_condition(self, domains=None, domain_prefixes=None, file_types=None, extensions=None, relative_path_globs=None,
+                                  minimum_size=None, maximum_size=None, modified_after=None, modified_before=None):
+        """
+        Build an SQL condition (with bound parameters) selecting file table rows, filters left as None are not applied.
+        Each filter matches any of its values, different filters must all match.
+        Domain, file type, size and modified time filters and relative path globs starting with a literal prefix can be served by one of the
+        Constants.DEFAULT_SQL_STORAGE_INDEXES indexes. Extension filters (LIKE '%.ext') and globs starting with a wildcard scan the whole file table.
+        :param domains: Exact domains (e.g. AppDomain-net.whatsapp.WhatsApp).
+        :param domain_prefixes: Domain prefixes (e.g. AppDomain-net.whatsapp), matched as an index friendly range (an empty prefix matches every domain).
+        :param file_types: File types (the file_Type column, the detected signature or the extension).
+        :param extensions: Relative path extensions (case insensitive, without the dot).
+        :param relative_path_globs: Relative path glob patterns (case sensitive, e.g. Library/SMS/*).
+        :param minimum_size: Minimum file size in bytes.
+        :param maximum_size: Maximum file size in bytes.
+        :param modified_after: Earliest last modified time (unix time, inclusive).
+        :param modified_before: Latest last modified time (unix time, exclusive).
+        :return: Tuple of (condition, parameters) for iterate_file_table_pages or iterate_file_table_rows.
+        """
+        domain_column, relative_path_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[1:3]
+        file_type_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[5]
+        conditions = []
+        parameters = []
+
+        domain_conditions = []
+        if domains:
+            domain_conditions.append(f"{domain_column} IN ({', '.join('?' * len(domains))})")
+            parameters.extend(domains)
+        for domain_prefix in domain_prefixes or []:
+            # An empty prefix matches every domain (and has no upper bound to build the range from)
+            if not domain_prefix:
+                domain_conditions.append(f"{domain_column} IS NOT NULL")
+                continue
+            domain_conditions.append(f"({domain_column} >= ? AND {domain_column} < ?)")
+            parameters.extend((domain_prefix, domain_prefix[:-1] + chr(ord(domain_prefix[-1]) + 1)))
+        if domain_conditions:
+            conditions.append(f"({' OR '.join(domain_conditions)})")
+
+        if file_types:
+            conditions.append(f"{file_type_column} IN ({', '.join('?' * len(file_types))})")
+            parameters.extend(file_types)
+        if extensions:
+            extension_condition = f"{relative_path_column} LIKE ? ESCAPE '\\'"
+            conditions.append(f"({' OR '.join([extension_condition] * len(extensions))})")
+            parameters.extend('%.' + self.escape_like_pattern(extension.lstrip('.')) for extension in extensions)
+        if relative_path_globs:
+            conditions.append(f"({' OR '.join([f'{relative_path_column} GLOB ?'] * len(relative_path_globs))})")
+            parameters.extend(relative_path_globs)
+
+        for column, operator, value in (('file_Size', '>=', minimum_size), ('file_Size', '<=', maximum_size),
+                                        ('file_Last_Modified', '>=', modified_after), ('file_Last_Modified', '<', modified_before)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(value)
+
+        return ' AND '.join(conditions) or '1', tuple(parameters)
+
+    def escape_like_pattern(self, string):
+        """
+        Escape the LIKE wildcards (% and _) of a string, for use with ESCAPE '\\'.
+        :param string: String to match literally.
+        :return: Escaped string.
+        """
+        return re.sub(r'([%_\\])', r'\\\1', string)
+
+    def iterate_file_table_rows(self, columns, condition='1', parameters=(), order_by=None, limit=None, fetch_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Stream the file table rows matching a condition from a single query, so SQLite can answer it from the file table indexes.
+        Unlike iterate_file_table_pages the read statement stays open while rows are consumed, the file table must not be updated meanwhile.
+        :param columns: Columns to select.
+        :param condition: SQL condition rows must match (see get_file_filter_condition).
+        :param parameters: Values bound to the condition placeholders.
+        :param order_by: Column to sort the rows on (None leaves the order to SQLite).
+        :param limit: Maximum number of rows (None for all rows).
+        :param fetch_size: Number of rows to fetch per fetchmany call.
+        :return: Generator of row tuples (values ordered as in columns).
+        """
+        sql_command = f"SELECT {', '.join(columns)} FROM {self.file_database_table_name} WHERE {condition}"
+        if order_by is not None:
+            sql_command += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql_command += " LIMIT ?"
+            parameters = (*parameters, limit)
+
+        file_database_cursor = self.file_database_connection.cursor()
+        file_database_cursor.execute(sql_command, parameters)
+        return self.fetch_cursor_rows(file_database_cursor, fetch_size)
+
+    def update_file_table_rows(self, columns, information_rows):
+        """
+        Update columns of many file table rows (matched on file_ID) with one executemany call inside an explicit transaction.
+        :param columns: Columns to set.
+        :param information_rows: Row tuples of the column values followed by the file_ID of the row to update.
+        """
+        set_string = ', '.join(f"{column} = ?" for column in columns)
+        sql_command = f"UPDATE {self.file_database_table_name} SET {set_string} WHERE {Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]} = ?"
+
+        self.file_database_connection.commit()
+        self.file_database_cursor.execute("BEGIN")
+        try:
+            self.file_database_cursor.executemany(sql_command, information_rows)
+        except:
+            self.file_database_connection.rollback()
+            raise
+        self.file_database_connection.commit()
+
+    def get_hash_cache_entries(self, absolute_paths):
+        """
+        Get the cached content hashes of the given files.
+        :param absolute_paths: Absolute paths of the files (looked up in batches of Constants.SQL_MAX_VARIABLE_NUMBER paths).
+        :rtype: Dictionary
+        :return: Absolute path to (size, mtime, {algorithm: hex digest}) for every cached path.
+        """
+        absolute_paths = list(absolute_paths)
+        algorithms = list(Constants.FILE_HASH_COLUMNS)
+        hash_cache_entries = {}
+        for batch_start in range(0, len(absolute_paths), Constants.SQL_MAX_VARIABLE_NUMBER):
+            path_batch = absolute_paths[batch_start:batch_start + Constants.SQL_MAX_VARIABLE_NUMBER]
+            sql_command = f"""SELECT absolute_Path, size, mtime, {', '.join(algorithms)} FROM {Constants.DEFAULT_SQL_HASH_CACHE_TABLE_NAME}
+                WHERE absolute_Path IN ({', '.join('?' * len(path_batch))})"""
+            for row in self.file_database_cursor.execute(sql_command, path_batch):
+                hash_cache_entries[row[0]] = (row[1], row[2], dict(zip(algorithms, row[3:])))
+        return hash_cache_entries
+
+    def update_hash_cache(self, hash_cache_rows):
+        """
+        Insert or replace content hash cache entries (not committed).
+        :param hash_cache_rows: Iterable of (absolute path, size, mtime, {algorithm: hex digest}) tuples.
+        """
+        algorithms = list(Constants.FILE_HASH_COLUMNS)
+        sql_command = f"""INSERT OR REPLACE INTO {Constants.DEFAULT_SQL_HASH_CACHE_TABLE_NAME} (absolute_Path, size, mtime, {', '.join(algorithms)})
+            VALUES ({', '.join('?' * (len(algorithms) + 3))})"""
+        self.file_database_cursor.executemany(sql_command, (
+            (absolute_path, size, mtime, *(file_hashes.get(algorithm) for algorithm in algorithms))
+            for absolute_path, size, mtime, file_hashes in hash_cache_rows
+        ))
 
     def change_table_row(self, information_dictionary_to_change):
         """
@@ -97,32 +614,81 @@ class IphoneFileDatabase:
         """
         return Constants.REGEX_CAMEL_CASE_SEARCH_EXPRESSION.sub(r'_\1', string).lower()
 
+    def get_db_column_names(self, db_file_path, table_name, cursor_description):
+        """
+        Return the snake_case column names of a query, converting them once per (db file, table) and caching the result.
+        :param db_file_path: Path of the queried db file.
+        :param table_name: Queried table name.
+        :param cursor_description: cursor.description of the executed query.
+        :rtype: Tuple
+        :return: Tuple of snake_case column names in query column order.
+        """
+        column_names = self.column_name_cache.get((db_file_path, table_name))
+        if column_names is None or len(column_names) != len(cursor_description):
+            # TODO: Finish regular expression to change camel case to snake case using self.convert_camel_case_to_snake_case(), (Current function converts non CamelCase versions like GATTserviceChangeConfig to g_attservice_change_config)
+            column_names = tuple(self.convert_camel_case_to_snake_case(column_description[0]) for column_description in cursor_description)
+            self.column_name_cache[(db_file_path, table_name)] = column_names
+        return column_names
+
+    def get_db_content_rows(self, db_file_path, table_name):
+        """
+        Get all information within the given db file within the iphone backup as compact row tuples with a shared header.
+        :return: Tuple of (snake_case column names, list of row tuples).
+        """
+        db_database_connection = self.evidence_connections.get_connection(db_file_path)
+        db_database_cursor = db_database_connection.execute(f"SELECT * FROM {table_name}")
+        try:
+            column_names = self.get_db_column_names(db_file_path, table_name, db_database_cursor.description)
+            return column_names, db_database_cursor.fetchall()
+        finally:
+            db_database_cursor.close()
+
     def get_db_content(self, db_file_path, table_name):
         """
         Get all information within the given db file within the iphone backup in the form of rows.
         :return: Return the rows from the given db file within the iphone backup.
         """
         try:
-            db_database_connection = sqlite3.connect(db_file_path)
-            db_database_cursor = db_database_connection.cursor()
-            db_table_name = table_name
-
-            database_rows = []
-            sql_command = f"SELECT * FROM {db_table_name}"
-            for row in db_database_cursor.execute(sql_command):
-                row_dictionary = {}
-                for index, value in enumerate(row):
-                    # TODO: Finish regular expression to change camel case to snake case using self.convert_camel_case_to_snake_case(), (Current function converts non CamelCase versions like GATTserviceChangeConfig to g_attservice_change_config)
-                    row_dictionary[self.convert_camel_case_to_snake_case(db_database_cursor.description[index][0])] = value
-
-                database_rows.append(row_dictionary)
-            db_database_connection.close()
-            return database_rows
+            column_names, rows = self.get_db_content_rows(db_file_path, table_name)
+            return [dict(zip(column_names, row)) for row in rows]
         except:
             raise
             print(f"Database file {db_file_path} could not be opened, check if it is encrypted.")
             return ''
 
+    def iterate_db_content_row_chunks(self, db_file_path, table_name, chunk_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Yield all information within the given db file within the iphone backup in chunks of at most chunk_size row tuples.
+        Pages are read with keyset pagination on the table rowid, so no read statement is held open between chunks.
+        :param db_file_path: Path of the db file to read.
+        :param table_name: Table name in the database to read from.
+        :param chunk_size: Maximum number of rows per chunk.
+        :return: Generator of tuples of (snake_case column names, list of row tuples).
+        """
+        db_database_connection = self.evidence_connections.get_connection(db_file_path)
+        sql_command = f"SELECT rowid, * FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        last_rowid = -1 << 63
+        while True:
+            db_database_cursor = db_database_connection.execute(sql_command, (last_rowid, chunk_size))
+            column_names = self.get_db_column_names(db_file_path, table_name, db_database_cursor.description[1:])
+            rows = db_database_cursor.fetchall()
+            if not rows:
+                break
+
+            last_rowid = rows[-1][0]
+            yield column_names, [row[1:] for row in rows]
+
+    def iterate_db_content_chunks(self, db_file_path, table_name, chunk_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Yield all information within the given db file within the iphone backup in chunks of at most chunk_size rows.
+        :param db_file_path: Path of the db file to read.
+        :param table_name: Table name in the database to read from.
+        :param chunk_size: Maximum number of rows per chunk.
+        :return: Generator of lists of row dictionaries (same keys as get_db_content).
+        """
+        for column_names, rows in self.iterate_db_content_row_chunks(db_file_path, table_name, chunk_size):
+            yield [dict(zip(column_names, row)) for row in rows]
+
     def get_manifest_db(self):
         """
         Get all information within the manifest.db file within the iphone backup in the form of rows.
@@ -139,13 +705,30 @@ class IphoneFileDatabase:
             print(f"Database file {self.manifest_db_database_file_path} could not be opened, check if it is encrypted.")
             return False
 
-    def get_iminer_file_database(self):
+    def fetch_cursor_rows(self, cursor, fetch_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Yield every row of an executed cursor, fetching fetch_size rows at a time, then close the cursor.
+        :param cursor: Cursor that has already executed a query.
+        :param fetch_size: Number of rows to fetch per fetchmany call.
+        :return: Generator of row tuples.
+        """
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def get_iminer_file_database(self, columns=None):
         """
         Return all information within the main file storage database for the object in the form of rows.
+        :param columns: Columns to select, defaults to all columns.
         :return: Return the rows from the main storage database.
         """
         database_rows = []
-        sql_command = f"SELECT * FROM {self.file_database_table_name}"
+        sql_command = f"SELECT {'*' if columns is None else ', '.join(columns)} FROM {self.file_database_table_name}"
         for row in self.file_database_cursor.execute(sql_command):
             database_rows.append(row)
 
@@ -165,10 +748,10 @@ class IphoneFileDatabase:
 
     def close_manifest_database(self):
         """
-        Close the manifest.db database.
+        Close the manifest.db database (and every other backup database connection opened for reading).
         :rtype: Void
         """
-        self.manifest_db_database_connection.close()
+        self.evidence_connections.close_connections()
 
     def close_databases(self):
         """
@@ -205,4 +788,131 @@ class IphoneFileDatabase:
     #     tables = self.file_database_cursor.fetchall()
     #
     #     for table in tables:
-    #         print(f"Table: {table}")
\ No newline at end of file
+    #         print(f"Table: {table}")
+
+
+def convert_to_row_chunk_value(value):
+    """
+    Convert db file values json cannot encode (used as the row chunk encoder default function)
+    Bytes become {"base64": ...} objects, the only objects a row chunk holds, so they are converted back by decode_row_chunk
+    :param value: Value to convert
+    :return: JSON serialisable value
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return {'base64': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"Unsupported db file value type {type(value).__name__}")
+
+
+ROW_CHUNK_ENCODER = json.JSONEncoder(default=convert_to_row_chunk_value)
+"""
+Encoder of the row chunks spooled by ChunkedTableRows and stored in the case database (plain data only, reading a chunk back never runs code)
+"""
+
+
+def encode_row_chunk(rows):
+    """
+    Encode a chunk of db file rows.
+    :param rows: List of row tuples (values as returned by sqlite3).
+    :rtype: bytes
+    :return: UTF-8 JSON array of row arrays.
+    """
+    return ROW_CHUNK_ENCODER.encode(rows).encode('utf-8')
+
+
+def decode_row_chunk(chunk_rows):
+    """
+    Decode a chunk of db file rows encoded by encode_row_chunk.
+    :param chunk_rows: Encoded row chunk.
+    :return: List of row lists.
+    """
+    return json.loads(chunk_rows, object_hook=lambda json_object: base64.b64decode(json_object['base64']))
+
+
+class ChunkedTableRows:
+    """
+    Chunked Table Rows class.
+    Re-iterable rows of a table within a db file of the iphone backup, held in memory bounded by the chunk size rather than the number of rows.
+    load reads the table once, chunk by chunk, spooling each chunk to a temporary file, so every db file error is raised by load
+    (inside the artifact extractor that called it). Iterating reads the spooled chunks back one at a time without touching the db file.
+    """
+    def __init__(self, database_handle, db_file_path, table_name, chunk_size=Constants.DEFAULT_SQL_FETCH_SIZE):
+        """
+        Initialization method.
+        :param database_handle: IphoneFileDatabase used to read the db file.
+        :param db_file_path: Path of the db file to read.
+        :param table_name: Table name in the database to read from.
+        :param chunk_size: Maximum number of rows held in memory at once.
+        """
+        self.database_handle = database_handle
+        self.db_file_path = db_file_path
+        self.table_name = table_name
+        self.chunk_size = chunk_size
+        self.column_names = ()
+        self.chunk_positions = []
+        self.spool_file = None
+
+    def load(self):
+        """
+        Read the whole table from the db file into the spool file (raises sqlite3.DatabaseError if it can not be read).
+        :return: Self.
+        """
+        return self.load_encoded_chunks(
+            (column_names, encode_row_chunk(rows))
+            for column_names, rows in self.database_handle.iterate_db_content_row_chunks(self.db_file_path, self.table_name, self.chunk_size)
+        )
+
+    def load_encoded_chunks(self, encoded_chunks):
+        """
+        Spool already encoded row chunks, e.g. the rows extracted from the same database content in another backup (see CaseContentIndex.iterate_artifact_chunks).
+        :param encoded_chunks: Iterable of (column names, row chunk encoded by encode_row_chunk) tuples.
+        :return: Self.
+        """
+        spool_file = tempfile.TemporaryFile()
+        chunk_positions = []
+        try:
+            for column_names, chunk_rows in encoded_chunks:
+                chunk_positions.append((spool_file.tell(), len(chunk_rows)))
+                spool_file.write(chunk_rows)
+                self.column_names = column_names
+        except:
+            spool_file.close()
+            raise
+
+        self.close()
+        self.spool_file = spool_file
+        self.chunk_positions = chunk_positions
+        return self
+
+    def iterate_encoded_chunks(self):
+        """
+        Yield the spooled chunks as they are stored.
+        :return: Generator of row chunks encoded by encode_row_chunk.
+        """
+        for chunk_position, chunk_length in self.chunk_positions:
+            # Each chunk is read with its own seek, so several iterations can be interleaved
+            self.spool_file.seek(chunk_position)
+            yield self.spool_file.read(chunk_length)
+
+    def iterate_chunks(self):
+        """
+        Yield the table rows in chunks.
+        :return: Generator of lists of row dictionaries.
+        """
+        for chunk_rows in self.iterate_encoded_chunks():
+            yield [dict(zip(self.column_names, row)) for row in decode_row_chunk(chunk_rows)]
+
+    def close(self):
+        """
+        Close (and so delete) the spool file.
+        """
+        if self.spool_file is not None:
+            self.spool_file.close()
+            self.spool_file = None
+            self.chunk_positions = []
+
+    def __iter__(self):
+        for chunk in self.iterate_chunks():
+            yield from chunk
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.db_file_path!r}, {self.table_name!r})"
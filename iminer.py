@@ -1,11 +1,28 @@
 import argparse
+import backup_diff
+import base64
+import case_content_index
+import collections.abc
+import concurrent.futures
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
 import plistlib
+import queue
 import datetime
-import xml.etree.ElementTree as ElementTree
+import file_exporter
+import traceback
+import xml.sax.saxutils
 import re
+import sys
+import time
 import Constants
 import iphone_parser
 import iPhone_file_database
+import stage_profiler
 
 """
 .. module:: iminer.py
@@ -40,54 +57,65 @@ def convert_to_readable(string):
     return ' '.join(string.split('_')).capitalize() if string is not None else ''
 
 
-def parse_storage_master_to_txt(storage_master):
+def is_row_collection(storage_data):
     """
-    Parse and return the given dictionary (storage_master) in a txt human readable file format
-    :param storage_master: Storage master containing dictionary with categories to values
-    :return parsed_text_array: Parsed text array is the formatted array of each row to print
+    Check whether the given storage data is a collection of rows (a list or any other iterable such as chunked database rows, but not a string or dictionary)
+    :rtype: Bool
+    :param storage_data: Storage data to check
     """
-    parsed_text_array = []
+    return isinstance(storage_data, collections.abc.Iterable) and not isinstance(storage_data, (str, bytes, collections.abc.Mapping))
+
 
+def iterate_storage_master_txt(storage_master):
+    """
+    Yield the given dictionary (storage_master) in a txt human readable file format, one formatted piece at a time
+    :param storage_master: Storage master containing dictionary with categories to values
+    :return: Generator of formatted text chunks
+    """
     for storage_category, storage_data in storage_master.items():
         title = convert_to_readable(storage_category)
-        parsed_text_array.append(f"{'-' * len(title)}\n{title}\n{'-'* len(title)}\n")
+        yield f"{'-' * len(title)}\n{title}\n{'-'* len(title)}\n"
 
-        if isinstance(storage_data, list):
-            if isinstance(storage_data[0], dict):
+        if is_row_collection(storage_data):
+            storage_data_iterator = iter(storage_data)
+            first_list_item = next(storage_data_iterator, None)
+            if isinstance(first_list_item, collections.abc.Mapping):
                 # Create columns
-                for key in storage_data[0].keys():
-                    parsed_text_array.append(
-                        f"* {convert_to_readable(key)} *{Constants.COLUMN_FILLER_CHARACTER * (Constants.COLUMN_WIDTH - (len(key) + 4))}")
-                parsed_text_array.append("\n")
+                for key in first_list_item.keys():
+                    yield f"* {convert_to_readable(key)} *{Constants.COLUMN_FILLER_CHARACTER * (Constants.COLUMN_WIDTH - (len(key) + 4))}"
+                yield "\n"
 
                 # Populate columns with data
-                for list_item in storage_data:
+                for list_item in itertools.chain((first_list_item,), storage_data_iterator):
                     for iphone_information_key, iphone_information_data in list_item.items():
-                        parsed_text_array.append(
-                            f"{iphone_information_data}{Constants.COLUMN_FILLER_CHARACTER * (Constants.COLUMN_WIDTH - len(str(iphone_information_data)))}"
-                        )
-                    parsed_text_array.append("\n")
-            else:
-                for list_item in storage_data:
-                    parsed_text_array.append(
-                        f"{list_item}\n"
-                    )
+                        yield f"{iphone_information_data}{Constants.COLUMN_FILLER_CHARACTER * (Constants.COLUMN_WIDTH - len(str(iphone_information_data)))}"
+                    yield "\n"
+            elif first_list_item is not None:
+                for list_item in itertools.chain((first_list_item,), storage_data_iterator):
+                    yield f"{list_item}\n"
 
         elif isinstance(storage_data, dict):
             for iphone_information_key, iphone_information_data in storage_data.items():
                 if isinstance(iphone_information_data, dict):
-                    parsed_text_array.append(f"{convert_to_readable(iphone_information_key)}:\n")
+                    yield f"{convert_to_readable(iphone_information_key)}:\n"
                     for dictionary_key, dictionary_value in iphone_information_data.items():
-                        parsed_text_array.append(f"\t{convert_to_readable(dictionary_key)}\n\t{dictionary_value}\n")
+                        yield f"\t{convert_to_readable(dictionary_key)}\n\t{dictionary_value}\n"
 
                 else:
-                    parsed_text_array.append(
-                        f"{convert_to_readable(iphone_information_key)}:\n\t {iphone_information_data}\n")
-                parsed_text_array.append("\n")
+                    yield f"{convert_to_readable(iphone_information_key)}:\n\t {iphone_information_data}\n"
+                yield "\n"
         else:
-            parsed_text_array.append(storage_data)
+            yield str(storage_data)
 
-    return parsed_text_array
+
+def parse_storage_master_to_txt(storage_master):
+    """
+    Parse and return the given dictionary (storage_master) in a txt human readable file format
+    Builds the whole report in memory, use iterate_storage_master_txt to stream it instead
+    :param storage_master: Storage master containing dictionary with categories to values
+    :return parsed_text_array: Parsed text array is the formatted array of each row to print
+    """
+    return list(iterate_storage_master_txt(storage_master))
 
 
 def check_and_convert_illegal_xml_tag_start(tag):
@@ -101,56 +129,113 @@ def check_and_convert_illegal_xml_tag_start(tag):
     return f"{Constants.XML_IGNORE_CHARACTER_STRING}{tag}" if re.match('^\d', str(tag)) else tag
 
 
-def parse_storage_master_to_xml(storage_master):
+XML_ILLEGAL_CHARACTERS = re.compile(Constants.XML_ILLEGAL_CHARACTERS_PATTERN)
+"""
+Control characters XML 1.0 does not allow, even escaped (removed from element text)
+"""
+
+
+def iterate_xml_element(tag, value):
+    """
+    Yield the xml text of a single element and its children piece by piece (dictionaries become child elements, lists become Item elements)
+    :param tag: Element tag (converted with check_and_convert_illegal_xml_tag_start)
+    :param value: Element value
+    :return: Generator of xml text chunks
+    """
+    tag = check_and_convert_illegal_xml_tag_start(tag)
+    if isinstance(value, collections.abc.Mapping):
+        yield f"<{tag}>"
+        for child_key, child_value in value.items():
+            yield from iterate_xml_element(child_key, child_value)
+        yield f"</{tag}>"
+    elif is_row_collection(value):
+        yield f"<{tag}>"
+        for list_item in value:
+            yield from iterate_xml_element('Item', list_item)
+        yield f"</{tag}>"
+    else:
+        text = xml.sax.saxutils.escape(XML_ILLEGAL_CHARACTERS.sub('', str(value)))
+        yield f"<{tag}>{text}</{tag}>" if text else f"<{tag} />"
+
+
+def iterate_storage_master_xml(storage_master):
     """
-    Parse and return the given dictionary (storage_master) in a xml file format
-    :rtype: ElementTree
+    Yield the given dictionary (storage_master) in a xml file format, section by section and row by row, without building an element tree
     :param storage_master: Storage master containing dictionary with categories to values
-    :return root_elem: Element tree root element
+    :return: Generator of xml text chunks
     """
-    # TODO: Add this Parsing method into functions to allow for easier to read and less repeating code
-    root_elem = ElementTree.Element('root')
+    yield "<?xml version='1.0' encoding='utf-8'?>\n<root>"
+    for storage_category, storage_data in storage_master.items():
+        yield from iterate_xml_element(storage_category, storage_data)
+    yield "</root>\n"
+
+
+def convert_to_json_value(value):
+    """
+    Convert values json cannot encode (used as the json encoder default function)
+    Dates become ISO 8601 strings, bytes become base64 strings and plist UIDs become their integer value
+    :param value: Value to convert
+    :return: JSON serialisable value
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    elif isinstance(value, plistlib.UID):
+        return value.data
+    elif isinstance(value, collections.abc.Mapping):
+        return dict(value)
+    elif isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+JSON_LINES_ENCODER = json.JSONEncoder(default=convert_to_json_value, ensure_ascii=False)
+"""
+Encoder of the json lines output (one record per line, so no indentation)
+"""
+
 
+def iterate_storage_master_jsonl(storage_master, section_row_sources=None):
+    """
+    Yield the given dictionary (storage_master) in json lines format, one {"section": ..., "data": ...} record per line
+    Row collections give one record per row (read lazily, e.g. chunked database rows), any other section gives a single record
+    :param storage_master: Storage master containing dictionary with categories to values
+    :param section_row_sources: Dictionary of section name to a function returning the rows to write for that section instead of its storage master value (e.g. rows streamed from a database cursor)
+    :return: Generator of json lines (each ending with a new line)
+    """
+    section_row_sources = {} if section_row_sources is None else section_row_sources
     for storage_category, storage_data in storage_master.items():
-        title_elem = ElementTree.SubElement(root_elem, storage_category)
+        if is_row_collection(storage_data) and storage_category in section_row_sources:
+            storage_data = section_row_sources[storage_category]()
 
-        if isinstance(storage_data, list):
+        if is_row_collection(storage_data):
             for list_item in storage_data:
-                list_item_elem = ElementTree.SubElement(title_elem, 'Item')
-                if isinstance(list_item, dict):
-                    for iphone_information_key, iphone_information_data in list_item.items():
-                        iphone_information_key_elem = ElementTree.SubElement(list_item_elem, iphone_information_key)
-                        iphone_information_key_elem.text = str(iphone_information_data)
-                else:
-                    list_item_elem.text = str(iphone_information_data)
-        elif isinstance(storage_data, dict):
-            for iphone_information_key, iphone_information_data in storage_data.items():
-                if isinstance(iphone_information_data, dict):
-                    iphone_information_key_elem = ElementTree.SubElement(title_elem,
-                                                                         check_and_convert_illegal_xml_tag_start(
-                                                                             iphone_information_key))
-                    for dictionary_key, dictionary_value in iphone_information_data.items():
-                        if isinstance(dictionary_value, dict):
-                            for dictionary_key_2, dictionary_value_2 in dictionary_value.items():
-                                dictionary_key_2_elem = ElementTree.SubElement(dictionary_key_elem,
-                                                                               check_and_convert_illegal_xml_tag_start(
-                                                                                   dictionary_key_2))
-                                dictionary_key_2_elem.text = str(dictionary_value_2)
-
-                        else:
-                            dictionary_key_elem = ElementTree.SubElement(iphone_information_key_elem,
-                                                                         check_and_convert_illegal_xml_tag_start(
-                                                                             dictionary_key))
-                            dictionary_key_elem.text = str(dictionary_value)
-                else:
-                    iphone_information_key_elem = ElementTree.SubElement(title_elem,
-                                                                         check_and_convert_illegal_xml_tag_start(
-                                                                             iphone_information_key))
-                    iphone_information_key_elem.text = str(iphone_information_data)
+                yield JSON_LINES_ENCODER.encode({'section': storage_category, 'data': list_item}) + "\n"
         else:
-            title_elem.text = str(storage_data)
+            yield JSON_LINES_ENCODER.encode({'section': storage_category, 'data': storage_data}) + "\n"
 
-    return root_elem
+
+def write_chunks(file_pointer, chunks, block_size=Constants.DEFAULT_OUTPUT_BUFFER_SIZE, flush_blocks=False):
+    """
+    Write text chunks to a file pointer, joining them into blocks of roughly block_size characters first
+    :param file_pointer: File pointer (or std out) to write to
+    :param chunks: Iterable of text chunks
+    :param block_size: Approximate number of characters to write per write call
+    :param flush_blocks: Flush the file pointer after every block (so std output appears as it is formatted)
+    """
+    block = []
+    block_length = 0
+    for chunk in chunks:
+        block.append(chunk)
+        block_length += len(chunk)
+        if block_length >= block_size:
+            file_pointer.write(''.join(block))
+            if flush_blocks:
+                file_pointer.flush()
+            block = []
+            block_length = 0
+    file_pointer.write(''.join(block))
 
 
 def create_text_file(master_storage, text_output_file_path):
@@ -158,8 +243,8 @@ def create_text_file(master_storage, text_output_file_path):
     Create and print to a text file (requires array of dictionaries and desired txt file path)
     """
     try:
-        with open(text_output_file_path, 'w') as file_pointer:
-            file_pointer.write(''.join(parse_storage_master_to_txt(master_storage)))
+        with open(text_output_file_path, 'w', buffering=Constants.DEFAULT_OUTPUT_BUFFER_SIZE) as file_pointer:
+            write_chunks(file_pointer, iterate_storage_master_txt(master_storage))
 
         print(f"TXT file '{text_output_file_path}' written successfully")
         return True
@@ -174,11 +259,9 @@ def create_xml_file(master_storage, xml_output_file_path):
     """
     Create and print to an xml file (requires array of dictionaries and desired xml file path)
     """
-    root = parse_storage_master_to_xml(master_storage)
-    tree = ElementTree.ElementTree(root)
-
     try:
-        tree.write(xml_output_file_path)
+        with open(xml_output_file_path, 'w', encoding='utf-8', buffering=Constants.DEFAULT_OUTPUT_BUFFER_SIZE) as file_pointer:
+            write_chunks(file_pointer, iterate_storage_master_xml(master_storage))
         print()
         print(f"XML file '{xml_output_file_path} written successfully'")
     except:
@@ -186,61 +269,524 @@ def create_xml_file(master_storage, xml_output_file_path):
         raise
 
 
-def display_all_information(storage_master):
+def create_jsonl_file(master_storage, jsonl_output_file_path, section_row_sources=None):
     """
-    Displays all information within the master storage in a human readable txt format
+    Create and print to a json lines file, records are written as they are read so memory use stays flat
+    :param master_storage: Storage master containing dictionary with categories to values
+    :param jsonl_output_file_path: Desired json lines file path
+    :param section_row_sources: See iterate_storage_master_jsonl
     """
-    for element in parse_storage_master_to_txt(storage_master):
-        print(element, end='')
+    try:
+        with open(jsonl_output_file_path, 'w', encoding='utf-8', buffering=Constants.DEFAULT_OUTPUT_BUFFER_SIZE) as file_pointer:
+            write_chunks(file_pointer, iterate_storage_master_jsonl(master_storage, section_row_sources))
 
+        print(f"JSONL file '{jsonl_output_file_path}' written successfully")
+        return True
+    except IOError as err:
+        print("I/O error: {0}".format(err))
+    except:
+        print(f"JSONL file '{jsonl_output_file_path}' failed to write")
+        raise
 
-def main():
+
+def display_all_information(storage_master):
     """
-    Main method, program start, will only run if this script is the first run (due to if __name__ == '__main__':)
+    Displays all information within the master storage in a human readable txt format
     """
-    parser = argparse.ArgumentParser(description='Analyse IPhone backups.')
-    parser.add_argument('backup_paths', help='The path to the IPhone backup', nargs='+')
-    parser.add_argument('--xml_output_path', help='The path to the desired xml path', nargs='?',
-                        default=Constants.DEFAULT_XML_OUTPUT_PATH)
-    parser.add_argument('--txt_output_path', help='The path to the desired txt path', nargs='?',
-                        default=Constants.DEFAULT_TXT_OUTPUT_PATH)
-    parser.add_argument('--xml_output_file', help='Create an xml output file', action='store_true')
-    parser.add_argument('--txt_output_file', help='Create a txt output file', action='store_true')
-    parser.add_argument('--min_std_out', help='Set the std output to the minimum amount', action='store_true')
-    args = parser.parse_args()
-    args.backup_paths.pop(0)
+    write_chunks(sys.stdout, iterate_storage_master_txt(storage_master), Constants.DEFAULT_STD_OUT_BLOCK_SIZE, flush_blocks=True)
+    sys.stdout.flush()
 
-    for backup_path in args.backup_paths:
-        parsed_info_file = parse_plist_file(f'{backup_path}\{Constants.PLIST_FILE_INFO_NAME}')
-        parsed_manifest_file = parse_plist_file(f'{backup_path}\{Constants.PLIST_FILE_MANIFEST_NAME}')
-        parsed_status_file = parse_plist_file(f'{backup_path}\{Constants.PLIST_FILE_STATUS_NAME}')
 
+def process_backup(backup_path, args, file_blob_decode_workers=Constants.DEFAULT_FILE_BLOB_DECODE_WORKERS):
+    """
+    Parse a single backup and produce the requested outputs (stdout display, xml and txt files)
+    :param backup_path: Path to the IPhone backup
+    :param args: Parsed command line arguments
+    :param file_blob_decode_workers: Number of processes decoding the manifest file blobs
+    :return: List of output file paths written
+    """
+    profiler = stage_profiler.StageProfiler(
+        cprofile_stage_name=args.profile_cprofile_stage,
+        cprofile_output_path=f"{iphone_parser.IPhoneParser.get_backup_id(backup_path)}_{args.profile_cprofile_stage}.prof"
+    ) if args.profile else stage_profiler.NULL_STAGE_PROFILER
+
+    with profiler.stage('parse_plist_files') as stage_metrics:
+        parsed_info_file = parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_INFO_NAME))
+        parsed_manifest_file = parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_MANIFEST_NAME))
+        parsed_status_file = parse_plist_file(os.path.join(backup_path, Constants.PLIST_FILE_STATUS_NAME))
+        stage_metrics.add_files(3)
+
+    case_content_index_instance = case_content_index.CaseContentIndex(args.case_database) if args.case_database is not None else None
+    try:
         iphone_parser_instance = iphone_parser.IPhoneParser(
             backup_path,
             parsed_info_file,
             parsed_manifest_file,
-            parsed_status_file
+            parsed_status_file,
+            profiler=profiler,
+            case_content_index=case_content_index_instance,
+            file_blob_decode_workers=file_blob_decode_workers
         )
 
-        iphone_parser_instance.parse()
-        database_read_success = iphone_parser_instance.parse_and_index_all_iphone_files()
-        if database_read_success:
-            iphone_parser_instance.parse_indexed_files()
+        # Files are hashed before the sections are computed, so artifact extractors can reuse databases already extracted in the case
+        if args.hash_files:
+            hash_statistics = iphone_parser_instance.hash_iphone_content_files(sorted({*Constants.DEFAULT_HASH_ALGORITHMS, *args.hash_algorithms}))
+            print(f"Hashed {hash_statistics['hashed']} files ({hash_statistics['cached']} unchanged files from the hash cache, {hash_statistics['failed']} failed)")
+
+        # Sections are computed lazily, when specific sections are requested nothing else (e.g. the file indexing) is run
+        with profiler.stage('load_storage_master_sections'):
+            storage_master = iphone_parser_instance.get_storage_master(args.sections)
+            if args.sections is None:
+                storage_master.load_all_sections()
+
+        insert_statistics = iphone_parser_instance.database_handle.last_insert_statistics
+        if insert_statistics:
+            print(f"Indexed {insert_statistics['rows']} new files in {insert_statistics['seconds']:.2f} seconds "
+                  f"({insert_statistics['rows_per_second']:.0f} rows/s)")
+
+        if case_content_index_instance is not None and iphone_parser_instance.storage_master.is_section_loaded('iphone_file_contents'):
+            case_content_statistics = iphone_parser_instance.register_case_contents()
+            case_statistics = case_content_index_instance.get_case_statistics()
+            print(f"Case database '{args.case_database}': {case_content_statistics['new_contents']} new contents from this backup "
+                  f"({case_content_statistics['unhashed']} files not recorded as their content is not hashed yet, see --hash_files), "
+                  f"{case_statistics['contents']} unique contents across {case_statistics['occurrences']} files ({case_statistics['duplicated_contents']} duplicated)")
 
         if not args.min_std_out:
-            display_all_information(iphone_parser_instance.get_storage_master())
+            with profiler.stage('display_all_information'):
+                display_all_information(storage_master)
 
+        output_file_prefix = f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{iphone_parser_instance.get_iphone_system_information()['IMEI']}"
+        output_file_paths = []
         if args.xml_output_file:
-            create_xml_file(
-                iphone_parser_instance.get_storage_master(),
-                f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{iphone_parser_instance.get_iphone_system_information()['IMEI']}_{args.xml_output_path}"
-            )
+            xml_output_file_path = f"{output_file_prefix}_{args.xml_output_path}"
+            with profiler.stage('create_xml_file') as stage_metrics:
+                create_xml_file(storage_master, xml_output_file_path)
+                stage_metrics.add_files(1)
+            output_file_paths.append(xml_output_file_path)
 
         if args.txt_output_file:
-            create_text_file(
-                iphone_parser_instance.get_storage_master(),
-                f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{iphone_parser_instance.get_iphone_system_information()['IMEI']}_{args.txt_output_path}"
+            txt_output_file_path = f"{output_file_prefix}_{args.txt_output_path}"
+            with profiler.stage('create_text_file') as stage_metrics:
+                create_text_file(storage_master, txt_output_file_path)
+                stage_metrics.add_files(1)
+            output_file_paths.append(txt_output_file_path)
+
+        if args.jsonl_output_file:
+            jsonl_output_file_path = f"{output_file_prefix}_{args.jsonl_output_path}"
+            with profiler.stage('create_jsonl_file') as stage_metrics:
+                # Files are streamed from the file database (with their decoded metadata) rather than the in memory file table
+                create_jsonl_file(storage_master, jsonl_output_file_path, {
+                    'iphone_file_contents': iphone_parser_instance.iterate_iphone_content_file_records
+                })
+                stage_metrics.add_files(1)
+            output_file_paths.append(jsonl_output_file_path)
+
+        if args.profile:
+            profile_output_file_path = f"{output_file_prefix}_{args.profile_output_path}"
+            profiler.write_json_file(profile_output_file_path)
+            print(f"Profile file '{profile_output_file_path}' written successfully")
+            output_file_paths.append(profile_output_file_path)
+            if args.profile_cprofile_stage is not None:
+                output_file_paths.append(profiler.cprofile_output_path)
+
+        return output_file_paths
+    finally:
+        if case_content_index_instance is not None:
+            case_content_index_instance.close()
+
+
+class WorkerOutputWriter(io.TextIOBase):
+    """
+    Worker Output Writer class.
+    Text stream a process pool worker redirects its std output to, complete lines are sent to the parent process through a queue as they are written.
+    """
+    def __init__(self, backup_path, output_queue):
+        """
+        Initialization method.
+        :param backup_path: Path to the IPhone backup the worker processes (sent with every block of output).
+        :param output_queue: Queue shared with the parent process (multiprocessing manager queue).
+        """
+        self.backup_path = backup_path
+        self.output_queue = output_queue
+        self.pending_text = ''
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        """
+        Write text, everything up to the last line break is sent to the parent process (partial lines wait for the rest of the line).
+        :param text: Text to write.
+        :return: Number of characters written.
+        """
+        self.pending_text += text
+        line_end = self.pending_text.rfind('\n') + 1
+        if line_end:
+            self.output_queue.put((self.backup_path, self.pending_text[:line_end]))
+            self.pending_text = self.pending_text[line_end:]
+        return len(text)
+
+    def close(self):
+        """
+        Send any partial last line to the parent process, ended with a line break so the output of the next backup starts on its own line.
+        """
+        if self.pending_text:
+            self.output_queue.put((self.backup_path, f"{self.pending_text}\n"))
+            self.pending_text = ''
+        super().close()
+
+
+def process_backup_in_worker(backup_path, args, output_queue):
+    """
+    Process pool entry point, runs process_backup streaming its std output to the parent process and capturing any error so the parent process can report it
+    :param backup_path: Path to the IPhone backup
+    :param args: Parsed command line arguments
+    :param output_queue: Queue the std output is sent to (see WorkerOutputWriter)
+    :return: Result dictionary (backup_path, output_file_paths, error)
+    """
+    result = {'backup_path': backup_path, 'output_file_paths': [], 'error': None}
+    with WorkerOutputWriter(backup_path, output_queue) as std_out:
+        try:
+            with contextlib.redirect_stdout(std_out):
+                # The CPUs are shared between the args.jobs workers, so each worker decodes its file blobs with its share of them
+                result['output_file_paths'] = process_backup(backup_path, args, max(1, Constants.DEFAULT_FILE_BLOB_DECODE_WORKERS // args.jobs))
+        except Exception:
+            result['error'] = traceback.format_exc()
+    return result
+
+
+def print_worker_output(output_queue, last_backup_path):
+    """
+    Print the worker output waiting in the queue, with a header line whenever the output switches to another backup
+    :param output_queue: Queue the workers send their std output to
+    :param last_backup_path: Backup whose output was printed last (None before any output)
+    :return: Backup whose output was printed last
+    """
+    while True:
+        try:
+            backup_path, text = output_queue.get_nowait()
+        except queue.Empty:
+            return last_backup_path
+
+        if backup_path != last_backup_path:
+            print(f"=== {backup_path} ===")
+            last_backup_path = backup_path
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+def process_backups_in_parallel(backup_paths, args):
+    """
+    Process the given backups across a process pool of args.jobs workers, printing the output of every backup while it is processed
+    :param backup_paths: Paths to the IPhone backups
+    :param args: Parsed command line arguments
+    :return: List of result dictionaries (see process_backup_in_worker)
+    """
+    results = []
+    last_backup_path = None
+    with multiprocessing.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        output_queue = manager.Queue()
+        pending_futures = {executor.submit(process_backup_in_worker, backup_path, args, output_queue) for backup_path in backup_paths}
+        while pending_futures:
+            done_futures, pending_futures = concurrent.futures.wait(
+                pending_futures, timeout=Constants.DEFAULT_WORKER_OUTPUT_POLL_SECONDS, return_when=concurrent.futures.FIRST_COMPLETED
             )
+            # Finished workers have sent all their output, so it is printed before their result
+            last_backup_path = print_worker_output(output_queue, last_backup_path)
+            for future in done_futures:
+                result = future.result()
+                if result['error'] is not None:
+                    print(f"Backup '{result['backup_path']}' failed to process:\n{result['error']}")
+                    last_backup_path = None
+                results.append(result)
+
+    failed_backup_count = len([result for result in results if result['error'] is not None])
+    print(f"Processed {len(results) - failed_backup_count}/{len(results)} backups successfully")
+    return results
+
+
+def open_indexed_file_database(backup_path):
+    """
+    Open the file database of a backup for the subcommands working on an already indexed backup.
+    :param backup_path: Path to the IPhone backup
+    :return: IphoneFileDatabase or None (after printing why) if the backup has not been indexed
+    """
+    database_handle = iPhone_file_database.IphoneFileDatabase(backup_path, iphone_parser.IPhoneParser.get_backup_id(backup_path))
+    if database_handle.get_metadata_value('backup_uuid') is None:
+        print(f"Backup '{backup_path}' has not been indexed yet, run iminer.py on it first.")
+        database_handle.close_databases()
+        return None
+    return database_handle
+
+
+def search_backup(argv):
+    """
+    Search subcommand (iminer.py search backup_path query...), ranked full text search of the file paths or sms messages
+    of a backup that has already been indexed by a normal run.
+    :param argv: Command line arguments following the subcommand name.
+    """
+    parser = argparse.ArgumentParser(prog='iminer.py search', description='Full text search an indexed IPhone backup.')
+    parser.add_argument('backup_path', help='The path to the (already indexed) IPhone backup')
+    parser.add_argument('query', help='Search terms (every term must match, end a term with * for prefix matching)', nargs='+')
+    parser.add_argument('--index', help='Full text index to search', choices=Constants.FULL_TEXT_SEARCH_TARGETS, default='files')
+    parser.add_argument('--limit', help='Maximum number of hits to show', type=int, default=Constants.DEFAULT_FULL_TEXT_SEARCH_LIMIT)
+    parser.add_argument('--raw', help='Pass the query to SQLite FTS5 unchanged (AND/OR/NOT, NEAR, column filters...)', action='store_true')
+    args = parser.parse_args(argv)
+
+    database_handle = open_indexed_file_database(args.backup_path)
+    if database_handle is None:
+        return
+    try:
+        query = ' '.join(args.query)
+        if not args.raw:
+            query = database_handle.quote_full_text_query(query)
+
+        start_time = time.perf_counter()
+        hits = database_handle.search_full_text(query, args.index, args.limit)
+        milliseconds = (time.perf_counter() - start_time) * 1000
+        if hits is False:
+            return
+
+        for hit in hits:
+            if args.index == 'files':
+                print(f"{hit['rank']:.4g}\t{hit['domain']}\t{hit['relative_Path']}\t{hit['absolute_Path']}")
+            else:
+                print(f"{hit['rank']:.4g}\tmessage {hit['message_rowid']}\t{hit['snippet']}")
+        print(f"{len(hits)} hits in {milliseconds:.1f} ms")
+    finally:
+        database_handle.close_databases()
+
+
+def diff_backups(argv):
+    """
+    Diff subcommand (iminer.py diff old_backup_path new_backup_path), list the files added, removed or modified between two backups of the same device.
+    Both manifest.db files are streamed in fileID order and merge joined, changes are written as they are found.
+    :param argv: Command line arguments following the subcommand name.
+    """
+    parser = argparse.ArgumentParser(prog='iminer.py diff', description='Compare two IPhone backups of the same device.')
+    parser.add_argument('old_backup_path', help='The path to the older IPhone backup')
+    parser.add_argument('new_backup_path', help='The path to the newer IPhone backup')
+    parser.add_argument('--jsonl_output_path', help='Write the changes to this json lines file instead of the std output')
+    args = parser.parse_args(argv)
+
+    differ = backup_diff.BackupDiff(args.old_backup_path, args.new_backup_path)
+    try:
+        changes = differ.iterate_changes()
+        if changes is False:
+            return
+
+        if args.jsonl_output_path is not None:
+            with open(args.jsonl_output_path, 'w', encoding='utf-8', buffering=Constants.DEFAULT_OUTPUT_BUFFER_SIZE) as file_pointer:
+                write_chunks(file_pointer, (JSON_LINES_ENCODER.encode(change) + "\n" for change in changes))
+            print(f"JSONL file '{args.jsonl_output_path}' written successfully")
+        else:
+            write_chunks(sys.stdout, (
+                f"{change['change']}\t{change['domain']}\t{change['relative_Path']}\t{', '.join(change['changed_fields'])}\n"
+                for change in changes
+            ), Constants.DEFAULT_STD_OUT_BLOCK_SIZE, flush_blocks=True)
+
+        print(', '.join(f"{count} {change_type}" for change_type, count in differ.statistics.items()))
+    finally:
+        differ.close()
+
+
+def export_backup_files(argv):
+    """
+    Export subcommand (iminer.py export backup_path output_directory), copy the files of an indexed backup selected by domain,
+    file type or extension out of the hashed shard layout into a readable output_directory/domain/relative_Path tree.
+    :param argv: Command line arguments following the subcommand name.
+    """
+    parser = argparse.ArgumentParser(prog='iminer.py export', description='Export files of an indexed IPhone backup.')
+    parser.add_argument('backup_path', help='The path to the (already indexed) IPhone backup')
+    parser.add_argument('output_directory', help='Directory to recreate the domain/relative_Path tree in')
+    parser.add_argument('--domain', help='Only export files of these domains', nargs='+')
+    parser.add_argument('--domain_prefix', help='Only export files of domains starting with these prefixes (e.g. AppDomain-net.whatsapp)', nargs='+')
+    parser.add_argument('--file_type', help='Only export files of these detected types (e.g. sqlite jpg plist)', nargs='+')
+    parser.add_argument('--extension', help='Only export files with these extensions', nargs='+')
+    parser.add_argument('--link_duplicates', help='Hard link files with identical content (needs hashed files) to the first exported copy',
+                        action='store_true')
+    parser.add_argument('--workers', help='Number of files copied at once', type=int, default=Constants.DEFAULT_EXPORT_WORKERS)
+    parser.add_argument('--case_database', help='Case database recording the files exported from every backup of the case, '
+                                                'with --link_duplicates contents already exported from another backup are linked instead of copied')
+    args = parser.parse_args(argv)
+
+    database_handle = open_indexed_file_database(args.backup_path)
+    if database_handle is None:
+        return
+    case_content_index_instance = case_content_index.CaseContentIndex(args.case_database) if args.case_database is not None else None
+    try:
+        condition, parameters = database_handle.get_file_filter_condition(args.domain, args.domain_prefix, args.file_type, args.extension)
+        start_time = time.perf_counter()
+        statistics = file_exporter.export_file_database_contents(
+            database_handle, args.backup_path, args.output_directory, condition, parameters,
+            max_workers=args.workers, link_duplicates=args.link_duplicates, case_content_index=case_content_index_instance
+        )
+        seconds = time.perf_counter() - start_time
+        print(f"Exported {statistics['copied']} files ({statistics['bytes'] / 1024 ** 2:.1f} MB in {seconds:.1f} s) and linked {statistics['linked']} duplicates "
+              f"to '{args.output_directory}' ({statistics['skipped']} unsafe paths skipped, {statistics['failed']} failed)")
+    finally:
+        database_handle.close_databases()
+        if case_content_index_instance is not None:
+            case_content_index_instance.close()
+
+
+def parse_size_argument(size):
+    """
+    Parse a size command line argument, bytes with an optional K, M, G or T suffix (e.g. 10M)
+    :param size: Size string
+    :return: Size in bytes
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', size, re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size '{size}' (e.g. 512, 64K, 10M, 2G)")
+    return int(float(match.group(1)) * Constants.FILE_SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_time_argument(time_string):
+    """
+    Parse a time command line argument, unix time or an ISO 8601 date/time (taken as UTC unless it has a time zone)
+    :param time_string: Time string (e.g. 1577836800, 2020-01-01 or 2020-01-01T12:30:00+01:00)
+    :return: Unix time
+    """
+    try:
+        return int(time_string)
+    except ValueError:
+        pass
+    try:
+        parsed_time = datetime.datetime.fromisoformat(time_string)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{time_string}' (unix time or ISO 8601 date, e.g. 2020-01-31)")
+    if parsed_time.tzinfo is None:
+        parsed_time = parsed_time.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed_time.timestamp())
+
+
+def query_backup_files(argv):
+    """
+    Query subcommand (iminer.py query backup_path), list the files of an indexed backup matching domain, path glob, file type,
+    size and time filters. Filters are answered from the file database indexes and rows are written as they are read.
+    :param argv: Command line arguments following the subcommand name.
+    """
+    parser = argparse.ArgumentParser(prog='iminer.py query', description='Query the file database of an indexed IPhone backup.')
+    parser.add_argument('backup_path', help='The path to the (already indexed) IPhone backup')
+    parser.add_argument('--domain', help='Only files of these domains', nargs='+')
+    parser.add_argument('--domain_prefix', help='Only files of domains starting with these prefixes (e.g. AppDomain-net.whatsapp)', nargs='+')
+    parser.add_argument('--path', help='Only files whose relative path matches these globs (case sensitive, e.g. "Library/SMS/*")', nargs='+')
+    parser.add_argument('--file_type', help='Only files of these detected types (e.g. sqlite jpg plist)', nargs='+')
+    parser.add_argument('--extension', help='Only files with these extensions', nargs='+')
+    parser.add_argument('--min_size', help='Only files of at least this size (e.g. 10M)', type=parse_size_argument)
+    parser.add_argument('--max_size', help='Only files of at most this size (e.g. 64K)', type=parse_size_argument)
+    parser.add_argument('--modified_after', help='Only files last modified at or after this time (unix time or ISO 8601, UTC by default)', type=parse_time_argument)
+    parser.add_argument('--modified_before', help='Only files last modified before this time (unix time or ISO 8601, UTC by default)', type=parse_time_argument)
+    parser.add_argument('--columns', help='Columns to output', nargs='+', choices=Constants.DEFAULT_SQL_STORAGE_EXPORT_COLUMNS_LIST_FORM,
+                        default=Constants.DEFAULT_QUERY_COLUMNS)
+    parser.add_argument('--order_by', help='Column to sort on', choices=Constants.DEFAULT_SQL_STORAGE_EXPORT_COLUMNS_LIST_FORM)
+    parser.add_argument('--descending', help='Sort in descending order (with --order_by)', action='store_true')
+    parser.add_argument('--limit', help='Maximum number of files to output', type=int)
+    parser.add_argument('--format', help='Output format', choices=Constants.QUERY_OUTPUT_FORMATS, default=Constants.QUERY_OUTPUT_FORMATS[0])
+    parser.add_argument('--count', help='Only output the number of matching files', action='store_true')
+    args = parser.parse_args(argv)
+
+    database_handle = open_indexed_file_database(args.backup_path)
+    if database_handle is None:
+        return
+    try:
+        condition, parameters = database_handle.get_file_filter_condition(
+            args.domain, args.domain_prefix, args.file_type, args.extension, args.path,
+            args.min_size, args.max_size, args.modified_after, args.modified_before
+        )
+        start_time = time.perf_counter()
+        if args.count:
+            print(next(database_handle.iterate_file_table_rows(['COUNT(*)'], condition, parameters))[0])
+            return
+
+        order_by = f"{args.order_by} {'DESC' if args.descending else 'ASC'}" if args.order_by is not None else None
+        rows = database_handle.iterate_file_table_rows(args.columns, condition, parameters, order_by, args.limit)
+        row_count = 0
+
+        def iterate_output_lines():
+            nonlocal row_count
+            if args.format == 'jsonl':
+                for row in rows:
+                    row_count += 1
+                    yield JSON_LINES_ENCODER.encode(dict(zip(args.columns, row))) + "\n"
+                return
+
+            timestamp_column_indexes = [column_index for column_index, column in enumerate(args.columns) if column in Constants.FILE_TIMESTAMP_COLUMNS]
+            yield '\t'.join(args.columns) + "\n"
+            for row in rows:
+                row_count += 1
+                row = ['' if value is None else value for value in row]
+                for column_index in timestamp_column_indexes:
+                    if row[column_index] != '':
+                        row[column_index] = datetime.datetime.fromtimestamp(row[column_index], datetime.timezone.utc).isoformat()
+                yield '\t'.join(map(str, row)) + "\n"
+
+        write_chunks(sys.stdout, iterate_output_lines(), Constants.DEFAULT_STD_OUT_BLOCK_SIZE, flush_blocks=True)
+        sys.stdout.flush()
+        print(f"{row_count} files in {(time.perf_counter() - start_time) * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        database_handle.close_databases()
+
+
+SUBCOMMANDS = {
+    'search': search_backup,
+    'diff': diff_backups,
+    'export': export_backup_files,
+    'query': query_backup_files
+}
+"""
+Subcommands, selected by the first command line argument (any other first argument runs the normal backup analysis)
+"""
+
+
+def main():
+    """
+    Main method, program start, will only run if this script is the first run (due to if __name__ == '__main__':)
+    """
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description='Analyse IPhone backups.')
+    parser.add_argument('backup_paths', help='The path to the IPhone backup', nargs='+')
+    parser.add_argument('--xml_output_path', help='The path to the desired xml path', nargs='?',
+                        default=Constants.DEFAULT_XML_OUTPUT_PATH)
+    parser.add_argument('--txt_output_path', help='The path to the desired txt path', nargs='?',
+                        default=Constants.DEFAULT_TXT_OUTPUT_PATH)
+    parser.add_argument('--xml_output_file', help='Create an xml output file', action='store_true')
+    parser.add_argument('--txt_output_file', help='Create a txt output file', action='store_true')
+    parser.add_argument('--jsonl_output_path', help='The path to the desired json lines path', nargs='?',
+                        default=Constants.DEFAULT_JSONL_OUTPUT_PATH)
+    parser.add_argument('--jsonl_output_file', help='Create a json lines output file (one record per row per section)', action='store_true')
+    parser.add_argument('--min_std_out', help='Set the std output to the minimum amount', action='store_true')
+    parser.add_argument('--sections', help='Only compute and output the given storage sections (default all sections)',
+                        nargs='+', choices=Constants.STORAGE_MASTER_SECTIONS)
+    parser.add_argument('--hash_files', help='Hash every file in the backup into the iminer database (sha256 by default)',
+                        action='store_true')
+    parser.add_argument('--hash_algorithms', help='Extra hash algorithms to compute with --hash_files', nargs='+',
+                        choices=list(Constants.FILE_HASH_COLUMNS), default=[])
+    parser.add_argument('--case_database', help='Case database shared by the backups of a case, maps content hashes to every file they occur at '
+                                                'so duplicate contents are only analysed once (contents are hashed with --hash_files, '
+                                                'files unchanged since an earlier backup of the case are recognised without hashing)')
+    parser.add_argument('--profile', help='Record per stage metrics (wall time, rows, files, peak memory) to a JSON file',
+                        action='store_true')
+    parser.add_argument('--profile_output_path', help='The path to the desired profile JSON path', nargs='?',
+                        default=Constants.DEFAULT_PROFILE_OUTPUT_PATH)
+    parser.add_argument('--profile_cprofile_stage', help='Also dump cProfile stats (pstats format) of this stage (implies --profile)',
+                        choices=Constants.PROFILE_STAGES)
+    parser.add_argument('--jobs', help='Number of backups to process in parallel (uses a process pool when above 1)',
+                        type=int, default=Constants.DEFAULT_JOBS)
+    args = parser.parse_args()
+    args.backup_paths.pop(0)
+    if args.profile_cprofile_stage is not None:
+        args.profile = True
+
+    if args.jobs > 1 and len(args.backup_paths) > 1:
+        process_backups_in_parallel(args.backup_paths, args)
+    else:
+        for backup_path in args.backup_paths:
+            process_backup(backup_path, args)
 
 
 if __name__ == '__main__':
@@ -34,16 +34,27 @@
 # SnapshotState
 
 import Constants
+import artifact_extraction_scheduler
+import backup_shard_index
+import content_hasher
+import file_table
+import file_type_classifier
+import hashlib
 import iPhone_file_database
-import plistlib
+import lazy_storage_master
+import manifest_file_decoder
+import manifest_search_index
 import os
+import plistlib
+import stage_profiler
 
 # Initiation Method
 class IPhoneParser:
     """
        Parse and manage Iphone backup information.
     """
-    def __init__(self, backup_path, parsed_info_file, parsed_manifest_file, parsed_status_file):
+    def __init__(self, backup_path, parsed_info_file, parsed_manifest_file, parsed_status_file, backup_id=None, profiler=None, case_content_index=None,
+                 file_blob_decode_workers=Constants.DEFAULT_FILE_BLOB_DECODE_WORKERS):
         """
            Initiation method, initialised the given Iphone files and stores a dictionary in storage master.
            :rtype: object.
@@ -51,14 +62,59 @@ class IPhoneParser:
            :param parsed_info_file: Parsed information file dictionary.
            :param parsed_manifest_file: Parsed manifest file dictionary.
            :param parsed_status_file: Parsed status file dictionary.
+           :param backup_id: Id used to name the backup databases, defaults to an id derived from the backup path (see get_backup_id).
+           :param profiler: StageProfiler recording per stage metrics, defaults to a disabled profiler.
+           :param case_content_index: CaseContentIndex shared by the backups of the case, each unique (hashed) content is only analysed once and files matching the case on their metadata get a presumed content hash.
+           :param file_blob_decode_workers: Number of processes decoding the manifest file blobs (1 when the backup is already processed inside a process pool).
         """
         self.backup_path = backup_path
         self.parsed_info_file = parsed_info_file
         self.parsed_manifest_file = parsed_manifest_file
         self.parsed_status_file = parsed_status_file
-        self.storage_master = {}
-        self.id = '1'
-        self.database_handle = iPhone_file_database.IphoneFileDatabase(self.backup_path, self.id)
+        self.storage_master = lazy_storage_master.LazyStorageMaster()
+        self.profiler = profiler if profiler is not None else stage_profiler.NULL_STAGE_PROFILER
+        self.id = backup_id if backup_id is not None else self.get_backup_id(backup_path)
+        self.case_content_index = case_content_index
+        self.file_blob_decode_workers = file_blob_decode_workers
+        self.case_content_statistics = {}
+        self.artifact_content_hashes = {}
+        self.backup_shard_index = None
+        self.manifest_search_index = None
+        self.artifact_extraction_timings = {}
+        self.artifact_extraction_errors = {}
+        self.database_handle = iPhone_file_database.IphoneFileDatabase(self.backup_path, self.id, self.profiler)
+        self.register_storage_master_sections()
+
+    def register_storage_master_sections(self):
+        """
+        Register the loader of every storage master section, sections are computed the first time they are accessed.
+        """
+        section_loaders = {
+            'iphone_system_information': self.get_iphone_system_information,
+            'iphone_applications': self.get_iphone_applications,
+            'iphone_iTunes_information': self.get_iphone_iTunes_information,
+            'iphone_iBooks_information': self.get_iphone_iBooks_infomation,
+            'iphone_backup_information': self.get_backup_information,
+            'iphone_status_information': self.get_status_information,
+            'iphone_file_contents': self.parse_and_index_all_iphone_files,
+            'paired_devices': self.parse_indexed_files,
+            'voicemail_information': self.parse_indexed_files,
+            'sms_message_information': self.parse_indexed_files
+        }
+        for section_name in Constants.STORAGE_MASTER_SECTIONS:
+            self.storage_master.register_section(section_name, section_loaders[section_name])
+
+    @staticmethod
+    def get_backup_id(backup_path):
+        """
+        Return a stable id for the backup directory, used to name its databases so backups never share a database file.
+        The same backup path always gives the same id, so re-runs find their previous database for incremental re-indexing.
+        :param backup_path: Path to the IPhone backup directory.
+        :rtype: String.
+        :return: Hex id derived from the absolute backup path.
+        """
+        normalised_backup_path = os.path.normcase(os.path.abspath(backup_path))
+        return hashlib.sha1(normalised_backup_path.encode('utf-8')).hexdigest()[:Constants.BACKUP_ID_LENGTH]
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
@@ -380,7 +436,13 @@ class IPhoneParser:
         :param search_string: Search string to compare to the values in the manifest database
         :return: return the file dictionary if match found, else return False
         """
-        for file in self.storage_master['iphone_file_contents']:
+        iphone_file_contents = self.storage_master['iphone_file_contents']
+        if self.manifest_search_index is not None:
+            return self.manifest_search_index.search(column_to_search, search_string)
+        if not isinstance(iphone_file_contents, file_table.FileTable):
+            return False
+
+        for file in iphone_file_contents:
             if search_string in file[column_to_search]:
                 return file
         return False
@@ -404,6 +466,33 @@ class IPhoneParser:
         else:
             return ''
 
+    def parse_database_file_in_chunks(self, search_string, table_name):
+        """
+        Read from the database file specified from the relative IOS path and the database table name in bounded memory chunks
+        The table is read straight away (so read errors are raised here), the rows are then spooled to a temporary file
+        :param search_string: Search string to search in database for (Relative path to database file on IOS)
+        :param table_name: Table name in the database to read from
+        :return: Return a re-iterable ChunkedTableRows of dictionaries containing each column to the value, or '' if the file was not found
+        """
+        search_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2] # Relative path search
+        file_dict = self.search_manifest_database(search_column, search_string)
+        absolute_file_path = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[4]
+
+        if file_dict is False:
+            return ''
+
+        table_rows = iPhone_file_database.ChunkedTableRows(self.database_handle, file_dict[absolute_file_path], table_name)
+        content_hash = self.artifact_content_hashes.get(file_dict[Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]])
+        if self.case_content_index is None or content_hash is None:
+            return table_rows.load()
+
+        # A database content already extracted from another backup of the case is not read again
+        table_rows.load_encoded_chunks(self.case_content_index.iterate_artifact_chunks(content_hash, table_name))
+        if not table_rows.chunk_positions:
+            table_rows.load()
+            self.case_content_index.store_artifact_chunks(content_hash, table_name, table_rows.column_names, table_rows.iterate_encoded_chunks())
+        return table_rows
+
     def get_paired_devices(self):
         """
         Get paired devices information from Iphone backup
@@ -422,10 +511,10 @@ class IPhoneParser:
     def get_sms_message_information(self):
         """
         Get sms message information from Iphone backup via the sms.db file
-        :return: Return database rows containing SMS message information
+        :return: Return database rows containing SMS message information (read in chunks and spooled, iterated chunk by chunk)
         """
         # TODO: Parse all other tables within the sms.db database
-        return self.parse_database_file(Constants.SMS_MESSAGE_INFORMATION_DB_PATH, Constants.SMS_MESSAGE_INFORMATION_DB_TABLE)
+        return self.parse_database_file_in_chunks(Constants.SMS_MESSAGE_INFORMATION_DB_PATH, Constants.SMS_MESSAGE_INFORMATION_DB_TABLE)
 
     # Collection output methods
     def get_iphone_applications(self):
@@ -522,24 +611,36 @@ class IPhoneParser:
     def get_database_rows_iphone_content_files(self):
         """
         Return and store iphone content files in self.storage_master['iphone_file_contents']
-        :rtype: List of dictionaries
-        :return information: Database rows from file storage database
+        Rows are streamed from the file storage database into a compact column oriented FileTable (rather than a dictionary per file)
+        :rtype: FileTable
+        :return information: Database rows from file storage database (iterates as row mappings)
         """
-        information = []
-        for row_index, db_row in enumerate(self.database_handle.get_iminer_file_database()):
-            information.append({})
-
-            for column_index, column_name in enumerate(db_row):
-                information[row_index][Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[column_index]] = db_row[column_index]
+        information = file_table.FileTable(Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM)
+        for db_rows in self.database_handle.iterate_file_table_pages(information.column_names):
+            information.extend(db_rows)
 
         self.storage_master['iphone_file_contents'] = information
         return information
 
-    def get_storage_master(self):
+    def iterate_iphone_content_file_records(self, columns=Constants.DEFAULT_SQL_STORAGE_EXPORT_COLUMNS_LIST_FORM):
+        """
+        Stream the iphone content files from the file storage database page by page, including their decoded metadata and hashes
+        :param columns: File storage database columns to read
+        :return: Generator of file row dictionaries
+        """
+        for db_rows in self.database_handle.iterate_file_table_pages(columns):
+            for db_row in db_rows:
+                yield dict(zip(columns, db_row))
+
+    def get_storage_master(self, sections=None):
         """
         Return the master storage dictionary
+        :param sections: Section names to return, defaults to all sections (the lazy storage master itself)
+        :return: Lazy storage master, or a dictionary of only the given sections (only those sections are computed)
         """
-        return self.storage_master
+        if sections is None:
+            return self.storage_master
+        return {section_name: self.storage_master[section_name] for section_name in sections}
 
     def get_iphone_content_file_from_fileID(self, fileID):
         """
@@ -547,46 +648,119 @@ class IPhoneParser:
         :param fileID: FileID of the file
         :return: Content file absolute path or '' if failed
         """
-        if not os.path.isdir(f"{self.backup_path}\{fileID[:2]}"):
-            return ''
+        return self.get_backup_shard_index().get_absolute_path(fileID)
 
-        if os.path.exists(f"{self.backup_path}\{fileID[:2]}\{fileID}"):
-            return f"{self.backup_path}\{fileID[:2]}\{fileID}"
-        else:
-            return ''
+    def get_backup_shard_index(self):
+        """
+        Return the backup shard directory index, scanning the shard directories on first use
+        :rtype: BackupShardIndex
+        :return: Index of every content file in the backup
+        """
+        if self.backup_shard_index is None:
+            with self.profiler.stage('backup_shard_index') as stage_metrics:
+                self.backup_shard_index = backup_shard_index.BackupShardIndex(self.backup_path)
+                stage_metrics.add_files(len(self.backup_shard_index))
+        return self.backup_shard_index
 
     def analyse_iphone_content_files(self):
         """
         Parse and store Iphone content files in the @self.database_handle (IphoneFileDatabase object)
+        Re-runs against the same backup (Status.plist UUID) only index what changed in the manifest.db since the last run
+        The manifest file blobs of new and changed rows are decoded into the typed file metadata columns (size, timestamps...)
+        and their file type is detected from the file signature (magic bytes), falling back to the file extension
+        With a case content index, files whose content hash is already known are only classified once per unique content (no file is hashed here)
         :rtype: Bool
         :return: Return True if succeeded or False if failed
         """
-        manifest_db = self.database_handle.get_manifest_db()
-
-        if manifest_db is not False:
-            for db_row in self.database_handle.get_manifest_db():
-                absolute_path = self.get_iphone_content_file_from_fileID(db_row[0])
-                file_type = db_row[2].split('.')[-1] if '.' in db_row[2] else ''
-
-                self.database_handle.insert_table_row({
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]: db_row[0],
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[1]: db_row[1],
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2]: db_row[2],
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[3]: db_row[3],
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[4]: absolute_path,
-                    Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[5]: file_type
-                })
-
-            self.database_handle.commit_database_changes()
+        with self.profiler.stage('synchronise_file_database') as stage_metrics:
+            synchronise_statistics = self.database_handle.synchronise_file_database(
+                self.get_status_UUID(),
+                self.get_status_date(),
+                self.build_iphone_content_file_rows
+            )
+            if synchronise_statistics is not False:
+                stage_metrics.add_rows(synchronise_statistics['inserted'] + synchronise_statistics['changed'])
+
+        if synchronise_statistics is not False:
+            with self.profiler.stage('decode_file_blobs') as stage_metrics:
+                stage_metrics.add_rows(manifest_file_decoder.decode_file_database_blobs(self.database_handle, self.file_blob_decode_workers))
+            if self.case_content_index is not None:
+                self.find_known_case_contents()
+            with self.profiler.stage('classify_file_types') as stage_metrics:
+                stage_metrics.add_files(file_type_classifier.classify_file_database_contents(self.database_handle, case_content_index=self.case_content_index))
+            with self.profiler.stage('create_file_database_indexes'):
+                self.database_handle.create_file_database_indexes(
+                    analyse=synchronise_statistics['inserted'] + synchronise_statistics['removed'] + synchronise_statistics['changed'] > 0
+                )
             return True
         else:
             return False
 
+    def find_known_case_contents(self):
+        """
+        Fill in the content hash of files whose content is already known without reading them from the hash cache of the backup,
+        and the presumed content hash of files recorded in earlier backups of the case (same domain, relative path and manifest metadata)
+        Only the content hashes from the hash cache are verified, presumed hashes are never used to reuse case analysis results
+        :return: Number of files whose content hash was found in the hash cache
+        """
+        with self.profiler.stage('find_known_case_contents') as stage_metrics:
+            hash_statistics = content_hasher.hash_file_database_contents(self.database_handle, self.get_backup_shard_index(), ['sha256'], cached_only=True)
+            presumed_content_count = self.case_content_index.fill_presumed_content_hashes(self.database_handle)
+            stage_metrics.add_rows(hash_statistics['cached'] + presumed_content_count)
+        return hash_statistics['cached']
+
+    def register_case_contents(self):
+        """
+        Record the hashed files of the backup in the case content index (run after hashing, so contents hashed by hash_iphone_content_files are recorded)
+        :rtype: Dictionary
+        :return: Registration statistics (see CaseContentIndex.register_backup_contents)
+        """
+        with self.profiler.stage('register_case_contents') as stage_metrics:
+            self.case_content_statistics = self.case_content_index.register_backup_contents(self.database_handle, self.id)
+            stage_metrics.add_rows(self.case_content_statistics['occurrences'])
+        return self.case_content_statistics
+
+    def build_iphone_content_file_rows(self, manifest_db_rows):
+        """
+        Convert manifest.db rows into rows for the main storage database (ordered as the first six storage columns)
+        :param manifest_db_rows: Iterable of manifest.db rows (fileID, domain, relativePath, flags)
+        :return: Generator of storage database row tuples
+        """
+        for db_row in manifest_db_rows:
+            absolute_path = self.get_iphone_content_file_from_fileID(db_row[0])
+            file_type = file_type_classifier.get_file_extension(db_row[2])
+
+            yield db_row[0], db_row[1], db_row[2], db_row[3], absolute_path, file_type
+
+
+    def hash_iphone_content_files(self, algorithms=Constants.DEFAULT_HASH_ALGORITHMS):
+        """
+        Hash every indexed iphone content file into the file table hash columns (only changed files are read again on re-runs)
+        :param algorithms: Hash algorithms to compute (keys of Constants.FILE_HASH_COLUMNS)
+        :rtype: Dictionary
+        :return: Hash statistics (files hashed, served from the cache and failed)
+        """
+        # The files must be indexed before they can be hashed
+        self.storage_master['iphone_file_contents']
+        return self.hash_indexed_iphone_content_files(algorithms)
+
+    def hash_indexed_iphone_content_files(self, algorithms):
+        """
+        Hash the content files already in the file table (see hash_iphone_content_files)
+        :param algorithms: Hash algorithms to compute (keys of Constants.FILE_HASH_COLUMNS)
+        :rtype: Dictionary
+        :return: Hash statistics (files hashed, served from the cache and failed)
+        """
+        with self.profiler.stage('hash_iphone_content_files') as stage_metrics:
+            hash_statistics = content_hasher.hash_file_database_contents(self.database_handle, self.get_backup_shard_index(), algorithms)
+            stage_metrics.add_files(hash_statistics['hashed'])
+        return hash_statistics
 
     # Main parse method
     def parse(self):
         """
         Parse all iphone information from the initial instance declaration.
+        Sections are otherwise computed lazily on first access to the storage master.
         """
         self.get_iphone_system_information()
         self.get_iphone_applications()
@@ -599,22 +773,105 @@ class IPhoneParser:
         """
         Parse all iphone content files and save to both the storage master and the relavent iphone database
         """
-        content_files = self.analyse_iphone_content_files()
+        with self.profiler.stage('analyse_iphone_content_files'):
+            content_files = self.analyse_iphone_content_files()
         if content_files is not False:
-            self.get_database_rows_iphone_content_files()
+            with self.profiler.stage('get_database_rows_iphone_content_files') as stage_metrics:
+                stage_metrics.add_rows(len(self.get_database_rows_iphone_content_files()))
+            with self.profiler.stage('manifest_search_index') as stage_metrics:
+                self.manifest_search_index = manifest_search_index.ManifestSearchIndex(self.storage_master['iphone_file_contents'])
+                stage_metrics.add_rows(len(self.manifest_search_index.file_rows))
+            with self.profiler.stage('build_full_text_indexes') as stage_metrics:
+                stage_metrics.add_rows(self.build_full_text_indexes())
             return True
         else:
             self.storage_master['iphone_file_contents'] = 'Database read failed, check database is not encrypted.'
             return False
 
+    def build_full_text_indexes(self):
+        """
+        Build the FTS5 full text indexes over the file paths and the sms.db message bodies of the backup
+        The file path index is only rebuilt when files were added or removed, the sms index only when the sms.db file changed
+        :rtype: Int
+        :return: Number of messages indexed (0 if the sms index was up to date or could not be built)
+        """
+        synchronise_statistics = self.database_handle.last_synchronise_statistics
+        self.database_handle.build_file_full_text_index(
+            rebuild=synchronise_statistics.get('inserted', 0) + synchronise_statistics.get('removed', 0) > 0
+        )
+
+        search_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2] # Relative path search
+        file_dict = self.search_manifest_database(search_column, Constants.SMS_MESSAGE_INFORMATION_DB_PATH)
+        if file_dict is False:
+            return 0
+
+        absolute_file_path = file_dict[Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[4]]
+        file_stat = self.get_backup_shard_index().get_file_stat(file_dict[Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]])
+        if file_stat is None:
+            return 0
+
+        message_count = self.database_handle.build_sms_full_text_index(absolute_file_path, f"{absolute_file_path}|{file_stat[0]}|{file_stat[1]}")
+        return message_count if message_count is not False else 0
+
     def parse_indexed_files(self):
         """
-        Parse all indexed files (gather information like paired devices)
+        Parse all indexed files (gather information like paired devices), running the artifact extractors concurrently
+        Extractor failures are isolated (the section holds the error message) and recorded in self.artifact_extraction_errors
         :return: Void
         """
-        self.storage_master['paired_devices'] = self.get_paired_devices()
-        self.storage_master['voicemail_information'] = self.get_voicemail_information()
-        self.storage_master['sms_message_information'] = self.get_sms_message_information()
+        # The extractors search the indexed files, make sure they are indexed before the extractor threads start
+        self.storage_master['iphone_file_contents']
+        if self.case_content_index is not None:
+            self.artifact_content_hashes = self.get_artifact_content_hashes()
+
+        scheduler = self.get_artifact_extraction_scheduler()
+        with self.profiler.stage('parse_indexed_files') as stage_metrics:
+            for section_name, extracted_artifact in scheduler.run().items():
+                self.storage_master[section_name] = extracted_artifact
+                stage_metrics.add_files(1)
+
+        self.artifact_extraction_timings = scheduler.timings
+        self.artifact_extraction_errors = scheduler.errors
+
+    def get_artifact_content_hashes(self):
+        """
+        Hash the databases the artifact extractors read (before the extractor threads start, files unchanged since they were last hashed are served from the hash cache)
+        Extracted rows are only reused from the case for a verified content hash, never for a presumed one
+        :rtype: Dictionary
+        :return: FileID to sha256 hex digest of every artifact database present (and readable) in the backup
+        """
+        file_ID_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]
+        search_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2] # Relative path search
+        file_IDs = []
+        for artifact_db_path in (Constants.PAIRED_BLUETOOTH_DEVICES_DB_PATH, Constants.VOICEMAIL_INFORMATION_DB_PATH, Constants.SMS_MESSAGE_INFORMATION_DB_PATH):
+            file_dict = self.search_manifest_database(search_column, artifact_db_path)
+            if file_dict is not False:
+                file_IDs.append(file_dict[file_ID_column])
+        if not file_IDs:
+            return {}
+
+        content_hasher.hash_file_database_contents(self.database_handle, self.get_backup_shard_index(), ['sha256'], file_IDs=file_IDs)
+        sha256_column = Constants.FILE_HASH_COLUMNS['sha256']
+        absolute_path_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[4]
+        artifact_content_hashes = {}
+        for file_ID in file_IDs:
+            artifact_content_hashes.update(self.database_handle.iterate_file_table_rows(
+                [file_ID_column, sha256_column],
+                f"{file_ID_column} = ? AND {sha256_column} IS NOT NULL AND {absolute_path_column} != ''",
+                (file_ID,)
+            ))
+        return artifact_content_hashes
+
+    def get_artifact_extraction_scheduler(self):
+        """
+        Return an artifact extraction scheduler with every artifact extractor registered under its storage master section name
+        :rtype: ArtifactExtractionScheduler
+        """
+        scheduler = artifact_extraction_scheduler.ArtifactExtractionScheduler()
+        scheduler.register_extractor('paired_devices', self.get_paired_devices)
+        scheduler.register_extractor('voicemail_information', self.get_voicemail_information)
+        scheduler.register_extractor('sms_message_information', self.get_sms_message_information)
+        return scheduler
 
     # TODO: Use or remove unused methods
     # def print_database_rows_manifest(self):
@@ -0,0 +1,73 @@
+import collections.abc
+
+
+class LazyStorageMaster(collections.abc.MutableMapping):
+    """
+    Lazy Storage Master class.
+    Dictionary of storage categories to values where each category (section) can be registered with a loader,
+    the loader is only run the first time the section is accessed and its result is then cached.
+    Sections keep the order they were registered or set in.
+    """
+    def __init__(self):
+        """
+        Initialization method, start with no sections.
+        """
+        self.section_order = []
+        self.section_loaders = {}
+        self.sections = {}
+
+    def register_section(self, section_name, section_loader):
+        """
+        Register a section to be computed on first access.
+        :param section_name: Storage category name (e.g. iphone_system_information).
+        :param section_loader: Function without arguments returning the section value (it may also set the section itself).
+        """
+        if section_name not in self.section_order:
+            self.section_order.append(section_name)
+        self.section_loaders[section_name] = section_loader
+
+    def is_section_loaded(self, section_name):
+        """
+        Check whether a section has already been computed (or set).
+        :param section_name: Storage category name.
+        :rtype: Bool
+        """
+        return section_name in self.sections
+
+    def load_all_sections(self):
+        """
+        Compute every registered section that has not been computed yet.
+        """
+        for section_name in list(self.section_order):
+            self[section_name]
+
+    def __getitem__(self, section_name):
+        if section_name not in self.sections:
+            if section_name not in self.section_loaders:
+                raise KeyError(section_name)
+
+            section_value = self.section_loaders[section_name]()
+            if section_name not in self.sections:
+                self.sections[section_name] = section_value
+        return self.sections[section_name]
+
+    def __setitem__(self, section_name, section_value):
+        if section_name not in self.section_order:
+            self.section_order.append(section_name)
+        self.sections[section_name] = section_value
+
+    def __delitem__(self, section_name):
+        if section_name not in self.section_order:
+            raise KeyError(section_name)
+        self.section_order.remove(section_name)
+        self.section_loaders.pop(section_name, None)
+        self.sections.pop(section_name, None)
+
+    def __iter__(self):
+        return iter(list(self.section_order))
+
+    def __len__(self):
+        return len(self.section_order)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(self.section_order)})"
@@ -0,0 +1,81 @@
+import Constants
+import concurrent.futures
+import itertools
+import plistlib
+
+
+def decode_manifest_file_blob(file_blob):
+    """
+    Decode a manifest.db file blob (NSKeyedArchiver MBFile plist) into its metadata.
+    :param file_blob: Blob from the manifest.db Files table file column.
+    :rtype: Dictionary
+    :return: MBFile keys (Size, Mode, LastModified...) to values, or None if the blob could not be decoded.
+    """
+    try:
+        archive = plistlib.loads(file_blob)
+        archived_objects = archive['$objects']
+        return archived_objects[archive['$top']['root'].data]
+    except Exception:
+        return None
+
+
+def decode_manifest_file_blob_batch(file_rows):
+    """
+    Decode a batch of file blobs into typed column values (runs in the decoding processes).
+    :param file_rows: List of (file_ID, file blob) tuples.
+    :return: List of row tuples of the Constants.MANIFEST_FILE_BLOB_COLUMNS values and the decoded flag (0 with NULL values for blobs that failed to decode) followed by the file_ID.
+    """
+    decoded_rows = []
+    for file_ID, file_blob in file_rows:
+        mbfile = decode_manifest_file_blob(file_blob)
+        if mbfile is None:
+            decoded_rows.append((*[None] * len(Constants.MANIFEST_FILE_BLOB_COLUMNS), 0, file_ID))
+            continue
+
+        decoded_values = []
+        for mbfile_key in Constants.MANIFEST_FILE_BLOB_COLUMNS.values():
+            value = mbfile.get(mbfile_key)
+            decoded_values.append(value if isinstance(value, int) else None)
+        decoded_rows.append((*decoded_values, 1, file_ID))
+    return decoded_rows
+
+
+def decode_file_database_blobs(database_handle, max_workers=Constants.DEFAULT_FILE_BLOB_DECODE_WORKERS, batch_size=Constants.DEFAULT_FILE_BLOB_DECODE_BATCH_SIZE):
+    """
+    Decode every file blob of the file table that has not been decoded yet into the typed Constants.MANIFEST_FILE_BLOB_COLUMNS columns.
+    Batches of blobs are decoded across a process pool (one batch per worker at a time) and written back with bulk updates.
+    Blobs that fail to decode are flagged in Constants.MANIFEST_FILE_BLOB_DECODED_COLUMN so later runs do not decode them again.
+    :param database_handle: IphoneFileDatabase holding the file table.
+    :param max_workers: Number of decoding processes (1 decodes in this process), callers already running inside a process pool should pass 1 or their share of the CPUs.
+    :param batch_size: Number of blobs per decoding batch.
+    :return: Number of file blobs decoded (including blobs that failed to decode).
+    """
+    file_ID_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[0]
+    file_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[6]
+    decoded_columns = list(Constants.MANIFEST_FILE_BLOB_COLUMNS) + [Constants.MANIFEST_FILE_BLOB_DECODED_COLUMN]
+    pages = database_handle.iterate_file_table_pages(
+        [file_ID_column, file_column],
+        f"{file_column} IS NOT NULL AND {Constants.MANIFEST_FILE_BLOB_DECODED_COLUMN} IS NULL",
+        batch_size * max_workers
+    )
+
+    decoded_file_count = 0
+    first_page = next(pages, None)
+    if first_page is None:
+        return decoded_file_count
+
+    # Small tables (a single short page) are not worth starting a process pool for
+    if max_workers <= 1 or len(first_page) < batch_size:
+        for page in itertools.chain([first_page], pages):
+            decoded_rows = decode_manifest_file_blob_batch(page)
+            database_handle.update_file_table_rows(decoded_columns, decoded_rows)
+            decoded_file_count += len(decoded_rows)
+        return decoded_file_count
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for page in itertools.chain([first_page], pages):
+            batches = [page[batch_start:batch_start + batch_size] for batch_start in range(0, len(page), batch_size)]
+            for decoded_rows in executor.map(decode_manifest_file_blob_batch, batches):
+                database_handle.update_file_table_rows(decoded_columns, decoded_rows)
+                decoded_file_count += len(decoded_rows)
+    return decoded_file_count
@@ -0,0 +1,148 @@
+import Constants
+import array
+import bisect
+import file_table
+
+
+class SortedKeyView:
+    """
+    Sorted Key View class.
+    Read only sequence of the sort keys of rows listed in sorted order, computed on access so bisect can search it
+    without a list of every key being kept.
+    """
+    def __init__(self, sorted_row_indexes, get_key):
+        """
+        Initialization method.
+        :param sorted_row_indexes: Row indexes in sorted key order.
+        :param get_key: Function returning the sort key of a row index.
+        """
+        self.sorted_row_indexes = sorted_row_indexes
+        self.get_key = get_key
+
+    def __getitem__(self, position):
+        return self.get_key(self.sorted_row_indexes[position])
+
+    def __len__(self):
+        return len(self.sorted_row_indexes)
+
+
+class ManifestSearchIndex:
+    """
+    Manifest Search Index class.
+    Sorted indexes over the indexed iphone content files (storage_master['iphone_file_contents']),
+    built once so artifact lookups do not have to scan every file row.
+    Only row numbers are kept (two 4 byte arrays), lookups bisect them reading the values from the file table.
+    """
+    def __init__(self, file_rows):
+        """
+        Initialization method, build all indexes from the given file rows.
+        :param file_rows: FileTable, or iterable of file row dictionaries keyed on Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM.
+        """
+        self.domain_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[1]
+        self.relative_path_column = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2]
+
+        if not isinstance(file_rows, file_table.FileTable):
+            file_rows = file_table.FileTable.from_rows(file_rows)
+        self.file_rows = file_rows
+        self.domains = file_rows.columns[self.domain_column]
+        self.relative_paths = file_rows.columns[self.relative_path_column]
+
+        # Ties are broken on the row number, so equal keys keep the file table order
+        row_indexes = range(len(file_rows))
+        self.rows_by_domain = array.array('I', sorted(row_indexes, key=self.get_domain_key))
+        self.rows_by_reversed_relative_path = array.array('I', sorted(row_indexes, key=self.get_reversed_relative_path_key))
+        self.domain_keys = SortedKeyView(self.rows_by_domain, self.get_domain_key)
+        self.reversed_relative_path_keys = SortedKeyView(self.rows_by_reversed_relative_path, self.get_reversed_relative_path_key)
+
+    def get_domain_key(self, row_index):
+        """
+        Sort key of the domain index.
+        :param row_index: Row index in the file table.
+        :return: Tuple of (domain, row index).
+        """
+        return self.domains[row_index] or '', row_index
+
+    def get_reversed_relative_path_key(self, row_index):
+        """
+        Sort key of the path suffix index (the reversed relative path, so files sharing a path suffix sort next to each other).
+        :param row_index: Row index in the file table.
+        :return: Tuple of (reversed relative path, row index).
+        """
+        return (self.relative_paths[row_index] or '')[::-1], row_index
+
+    def find_rows_by_suffix(self, suffix):
+        """
+        Find the row indexes of all files whose relative path ends with the given path suffix (matched on whole path components).
+        :param suffix: Path suffix, e.g. 'SMS/sms.db' or 'sms.db'.
+        :return: Ascending list of row indexes.
+        """
+        reversed_suffix = suffix.strip('/')[::-1]
+        row_indexes = []
+        for position in range(bisect.bisect_left(self.reversed_relative_path_keys, (reversed_suffix, -1)), len(self.rows_by_reversed_relative_path)):
+            reversed_relative_path, row_index = self.reversed_relative_path_keys[position]
+            if not reversed_relative_path.startswith(reversed_suffix):
+                break
+            if len(reversed_relative_path) == len(reversed_suffix) or reversed_relative_path[len(reversed_suffix)] == '/':
+                row_indexes.append(row_index)
+        row_indexes.sort()
+        return row_indexes
+
+    def get_file(self, domain, relative_path):
+        """
+        Exact lookup of a file from its domain and relative path.
+        :param domain: IOS domain of the file (e.g. HomeDomain).
+        :param relative_path: Relative path of the file within the domain.
+        :return: File row mapping or None if not found.
+        """
+        for row_index in self.find_rows_by_suffix(relative_path):
+            if self.relative_paths[row_index] == relative_path and (self.domains[row_index] or '') == domain:
+                return self.file_rows[row_index]
+        return None
+
+    def find_by_suffix(self, suffix):
+        """
+        Find all files whose relative path ends with the given path suffix (matched on whole path components).
+        :param suffix: Path suffix, e.g. 'SMS/sms.db' or 'sms.db'.
+        :return: List of matching file row mappings.
+        """
+        return [self.file_rows[row_index] for row_index in self.find_rows_by_suffix(suffix)]
+
+    def find_by_domain_prefix(self, domain_prefix):
+        """
+        Find all files whose domain starts with the given prefix (e.g. 'AppDomain-net.whatsapp').
+        :param domain_prefix: Domain prefix to search for.
+        :return: List of matching file row mappings.
+        """
+        file_rows = []
+        for position in range(bisect.bisect_left(self.domain_keys, (domain_prefix, -1)), len(self.rows_by_domain)):
+            domain, row_index = self.domain_keys[position]
+            if not domain.startswith(domain_prefix):
+                break
+            file_rows.append(self.file_rows[row_index])
+        return file_rows
+
+    def search(self, column_to_search, search_string):
+        """
+        Return a file whose column value contains the search string, preferring the closest match:
+        on the relative path column the first file (in file table order) whose path equals the search string, else the first whose path ends
+        with it on whole path components (so 'sms.db' finds Library/SMS/sms.db rather than Library/SMS/sms.db-wal), on the domain column
+        the first file whose domain equals it. These are served from the indexes, otherwise (and for every other column)
+        the first file whose value contains the search string is returned from a linear scan.
+        :param column_to_search: Column to search.
+        :param search_string: Search string to compare to the column values.
+        :return: File row mapping if a match was found, else False
+        """
+        if column_to_search == self.relative_path_column:
+            row_indexes = self.find_rows_by_suffix(search_string)
+            exact_row_indexes = [row_index for row_index in row_indexes if self.relative_paths[row_index] == search_string]
+            if exact_row_indexes or row_indexes:
+                return self.file_rows[(exact_row_indexes or row_indexes)[0]]
+        elif column_to_search == self.domain_column:
+            position = bisect.bisect_left(self.domain_keys, (search_string, -1))
+            if position < len(self.rows_by_domain) and self.domain_keys[position][0] == search_string:
+                return self.file_rows[self.rows_by_domain[position]]
+
+        for row_index, value in enumerate(self.file_rows.iterate_column(column_to_search)):
+            if value is not None and search_string in value:
+                return self.file_rows[row_index]
+        return False
@@ -0,0 +1,152 @@
+import cProfile
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+class StageMetrics:
+    """
+    Stage Metrics class.
+    Metrics of a single profiled stage, stages that run several times accumulate into the same metrics.
+    """
+    def __init__(self, stage_name):
+        """
+        Initialization method.
+        :param stage_name: Name of the stage.
+        """
+        self.stage_name = stage_name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.files = 0
+        self.peak_memory_bytes = 0
+
+    def add_rows(self, row_count):
+        """
+        Record rows processed by the stage.
+        :param row_count: Number of rows.
+        """
+        self.rows += row_count
+
+    def add_files(self, file_count):
+        """
+        Record files touched (listed, read or written) by the stage.
+        :param file_count: Number of files.
+        """
+        self.files += file_count
+
+    def to_dictionary(self):
+        """
+        Return the metrics as a dictionary.
+        :rtype: Dictionary
+        """
+        return {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'rows_per_second': self.rows / self.seconds if self.seconds > 0 else 0.0,
+            'files': self.files,
+            'peak_memory_bytes': self.peak_memory_bytes
+        }
+
+
+class StageProfiler:
+    """
+    Stage Profiler class.
+    Records wall time, rows processed, files touched and peak traced memory (tracemalloc) per named stage,
+    optionally running cProfile over a single stage. A disabled profiler records nothing and costs next to nothing.
+    """
+    def __init__(self, enabled=True, cprofile_stage_name=None, cprofile_output_path=None):
+        """
+        Initialization method.
+        :param enabled: Record metrics (when False every stage is a no-op).
+        :param cprofile_stage_name: Name of the stage to run under cProfile (None for no cProfile output).
+        :param cprofile_output_path: Path the cProfile stats of that stage are dumped to (pstats format).
+        """
+        self.enabled = enabled
+        self.cprofile_stage_name = cprofile_stage_name
+        self.cprofile_output_path = cprofile_output_path
+        self.cprofile_profiler = None
+        self.stage_metrics = {}
+        self.stage_stack = []
+        self.peak_memory_bytes = 0
+        self.start_time = time.perf_counter()
+
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, stage_name):
+        """
+        Profile the code run within the with block as the given stage.
+        :param stage_name: Name of the stage.
+        :return: StageMetrics of the stage (to record rows and files on).
+        """
+        stage_metrics = self.stage_metrics.get(stage_name)
+        if stage_metrics is None:
+            stage_metrics = StageMetrics(stage_name)
+            if self.enabled:
+                self.stage_metrics[stage_name] = stage_metrics
+
+        if not self.enabled:
+            yield stage_metrics
+            return
+
+        # Peaks are tracked per stage, keep the enclosing stage's peak before resetting it for this one
+        if self.stage_stack:
+            self.stage_stack[-1][1] = max(self.stage_stack[-1][1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stage_frame = [stage_metrics, 0]
+        self.stage_stack.append(stage_frame)
+
+        cprofile_stage = stage_name == self.cprofile_stage_name and self.cprofile_profiler is None
+        if cprofile_stage:
+            self.cprofile_profiler = cProfile.Profile()
+            self.cprofile_profiler.enable()
+
+        start_time = time.perf_counter()
+        try:
+            yield stage_metrics
+        finally:
+            stage_metrics.seconds += time.perf_counter() - start_time
+            stage_metrics.calls += 1
+
+            if cprofile_stage:
+                self.cprofile_profiler.disable()
+                if self.cprofile_output_path is not None:
+                    self.cprofile_profiler.dump_stats(self.cprofile_output_path)
+
+            self.stage_stack.pop()
+            stage_peak = max(stage_frame[1], tracemalloc.get_traced_memory()[1])
+            stage_metrics.peak_memory_bytes = max(stage_metrics.peak_memory_bytes, stage_peak)
+            self.peak_memory_bytes = max(self.peak_memory_bytes, stage_peak)
+            if self.stage_stack:
+                self.stage_stack[-1][1] = max(self.stage_stack[-1][1], stage_peak)
+
+    def to_dictionary(self):
+        """
+        Return all recorded metrics as a dictionary.
+        The top level peak memory is the highest peak of the whole run (each stage resets the tracemalloc peak, so it is the maximum of the stage peaks
+        and the peak since the last stage started).
+        :rtype: Dictionary
+        """
+        return {
+            'total_seconds': time.perf_counter() - self.start_time,
+            'peak_memory_bytes': max(self.peak_memory_bytes, tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0),
+            'stages': {stage_name: stage_metrics.to_dictionary() for stage_name, stage_metrics in self.stage_metrics.items()}
+        }
+
+    def write_json_file(self, json_output_file_path):
+        """
+        Write all recorded metrics to a JSON file.
+        :param json_output_file_path: Path of the JSON file.
+        """
+        with open(json_output_file_path, 'w') as file_pointer:
+            json.dump(self.to_dictionary(), file_pointer, indent=4)
+
+
+NULL_STAGE_PROFILER = StageProfiler(enabled=False)
+"""
+Disabled profiler used when no profiler is given (records nothing)
+"""
@@ -0,0 +1,84 @@
+import os
+import pytest
+import Constants
+import iminer
+import iphone_parser
+from benchmarks import synthetic_backup
+
+"""
+.. module:: conftest.py
+   :synopsis: Shared fixtures, tests run against small synthetic backups (no real evidence needed)
+"""
+
+SYNTHETIC_BACKUP_FILE_COUNT = 200
+"""
+Number of content files of the synthetic test backups
+"""
+SYNTHETIC_BACKUP_MESSAGE_COUNT = 50
+"""
+Number of sms.db messages of the synthetic test backups
+"""
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch):
+    """
+    Run every test from its own temporary directory, the file databases are created in the working directory.
+    :return: Temporary working directory path
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope='session')
+def synthetic_backup_path(tmp_path_factory):
+    """
+    Synthetic backup shared by the tests that only read it.
+    :return: Backup path
+    """
+    backup_path = os.path.join(str(tmp_path_factory.mktemp('synthetic')), 'backup')
+    return synthetic_backup.create_synthetic_backup(backup_path, SYNTHETIC_BACKUP_FILE_COUNT, SYNTHETIC_BACKUP_MESSAGE_COUNT, voicemail_count=5)
+
+
+@pytest.fixture
+def mutable_backup_path(tmp_path):
+    """
+    Synthetic backup of the test alone, for tests changing the backup (its manifest.db, content files or location).
+    :return: Backup path
+    """
+    return synthetic_backup.create_synthetic_backup(os.path.join(str(tmp_path), 'backup'), 50, 10, voicemail_count=2)
+
+
+@pytest.fixture
+def create_iphone_parser():
+    """
+    Factory creating IPhoneParser objects for backups (decoding file blobs in process), their databases are closed after the test.
+    :return: Function of (backup_path, **IPhoneParser keyword arguments) returning an IPhoneParser
+    """
+    iphone_parser_instances = []
+
+    def create(backup_path, **parser_arguments):
+        iphone_parser_instance = iphone_parser.IPhoneParser(
+            backup_path,
+            *(iminer.parse_plist_file(os.path.join(backup_path, plist_file_name))
+              for plist_file_name in (Constants.PLIST_FILE_INFO_NAME, Constants.PLIST_FILE_MANIFEST_NAME, Constants.PLIST_FILE_STATUS_NAME)),
+            file_blob_decode_workers=1,
+            **parser_arguments
+        )
+        iphone_parser_instances.append(iphone_parser_instance)
+        return iphone_parser_instance
+
+    yield create
+    for iphone_parser_instance in iphone_parser_instances:
+        iphone_parser_instance.database_handle.close_databases()
+
+
+@pytest.fixture
+def indexed_database_handle(synthetic_backup_path, create_iphone_parser):
+    """
+    File database of the shared synthetic backup, indexed with decoded file metadata and detected file types.
+    :return: IphoneFileDatabase
+    """
+    iphone_parser_instance = create_iphone_parser(synthetic_backup_path)
+    iphone_parser_instance.analyse_iphone_content_files()
+    return iphone_parser_instance.database_handle
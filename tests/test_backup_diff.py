@@ -0,0 +1,89 @@
+import os
+import plistlib
+import shutil
+import sqlite3
+import Constants
+import backup_diff
+from benchmarks import synthetic_backup
+
+
+def create_manifest_row(file_ID, relative_path='Library/file', flags=1, file_blob=None):
+    """
+    Create a manifest.db Files row.
+    :return: Tuple of (fileID, domain, relativePath, flags, file)
+    """
+    return file_ID, 'HomeDomain', relative_path, flags, file_blob if file_blob is not None else synthetic_backup.create_mbfile_blob(10, 1577836800, 1)
+
+
+def set_mbfile_property(file_blob, mbfile_key, value):
+    """
+    Return a copy of a manifest file blob with one MBFile property set.
+    """
+    archive = plistlib.loads(file_blob)
+    archive['$objects'][1][mbfile_key] = value
+    return plistlib.dumps(archive, fmt=plistlib.FMT_BINARY)
+
+
+def merge(old_rows, new_rows):
+    """
+    Merge join two fileID ordered row lists.
+    :return: Tuple of (list of changes, statistics)
+    """
+    diff = backup_diff.BackupDiff('old', 'new')
+    old_rows, new_rows = iter(old_rows), iter(new_rows)
+    changes = list(diff.merge_rows(old_rows, new_rows, next(old_rows, None), next(new_rows, None)))
+    return [(change['change'], change['file_ID'], change['changed_fields']) for change in changes], diff.statistics
+
+
+def test_merge_rows_finds_added_removed_and_modified_files():
+    old_rows = [create_manifest_row('a'), create_manifest_row('b'), create_manifest_row('c'), create_manifest_row('e')]
+    new_rows = [create_manifest_row('b'), create_manifest_row('c', flags=2), create_manifest_row('d'), create_manifest_row('e')]
+
+    changes, statistics = merge(old_rows, new_rows)
+    assert changes == [('removed', 'a', []), ('modified', 'c', ['flags']), ('added', 'd', [])]
+    assert statistics == {'added': 1, 'removed': 1, 'modified': 1, 'unchanged': 2}
+
+
+def test_merge_rows_handles_empty_sides():
+    rows = [create_manifest_row('a'), create_manifest_row('b')]
+
+    assert merge([], rows)[0] == [('added', 'a', []), ('added', 'b', [])]
+    assert merge(rows, [])[0] == [('removed', 'a', []), ('removed', 'b', [])]
+    assert merge([], [])[0] == []
+
+
+def test_get_changed_fields_compares_decoded_file_metadata():
+    diff = backup_diff.BackupDiff('old', 'new')
+    old_row = create_manifest_row('a')
+
+    assert diff.get_changed_fields(old_row, create_manifest_row('a')) == []
+    assert diff.get_changed_fields(old_row, create_manifest_row('a', 'Library/moved')) == ['relative_Path']
+    new_row = create_manifest_row('a', file_blob=synthetic_backup.create_mbfile_blob(20, 1577836900, 1))
+    assert diff.get_changed_fields(old_row, new_row) == ['file_Size', 'file_Last_Modified', 'file_Last_Status_Change', 'file_Birth']
+
+
+def test_get_changed_fields_reports_blob_only_changes():
+    diff = backup_diff.BackupDiff('old', 'new')
+    old_row = create_manifest_row('a')
+
+    new_row = create_manifest_row('a', file_blob=set_mbfile_property(old_row[4], 'ExtendedAttributes', b'attributes'))
+    assert diff.get_changed_fields(old_row, new_row) == ['file']
+    assert diff.get_changed_fields(old_row, create_manifest_row('a', file_blob=b'not a plist')) == ['file']
+
+
+def test_iterate_changes_between_backups(mutable_backup_path):
+    new_backup_path = f"{mutable_backup_path}_new"
+    shutil.copytree(mutable_backup_path, new_backup_path)
+    manifest_connection = sqlite3.connect(os.path.join(new_backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME))
+    removed_file_ID, modified_file_ID = [file_ID for file_ID, in manifest_connection.execute("SELECT fileID FROM Files ORDER BY fileID LIMIT 2")]
+    manifest_connection.execute("DELETE FROM Files WHERE fileID = ?", (removed_file_ID,))
+    manifest_connection.execute("UPDATE Files SET flags = 4 WHERE fileID = ?", (modified_file_ID,))
+    manifest_connection.execute("INSERT INTO Files VALUES ('ffffffffffffffffffffffffffffffffffffffff', 'HomeDomain', 'new', 1, NULL)")
+    manifest_connection.commit()
+    manifest_connection.close()
+
+    diff = backup_diff.BackupDiff(mutable_backup_path, new_backup_path)
+    changes = [(change['change'], change['file_ID']) for change in diff.iterate_changes()]
+    diff.close()
+    assert changes == [('removed', removed_file_ID), ('modified', modified_file_ID), ('added', 'f' * 40)]
+    assert diff.statistics['unchanged'] == 51
@@ -0,0 +1,115 @@
+import os
+import shutil
+import sqlite3
+import pytest
+import Constants
+import case_content_index
+import iPhone_file_database
+from benchmarks import synthetic_backup
+
+
+SMS_DATABASE_FILE_ID = synthetic_backup.get_file_ID('HomeDomain', Constants.SMS_MESSAGE_INFORMATION_DB_PATH)
+"""
+FileID of the sms.db file of the synthetic backups
+"""
+
+
+@pytest.fixture
+def case_content_index_instance(tmp_path):
+    """
+    Case content index of the test alone.
+    :return: CaseContentIndex
+    """
+    case_content_index_instance = case_content_index.CaseContentIndex(os.path.join(str(tmp_path), 'case.db'))
+    yield case_content_index_instance
+    case_content_index_instance.close()
+
+
+def get_sms_texts(iphone_parser_instance):
+    """
+    Extract the sms.db message texts of a backup.
+    :return: List of message texts
+    """
+    return [message['text'] for message in iphone_parser_instance.storage_master['sms_message_information']]
+
+
+def get_sms_database_hashes(iphone_parser_instance):
+    """
+    Read the verified and presumed content hash of the sms.db file of a backup.
+    :return: (file_SHA256, file_Presumed_SHA256) tuple
+    """
+    return next(iphone_parser_instance.database_handle.iterate_file_table_rows(
+        [Constants.FILE_HASH_COLUMNS['sha256'], Constants.FILE_PRESUMED_SHA256_COLUMN], "file_ID = ?", (SMS_DATABASE_FILE_ID,)
+    ))
+
+
+def register_backup(iphone_parser_instance):
+    """
+    Hash, extract and record a backup in its case, as iminer does with --hash_files.
+    :return: The IPhoneParser
+    """
+    iphone_parser_instance.hash_iphone_content_files(['sha256'])
+    get_sms_texts(iphone_parser_instance)
+    iphone_parser_instance.register_case_contents()
+    return iphone_parser_instance
+
+
+def test_unchanged_files_get_a_presumed_hash(mutable_backup_path, create_iphone_parser, case_content_index_instance, tmp_path):
+    registered_iphone_parser_instance = register_backup(create_iphone_parser(mutable_backup_path, case_content_index=case_content_index_instance))
+    sha256_digest, presumed_sha256_digest = get_sms_database_hashes(registered_iphone_parser_instance)
+    copied_backup_path = shutil.copytree(mutable_backup_path, os.path.join(str(tmp_path), 'copied_backup'))
+
+    iphone_parser_instance = create_iphone_parser(copied_backup_path, case_content_index=case_content_index_instance)
+    iphone_parser_instance.storage_master['iphone_file_contents']
+
+    assert sha256_digest is not None and presumed_sha256_digest is None
+    assert get_sms_database_hashes(iphone_parser_instance) == (None, sha256_digest)
+
+
+def test_changed_content_with_unchanged_metadata_is_not_replayed(mutable_backup_path, create_iphone_parser, case_content_index_instance, tmp_path):
+    register_backup(create_iphone_parser(mutable_backup_path, case_content_index=case_content_index_instance))
+    copied_backup_path = shutil.copytree(mutable_backup_path, os.path.join(str(tmp_path), 'copied_backup'))
+    # The manifest.db metadata (size, timestamps and inode) of the copied sms.db is left as it was
+    sms_database_connection = sqlite3.connect(synthetic_backup.get_content_file_path(copied_backup_path, SMS_DATABASE_FILE_ID))
+    with sms_database_connection:
+        sms_database_connection.execute("UPDATE message SET text = 'changed' WHERE ROWID = 1")
+    sms_database_connection.close()
+
+    iphone_parser_instance = create_iphone_parser(copied_backup_path, case_content_index=case_content_index_instance)
+    iphone_parser_instance.storage_master['iphone_file_contents']
+    presumed_sha256_digest = get_sms_database_hashes(iphone_parser_instance)[1]
+
+    assert presumed_sha256_digest is not None
+    assert 'changed' in get_sms_texts(iphone_parser_instance)
+    assert get_sms_database_hashes(iphone_parser_instance)[0] not in (None, presumed_sha256_digest)
+
+
+def test_artifact_chunks_round_trip_as_json(case_content_index_instance):
+    rows = [(1, 'text', b'\x00\xffblob', 1.5, None), (2, '{"base64": "not bytes"}', b'', -0.0, 1 << 62)]
+    case_content_index_instance.store_artifact_chunks('0' * 64, 'message', ('ROWID', 'text', 'data', 'date', 'other'), [iPhone_file_database.encode_row_chunk(rows)])
+
+    (column_names, chunk_rows), = case_content_index_instance.iterate_artifact_chunks('0' * 64, 'message')
+    assert column_names == ('ROWID', 'text', 'data', 'date', 'other')
+    assert chunk_rows.startswith(b'[[')
+    assert [tuple(row) for row in iPhone_file_database.decode_row_chunk(chunk_rows)] == rows
+
+
+def test_occurrences_table_holds_the_metadata_columns(case_content_index_instance):
+    occurrence_columns = [column_information[1] for column_information in case_content_index_instance.case_database_cursor.execute(
+        f"PRAGMA table_info({Constants.CASE_CONTENT_OCCURRENCES_TABLE_NAME})"
+    )]
+    assert occurrence_columns[-len(Constants.CASE_CONTENT_METADATA_COLUMNS):] == Constants.CASE_CONTENT_METADATA_COLUMNS
+
+
+def test_case_lookups_bind_at_most_999_parameters(case_content_index_instance):
+    case_content_index_instance.case_database_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, Constants.SQL_MAX_VARIABLE_NUMBER)
+    sha256_digests = [f"{content_index:064x}" for content_index in range(2500)]
+    case_content_index_instance.case_database_cursor.executemany(
+        f"INSERT INTO {Constants.CASE_CONTENTS_TABLE_NAME} (sha256, file_Signature) VALUES (?, 'sqlite')", ((sha256,) for sha256 in sha256_digests[::2])
+    )
+    case_content_index_instance.record_exported_contents((sha256, 1, f"export/{sha256}") for sha256 in sha256_digests[::5])
+
+    assert len(case_content_index_instance.get_content_signatures(sha256_digests)) == 1250
+    exported_contents = case_content_index_instance.get_exported_contents((sha256, 1) for sha256 in sha256_digests)
+    assert len(exported_contents) == 500
+    assert exported_contents[(sha256_digests[0], 1)] == os.path.abspath(f"export/{sha256_digests[0]}")
@@ -0,0 +1,25 @@
+import concurrent.futures
+import os
+import sqlite3
+import evidence_connection_manager
+
+
+def test_connections_are_shared_across_threads_and_worker_pools(tmp_path):
+    db_file_path = os.path.join(str(tmp_path), 'evidence.db')
+    with sqlite3.connect(db_file_path) as db_database_connection:
+        db_database_connection.execute('CREATE TABLE message (text TEXT)')
+        db_database_connection.execute("INSERT INTO message VALUES ('hello')")
+    db_database_connection.close()
+    evidence_connections = evidence_connection_manager.EvidenceConnectionManager()
+
+    connections = set()
+    for run in range(3):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            connections.update(executor.map(lambda thread_index: evidence_connections.get_connection(db_file_path), range(8)))
+    assert connections == {evidence_connections.get_connection(os.path.relpath(db_file_path))}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        texts = list(executor.map(lambda thread_index: evidence_connections.get_connection(db_file_path).execute('SELECT text FROM message').fetchone(), range(8)))
+    assert texts == [('hello',)] * 8
+    evidence_connections.close_connections()
+    assert evidence_connections.connections == {}
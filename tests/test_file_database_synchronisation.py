@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import Constants
+import iPhone_file_database
+import manifest_file_decoder
+from benchmarks import synthetic_backup
+
+
+def create_row_builder(backup_path):
+    """
+    Create a build_rows function for synchronise_file_database resolving content files within the given backup.
+    :param backup_path: Path to the iphone backup directory.
+    :return: Function converting manifest rows into file table rows
+    """
+    def build_rows(manifest_rows):
+        for file_ID, domain, relative_path, flags in manifest_rows:
+            yield file_ID, domain, relative_path, flags, os.path.join(backup_path, file_ID[:2], file_ID), 'txt'
+    return build_rows
+
+
+def change_manifest(backup_path, sql_commands):
+    """
+    Run SQL commands against the manifest.db of a backup.
+    :param backup_path: Path to the iphone backup directory.
+    :param sql_commands: List of (sql command, parameters) tuples.
+    """
+    manifest_connection = sqlite3.connect(os.path.join(backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME))
+    try:
+        for sql_command, parameters in sql_commands:
+            manifest_connection.execute(sql_command, parameters)
+        manifest_connection.commit()
+    finally:
+        manifest_connection.close()
+
+
+def get_file_table_values(database_handle, columns):
+    """
+    Read columns of every file table row keyed on file_ID.
+    :param database_handle: IphoneFileDatabase holding the file table.
+    :param columns: Columns to read.
+    :return: Dictionary of file_ID to tuple of column values
+    """
+    sql_command = f"SELECT {', '.join(['file_ID', *columns])} FROM {database_handle.file_database_table_name}"
+    return {row[0]: row[1:] for row in database_handle.file_database_cursor.execute(sql_command)}
+
+
+def test_synchronise_inserts_every_file_then_is_up_to_date(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    build_rows = create_row_builder(mutable_backup_path)
+
+    statistics = database_handle.synchronise_file_database('uuid', 'date 1', build_rows)
+    assert statistics == {'inserted': 53, 'removed': 0, 'changed': 0, 'relocated': 0, 'up_to_date': False}
+    assert all(file_blob is not None for file_blob, in get_file_table_values(database_handle, ['file']).values())
+
+    statistics = database_handle.synchronise_file_database('uuid', 'date 1', build_rows)
+    assert statistics == {'inserted': 0, 'removed': 0, 'changed': 0, 'relocated': 0, 'up_to_date': True}
+    database_handle.close_databases()
+
+
+def test_synchronise_counts_inserted_removed_and_changed_files(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    build_rows = create_row_builder(mutable_backup_path)
+    database_handle.synchronise_file_database('uuid', 'date 1', build_rows)
+    manifest_file_decoder.decode_file_database_blobs(database_handle, max_workers=1)
+
+    file_IDs = sorted(get_file_table_values(database_handle, []))
+    removed_file_IDs, flag_changed_file_IDs, blob_changed_file_IDs = file_IDs[:3], file_IDs[3:5], file_IDs[5:7]
+    added_file_IDs = [synthetic_backup.get_file_ID('HomeDomain', f"new/{file_index}") for file_index in range(2)]
+    change_manifest(mutable_backup_path, [
+        *(("DELETE FROM Files WHERE fileID = ?", (file_ID,)) for file_ID in removed_file_IDs),
+        *(("UPDATE Files SET flags = 4 WHERE fileID = ?", (file_ID,)) for file_ID in flag_changed_file_IDs),
+        *(("UPDATE Files SET file = ? WHERE fileID = ?", (synthetic_backup.create_mbfile_blob(1, 1, 1), file_ID)) for file_ID in blob_changed_file_IDs),
+        *(("INSERT INTO Files VALUES (?, 'HomeDomain', ?, 1, ?)", (file_ID, f"new/{file_index}", synthetic_backup.create_mbfile_blob(2, 2, 2)))
+          for file_index, file_ID in enumerate(added_file_IDs))
+    ])
+
+    statistics = database_handle.synchronise_file_database('uuid', 'date 2', build_rows)
+    assert statistics == {'inserted': 2, 'removed': 3, 'changed': 4, 'relocated': 0, 'up_to_date': False}
+
+    file_table_values = get_file_table_values(database_handle, ['flags', 'file', 'file_Size'])
+    assert len(file_table_values) == 52
+    assert not set(removed_file_IDs) & set(file_table_values)
+    assert all(file_table_values[file_ID][0] == 4 for file_ID in flag_changed_file_IDs)
+    # Changed rows get their derived columns reset, new rows get their file blob copied from the manifest.db
+    assert all(file_table_values[file_ID][2] is None for file_ID in flag_changed_file_IDs + blob_changed_file_IDs + added_file_IDs)
+    assert all(file_table_values[file_ID][1] == synthetic_backup.create_mbfile_blob(2, 2, 2) for file_ID in added_file_IDs)
+    assert manifest_file_decoder.decode_file_database_blobs(database_handle, max_workers=1) == 6
+    database_handle.close_databases()
+
+
+def test_synchronise_clears_the_table_for_another_backup(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    build_rows = create_row_builder(mutable_backup_path)
+    database_handle.synchronise_file_database('uuid', 'date 1', build_rows)
+
+    statistics = database_handle.synchronise_file_database('other uuid', 'date 1', build_rows)
+    assert statistics == {'inserted': 53, 'removed': 0, 'changed': 0, 'relocated': 0, 'up_to_date': False}
+    database_handle.close_databases()
+
+
+def test_synchronise_resolves_the_paths_of_a_moved_backup_again(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    database_handle.synchronise_file_database('uuid', 'date 1', create_row_builder(mutable_backup_path))
+    database_handle.close_databases()
+
+    moved_backup_path = f"{mutable_backup_path}_moved"
+    shutil.move(mutable_backup_path, moved_backup_path)
+    database_handle = iPhone_file_database.IphoneFileDatabase(moved_backup_path, 'synchronise')
+    statistics = database_handle.synchronise_file_database('uuid', 'date 1', create_row_builder(moved_backup_path))
+
+    assert statistics == {'inserted': 0, 'removed': 0, 'changed': 0, 'relocated': 53, 'up_to_date': True}
+    absolute_paths = [absolute_path for absolute_path, in get_file_table_values(database_handle, ['absolute_Path']).values()]
+    assert all(absolute_path.startswith(moved_backup_path + os.sep) for absolute_path in absolute_paths)
+    database_handle.close_databases()
+
+
+def test_metadata_keys_are_scoped_to_the_file_table(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    database_handle.synchronise_file_database('uuid', 'date 1', create_row_builder(mutable_backup_path))
+
+    sql_command = f"SELECT key FROM {Constants.DEFAULT_SQL_METADATA_TABLE_NAME}"
+    metadata_keys = [key for key, in database_handle.file_database_cursor.execute(sql_command)]
+    assert f"{database_handle.file_database_table_name}.backup_uuid" in metadata_keys
+    assert all(key.startswith(f"{database_handle.file_database_table_name}.") for key in metadata_keys)
+    assert database_handle.get_metadata_value('backup_uuid') == 'uuid'
+    database_handle.close_databases()
+
+
+def test_hash_cache_lookups_bind_at_most_999_parameters(mutable_backup_path):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'synchronise')
+    database_handle.file_database_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, Constants.SQL_MAX_VARIABLE_NUMBER)
+    absolute_paths = [f"/backup/{path_index:04}" for path_index in range(2500)]
+    database_handle.update_hash_cache((absolute_path, 1, 2, {'sha256': absolute_path[-4:]}) for absolute_path in absolute_paths[::2])
+
+    hash_cache_entries = database_handle.get_hash_cache_entries(absolute_paths)
+    assert len(hash_cache_entries) == 1250
+    assert hash_cache_entries['/backup/2498'] == (1, 2, {'sha256': '2498', 'md5': None, 'sha1': None})
+    database_handle.close_databases()
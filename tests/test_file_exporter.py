@@ -0,0 +1,85 @@
+import os
+import pytest
+import file_exporter
+
+
+def select_relative_paths(database_handle, **filters):
+    """
+    Select the relative paths of the file table rows matching get_file_filter_condition filters.
+    :return: Set of relative paths
+    """
+    condition, parameters = database_handle.get_file_filter_condition(**filters)
+    return {relative_path for relative_path, in database_handle.iterate_file_table_rows(['relative_Path'], condition, parameters)}
+
+
+def select_matching_relative_paths(database_handle, row_filter):
+    """
+    Select the relative paths of the file table rows a python filter function accepts.
+    :param row_filter: Function of (domain, relative_Path, file_Type, file_Size, file_Last_Modified).
+    :return: Set of relative paths
+    """
+    columns = ['domain', 'relative_Path', 'file_Type', 'file_Size', 'file_Last_Modified']
+    return {row[1] for row in database_handle.iterate_file_table_rows(columns) if row_filter(*row)}
+
+
+@pytest.mark.parametrize('domain, relative_path, expected_components', [
+    ('HomeDomain', 'Library/SMS/sms.db', ['HomeDomain', 'Library', 'SMS', 'sms.db']),
+    ('HomeDomain', 'Library//./SMS/sms.db', ['HomeDomain', 'Library', 'SMS', 'sms.db']),
+    ('AppDomain-net.whatsapp.WhatsApp', 'Documents/ChatStorage.sqlite', ['AppDomain-net.whatsapp.WhatsApp', 'Documents', 'ChatStorage.sqlite'])
+])
+def test_get_export_path(domain, relative_path, expected_components):
+    assert file_exporter.get_export_path('export', domain, relative_path) == os.path.join('export', *expected_components)
+
+
+@pytest.mark.parametrize('domain, relative_path', [
+    ('HomeDomain', '../../etc/passwd'),
+    ('HomeDomain', 'Library/../../outside'),
+    ('..', 'file'),
+    ('HomeDomain', ''),
+    ('', 'file'),
+    (None, None),
+    ('Home' + os.sep + 'Domain', 'file')
+])
+def test_get_export_path_refuses_unsafe_paths(domain, relative_path):
+    assert file_exporter.get_export_path('export', domain, relative_path) is None
+
+
+def test_get_file_filter_condition_without_filters_matches_everything(indexed_database_handle):
+    assert indexed_database_handle.get_file_filter_condition() == ('1', ())
+    assert select_relative_paths(indexed_database_handle) == select_matching_relative_paths(indexed_database_handle, lambda *row: True)
+
+
+@pytest.mark.parametrize('filters, row_filter', [
+    ({'domains': ['HomeDomain', 'MediaDomain']}, lambda domain, *row: domain in ('HomeDomain', 'MediaDomain')),
+    ({'domain_prefixes': ['AppDomain']}, lambda domain, *row: domain.startswith('AppDomain')),
+    ({'domain_prefixes': ['']}, lambda *row: True),
+    ({'domains': ['MediaDomain'], 'domain_prefixes': ['AppDomainGroup']},
+     lambda domain, *row: domain == 'MediaDomain' or domain.startswith('AppDomainGroup')),
+    ({'file_types': ['jpg', 'heic']}, lambda domain, relative_path, file_type, *row: file_type in ('jpg', 'heic')),
+    ({'extensions': ['JPG']}, lambda domain, relative_path, *row: relative_path.lower().endswith('.jpg')),
+    ({'relative_path_globs': ['Library/Synthetic/1/*']}, lambda domain, relative_path, *row: relative_path.startswith('Library/Synthetic/1/')),
+    ({'minimum_size': 1000, 'maximum_size': 2000}, lambda domain, relative_path, file_type, file_size, *row: 1000 <= file_size <= 2000),
+    ({'modified_after': 1577836850, 'modified_before': 1577836900},
+     lambda domain, relative_path, file_type, file_size, last_modified: 1577836850 <= last_modified < 1577836900),
+    ({'domain_prefixes': ['AppDomain'], 'file_types': ['plist'], 'minimum_size': 2048},
+     lambda domain, relative_path, file_type, file_size, *row: domain.startswith('AppDomain') and file_type == 'plist' and file_size >= 2048)
+])
+def test_get_file_filter_condition(indexed_database_handle, filters, row_filter):
+    expected_relative_paths = select_matching_relative_paths(indexed_database_handle, row_filter)
+    assert expected_relative_paths
+    assert select_relative_paths(indexed_database_handle, **filters) == expected_relative_paths
+
+
+def test_get_file_filter_condition_escapes_like_wildcards(indexed_database_handle):
+    assert select_relative_paths(indexed_database_handle, extensions=['jp_']) == set()
+
+
+def test_export_file_database_contents(indexed_database_handle, synthetic_backup_path, working_directory):
+    condition, parameters = indexed_database_handle.get_file_filter_condition(domains=['HomeDomain'])
+    output_directory = os.path.join(str(working_directory), 'export')
+    statistics = file_exporter.export_file_database_contents(indexed_database_handle, synthetic_backup_path, output_directory, condition, parameters)
+
+    exported_relative_paths = select_relative_paths(indexed_database_handle, domains=['HomeDomain'])
+    assert statistics['copied'] == len(exported_relative_paths) and statistics['failed'] == 0
+    for relative_path in exported_relative_paths:
+        assert os.path.isfile(os.path.join(output_directory, 'HomeDomain', *relative_path.split('/')))
@@ -0,0 +1,79 @@
+import os
+import pytest
+import sqlite3
+import Constants
+import file_table
+
+
+def read_manifest_rows(backup_path):
+    """
+    Read the manifest.db rows of a backup as file table rows (first six storage columns).
+    :param backup_path: Path to the iphone backup directory.
+    :return: List of row tuples
+    """
+    manifest_connection = sqlite3.connect(os.path.join(backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME))
+    try:
+        manifest_rows = manifest_connection.execute(f"SELECT fileID, domain, relativePath, flags FROM {Constants.IPHONE_BACKUP_MANIFEST_TABLE_NAME}").fetchall()
+    finally:
+        manifest_connection.close()
+    return [
+        (file_ID, domain, relative_path, flags, os.path.join(backup_path, file_ID[:2], file_ID), relative_path.rsplit('.', 1)[-1] if '.' in relative_path else '')
+        for file_ID, domain, relative_path, flags in manifest_rows
+    ]
+
+
+def test_file_table_round_trips_backup_rows(synthetic_backup_path):
+    rows = read_manifest_rows(synthetic_backup_path)
+    table = file_table.FileTable.from_rows(rows)
+
+    assert len(table) == len(rows)
+    assert [tuple(record.values()) for record in table] == rows
+    assert list(table.iterate_column('domain')) == [row[1] for row in rows]
+    assert dict(table[0]) == dict(zip(Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM, rows[0]))
+
+
+def test_file_table_from_row_mappings():
+    rows = [{'file_ID': 'a' * 40, 'domain': 'HomeDomain', 'relative_Path': 'Library/SMS/sms.db'}]
+    table = file_table.FileTable.from_rows(rows, ['file_ID', 'domain', 'relative_Path'])
+
+    assert dict(table[0]) == rows[0]
+
+
+def test_file_table_keeps_none_and_irregular_values():
+    rows = [
+        ('not-a-file-id', None, 'café/résumé.txt', 1, None, None),
+        ('ABCDEF' * 7, 'HomeDomain', '', 2, '', ''),
+        ('0' * 40, 'HomeDomain', None, None, 'relative_file', 'db')
+    ]
+    table = file_table.FileTable.from_rows(rows)
+
+    assert [tuple(record.values()) for record in table] == rows
+
+
+def test_file_table_indexing():
+    rows = [(f"{row_index:040x}", 'HomeDomain', f"file_{row_index}", 1, f"/backup/00/{row_index:040x}", '') for row_index in range(5)]
+    table = file_table.FileTable.from_rows(rows)
+
+    assert table[-1]['relative_Path'] == 'file_4'
+    assert [record['relative_Path'] for record in table[1:4:2]] == ['file_1', 'file_3']
+    with pytest.raises(IndexError):
+        table[5]
+
+
+def test_path_column_splits_directories_and_file_names():
+    paths = [
+        f"/backup/ab/{'ab' * 20}",
+        os.path.join('backup', 'cd', 'cd' * 20),
+        'file_without_directory',
+        '/backup/ab/not-hex-name.txt',
+        None,
+        ''
+    ]
+    column = file_table.PathColumn()
+    for path in paths:
+        column.append(path)
+
+    assert len(column) == len(paths)
+    assert [column[row_index] for row_index in range(len(paths))] == paths
+    # Directories are stored once, shared by every path in them
+    assert len(column.directories.values) == 4
@@ -0,0 +1,72 @@
+import os
+import struct
+import pytest
+import Constants
+import file_type_classifier
+from benchmarks import synthetic_backup
+
+
+def create_bmp_header(file_size=70, pixel_data_offset=54, dib_header_size=40, reserved=0):
+    """
+    Create a bitmap file header followed by the start of its DIB header.
+    """
+    return b'BM' + struct.pack('<IIII', file_size, reserved, pixel_data_offset, dib_header_size) + bytes(36)
+
+
+@pytest.mark.parametrize('file_header, expected_file_type', [
+    (b'SQLite format 3\x00' + bytes(84), 'sqlite'),
+    (b'bplist00', 'plist'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF\x00', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\x1f\x8b\x08\x00', 'gz'),
+    (create_bmp_header(), 'bmp'),
+    (b'RIFF\x00\x00\x00\x00WAVEfmt ', 'wav'),
+    (b'\x00\x00\x00\x18ftypheic', 'heic'),
+    (b'\x00\x00\x00\x14ftypqt  ', 'mov'),
+    (b'\x00\x00\x00\x18ftypunknown', 'mp4'),
+    (b'\xef\xbb\xbf<?xml version="1.0"?>\n<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" '
+     b'"http://www.apple.com/DTDs/PropertyList-1.0.dtd">', 'plist'),
+    (b'<?xml version="1.0"?><root/>', 'xml'),
+    (b'synthetic text file', ''),
+    (b'', '')
+])
+def test_classify_file_header(file_header, expected_file_type):
+    assert file_type_classifier.classify_file_header(file_header) == expected_file_type
+
+
+@pytest.mark.parametrize('file_header', [
+    b'BMW service history\n',
+    create_bmp_header(dib_header_size=1000),
+    create_bmp_header(pixel_data_offset=20),
+    create_bmp_header(file_size=10),
+    create_bmp_header(reserved=1),
+    b'BM',
+    b'\x1f\x8b\x01\x00'
+])
+def test_classify_file_header_rejects_loose_signatures(file_header):
+    assert file_type_classifier.classify_file_header(file_header) == ''
+
+
+def test_classify_file_reads_the_file_header(working_directory):
+    file_path = os.path.join(str(working_directory), 'image')
+    with open(file_path, 'wb') as file_pointer:
+        file_pointer.write(b'\x89PNG\r\n\x1a\n' + bytes(Constants.FILE_SIGNATURE_READ_SIZE * 2))
+
+    assert file_type_classifier.classify_file(file_path) == 'png'
+    assert file_type_classifier.classify_file(os.path.join(str(working_directory), 'missing')) is None
+
+
+def test_classify_file_database_contents_leaves_unreadable_files_unclassified(mutable_backup_path, create_iphone_parser):
+    iphone_parser_instance = create_iphone_parser(mutable_backup_path)
+    iphone_parser_instance.analyse_iphone_content_files()
+    database_handle = iphone_parser_instance.database_handle
+
+    file_ID = synthetic_backup.get_file_ID('HomeDomain', Constants.SMS_MESSAGE_INFORMATION_DB_PATH)
+    sql_command = f"UPDATE {database_handle.file_database_table_name} SET {Constants.FILE_SIGNATURE_COLUMN} = NULL, absolute_Path = ? WHERE file_ID = ?"
+    database_handle.file_database_cursor.execute(sql_command, (os.path.join(mutable_backup_path, 'missing'), file_ID))
+    database_handle.commit_database_changes()
+
+    # The file is not counted as classified and is tried again on the next run
+    assert file_type_classifier.classify_file_database_contents(database_handle) == 0
+    sql_command = f"SELECT {Constants.FILE_SIGNATURE_COLUMN} FROM {database_handle.file_database_table_name} WHERE file_ID = ?"
+    assert database_handle.file_database_cursor.execute(sql_command, (file_ID,)).fetchone() == (None,)
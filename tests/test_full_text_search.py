@@ -0,0 +1,177 @@
+import datetime
+import os
+import plistlib
+import re
+import sqlite3
+import pytest
+import Constants
+import iPhone_file_database
+import iminer
+from benchmarks import synthetic_backup
+
+
+SMS_DATABASE_FILE_ID = synthetic_backup.get_file_ID('HomeDomain', Constants.SMS_MESSAGE_INFORMATION_DB_PATH)
+"""
+FileID of the sms.db file of the synthetic backups
+"""
+
+
+@pytest.fixture
+def indexed_iphone_parser(synthetic_backup_path, create_iphone_parser):
+    """
+    Parser of the shared synthetic backup with its file table and full text indexes built.
+    :return: IPhoneParser
+    """
+    iphone_parser_instance = create_iphone_parser(synthetic_backup_path)
+    iphone_parser_instance.storage_master['iphone_file_contents']
+    return iphone_parser_instance
+
+
+def read_message_texts(backup_path):
+    """
+    Read the message texts of the sms.db of a backup.
+    :return: Message rowid to text
+    """
+    sms_database_connection = sqlite3.connect(synthetic_backup.get_content_file_path(backup_path, SMS_DATABASE_FILE_ID))
+    try:
+        return dict(sms_database_connection.execute('SELECT ROWID, text FROM message'))
+    finally:
+        sms_database_connection.close()
+
+
+def get_words(text):
+    """
+    Split a text into lower case words the way the unicode61 tokenizer does (apostrophes separate words).
+    :return: Set of words
+    """
+    return set(re.findall(r"\w+", text.lower()))
+
+
+@pytest.mark.parametrize('query, expected_full_text_query', [
+    ('sms.db', '"sms.db"'),
+    ('Library SMS', '"Library" "SMS"'),
+    ('  Libr*  sms ', '"Libr"* "sms"'),
+    ('say "hi"', '"say" """hi"""'),
+    ('meeting OR keys', '"meeting" "OR" "keys"'),
+    ('NEAR(a b) -c ^d col:e', '"NEAR(a" "b)" "-c" "^d" "col:e"'),
+    ('* **', ''),
+    ('', '')
+])
+def test_quote_full_text_query(synthetic_backup_path, query, expected_full_text_query):
+    database_handle = iPhone_file_database.IphoneFileDatabase(synthetic_backup_path, 'full_text')
+    assert database_handle.quote_full_text_query(query) == expected_full_text_query
+    database_handle.close_databases()
+
+
+@pytest.mark.parametrize('query', ['sms.db', 'AND', 'NEAR(a b)', 'say "hi"', '-c ^d', 'domain:x'])
+def test_quoted_queries_are_never_parsed_as_query_syntax(indexed_iphone_parser, query, capsys):
+    database_handle = indexed_iphone_parser.database_handle
+    assert isinstance(database_handle.search_full_text(database_handle.quote_full_text_query(query), 'files'), list)
+    assert database_handle.search_full_text(database_handle.quote_full_text_query(query), 'sms') is not False
+    assert 'Invalid full text query' not in capsys.readouterr().out
+
+
+def test_file_full_text_index(indexed_iphone_parser):
+    database_handle = indexed_iphone_parser.database_handle
+    file_rows = [dict(file_row) for file_row in indexed_iphone_parser.storage_master['iphone_file_contents']]
+
+    hits = database_handle.search_full_text(database_handle.quote_full_text_query('sms.db'), 'files')
+    assert [(hit['domain'], hit['relative_Path']) for hit in hits] == [('HomeDomain', Constants.SMS_MESSAGE_INFORMATION_DB_PATH)]
+    assert set(hits[0]) == {*Constants.DEFAULT_SQL_STORAGE_REPORT_COLUMNS_LIST_FORM, 'rank'}
+
+    hits = database_handle.search_full_text(database_handle.quote_full_text_query('HomeDomain Synth*'), 'files', limit=1000)
+    assert sorted(hit['file_ID'] for hit in hits) == sorted(
+        file_row['file_ID'] for file_row in file_rows if file_row['domain'] == 'HomeDomain' and 'Synthetic' in file_row['relative_Path']
+    )
+    assert [hit['rank'] for hit in hits] == sorted(hit['rank'] for hit in hits)
+    assert len(database_handle.search_full_text(database_handle.quote_full_text_query('Synth*'), 'files', limit=7)) == 7
+    assert database_handle.search_full_text(database_handle.quote_full_text_query('nothing'), 'files') == []
+
+
+def test_sms_full_text_index(indexed_iphone_parser, synthetic_backup_path):
+    database_handle = indexed_iphone_parser.database_handle
+    message_texts = read_message_texts(synthetic_backup_path)
+
+    hits = database_handle.search_full_text(database_handle.quote_full_text_query('meeting keys'), 'sms', limit=1000)
+    assert sorted(hit['message_rowid'] for hit in hits) == sorted(
+        message_rowid for message_rowid, text in message_texts.items() if {'meeting', 'keys'} <= get_words(text)
+    )
+    assert all(hit['text'] == message_texts[hit['message_rowid']] for hit in hits)
+    assert all('[meeting]' in hit['snippet'] or '[keys]' in hit['snippet'] for hit in hits)
+
+    # An up to date index is not built again
+    assert indexed_iphone_parser.build_full_text_indexes() == 0
+
+
+def test_search_full_text_before_the_indexes_are_built(mutable_backup_path, capsys):
+    database_handle = iPhone_file_database.IphoneFileDatabase(mutable_backup_path, 'full_text')
+    assert database_handle.search_full_text('"sms"', 'files') is False
+    assert database_handle.search_full_text('"sms"', 'sms') is False
+    assert 'has not been built' in capsys.readouterr().out
+    database_handle.close_databases()
+
+
+def test_full_text_indexes_are_rebuilt_when_the_backup_changes(mutable_backup_path, create_iphone_parser):
+    iphone_parser_instance = create_iphone_parser(mutable_backup_path)
+    iphone_parser_instance.storage_master['iphone_file_contents']
+    assert iphone_parser_instance.database_handle.search_full_text('"zebra"', 'sms') == []
+    iphone_parser_instance.database_handle.close_databases()
+
+    added_file_ID = synthetic_backup.get_file_ID('HomeDomain', 'Library/Zebra/added.txt')
+    with open(synthetic_backup.get_content_file_path(mutable_backup_path, added_file_ID), 'wb') as file_pointer:
+        file_pointer.write(b'added')
+    manifest_connection = sqlite3.connect(os.path.join(mutable_backup_path, Constants.IPHONE_BACKUP_MANIFEST_DATABASE_FILE_NAME))
+    with manifest_connection:
+        manifest_connection.execute("INSERT INTO Files VALUES (?, 'HomeDomain', 'Library/Zebra/added.txt', 1, ?)",
+                                    (added_file_ID, synthetic_backup.create_mbfile_blob(5, 5, 5)))
+    manifest_connection.close()
+    # A new backup of the device gets a new status date
+    status_plist_path = os.path.join(mutable_backup_path, Constants.PLIST_FILE_STATUS_NAME)
+    with open(status_plist_path, 'rb') as file_pointer:
+        status_plist = plistlib.load(file_pointer)
+    status_plist['Date'] += datetime.timedelta(days=1)
+    with open(status_plist_path, 'wb') as file_pointer:
+        plistlib.dump(status_plist, file_pointer)
+    sms_database_path = synthetic_backup.get_content_file_path(mutable_backup_path, SMS_DATABASE_FILE_ID)
+    sms_database_connection = sqlite3.connect(sms_database_path)
+    with sms_database_connection:
+        sms_database_connection.execute("INSERT INTO message (guid, text) VALUES ('ADDED', 'a zebra crossing')")
+    sms_database_connection.close()
+    # The sms index is keyed on the size and modification time of the sms.db
+    os.utime(sms_database_path, (os.stat(sms_database_path).st_atime, os.stat(sms_database_path).st_mtime + 10))
+
+    iphone_parser_instance = create_iphone_parser(mutable_backup_path)
+    iphone_parser_instance.storage_master['iphone_file_contents']
+    database_handle = iphone_parser_instance.database_handle
+
+    assert [hit['file_ID'] for hit in database_handle.search_full_text('"zebra"', 'files')] == [added_file_ID]
+    assert [hit['text'] for hit in database_handle.search_full_text('"zebra"', 'sms')] == ['a zebra crossing']
+    sql_command = f"SELECT COUNT(*) FROM {Constants.DEFAULT_SQL_SMS_FULL_TEXT_TABLE_NAME}"
+    assert database_handle.file_database_cursor.execute(sql_command).fetchone() == (11,)
+
+
+def test_search_subcommand(indexed_iphone_parser, synthetic_backup_path, capsys):
+    message_texts = read_message_texts(synthetic_backup_path)
+    iminer.search_backup([synthetic_backup_path, 'sms.db'])
+    output_lines = capsys.readouterr().out.splitlines()
+    assert len(output_lines) == 2 and output_lines[0].endswith(f"\tHomeDomain\t{Constants.SMS_MESSAGE_INFORMATION_DB_PATH}\t"
+                                                                f"{synthetic_backup.get_content_file_path(synthetic_backup_path, SMS_DATABASE_FILE_ID)}")
+    assert output_lines[1].startswith('1 hits in ')
+
+    # Without --raw OR is a search term like any other, with --raw it is the FTS5 operator
+    iminer.search_backup([synthetic_backup_path, 'meeting', 'OR', 'keys', '--index', 'sms', '--limit', '1000'])
+    assert capsys.readouterr().out.splitlines()[-1].startswith('0 hits in ')
+    iminer.search_backup([synthetic_backup_path, 'meeting', 'OR', 'keys', '--index', 'sms', '--limit', '1000', '--raw'])
+    output_lines = capsys.readouterr().out.splitlines()
+    expected_message_count = len([text for text in message_texts.values() if get_words(text) & {'meeting', 'keys'}])
+    assert expected_message_count > 0 and output_lines[-1].startswith(f"{expected_message_count} hits in ")
+    assert all(re.match(r"\S+\tmessage \d+\t", output_line) for output_line in output_lines[:-1])
+
+    iminer.search_backup([synthetic_backup_path, 'NEAR(meeting', '--index', 'sms', '--raw'])
+    output_lines = capsys.readouterr().out.splitlines()
+    assert output_lines[0].startswith("Invalid full text query 'NEAR(meeting'") and output_lines[-1].startswith('0 hits in ')
+
+
+def test_search_subcommand_on_a_backup_that_is_not_indexed(mutable_backup_path, capsys):
+    iminer.search_backup([mutable_backup_path, 'sms.db'])
+    assert 'has not been indexed yet' in capsys.readouterr().out
@@ -0,0 +1,115 @@
+import pytest
+import Constants
+import file_table
+import manifest_search_index
+
+
+RELATIVE_PATH_COLUMN = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[2]
+"""
+Relative path column of the file rows
+"""
+DOMAIN_COLUMN = Constants.DEFAULT_SQL_STORAGE_COLUMNS_LIST_FORM[1]
+"""
+Domain column of the file rows
+"""
+
+
+@pytest.fixture
+def search_index():
+    """
+    Search index over a few files with overlapping paths and domains.
+    :return: ManifestSearchIndex
+    """
+    rows = [
+        ('0' * 40, 'HomeDomain', 'Library/SMS/sms.db-wal', 1, '/backup/00/0', 'db-wal'),
+        ('1' * 40, 'HomeDomain', 'Library/SMS/old/sms.db', 1, '/backup/11/1', 'db'),
+        ('2' * 40, 'AppDomain-net.whatsapp.WhatsApp', 'Library/SMS/sms.db', 1, '/backup/22/2', 'db'),
+        ('3' * 40, 'HomeDomain', 'Library/SMS/sms.db', 1, '/backup/33/3', 'db'),
+        ('4' * 40, 'AppDomain-net.whatsapp.WhatsAppSMB', 'Library/mysms.db', 1, '/backup/44/4', 'db'),
+        ('5' * 40, None, None, 2, '', '')
+    ]
+    return manifest_search_index.ManifestSearchIndex(file_table.FileTable.from_rows(rows))
+
+
+def get_file_IDs(file_rows):
+    """
+    Get the fileIDs of file rows, shortened to their first character.
+    :return: List of fileID characters
+    """
+    return [file_row['file_ID'][0] for file_row in file_rows]
+
+
+@pytest.mark.parametrize('column, search_string, expected_file_ID', [
+    # Exact relative paths are preferred, then whole path component suffixes, both in file table order
+    (RELATIVE_PATH_COLUMN, 'Library/SMS/sms.db', '2'),
+    (RELATIVE_PATH_COLUMN, 'sms.db', '1'),
+    (RELATIVE_PATH_COLUMN, 'SMS/sms.db', '2'),
+    (RELATIVE_PATH_COLUMN, '/SMS/sms.db/', '2'),
+    # Anything else is the first file containing the search string
+    (RELATIVE_PATH_COLUMN, 'sms.db-', '0'),
+    (RELATIVE_PATH_COLUMN, 'ms.db', '0'),
+    (DOMAIN_COLUMN, 'HomeDomain', '0'),
+    (DOMAIN_COLUMN, 'AppDomain-net.whatsapp.WhatsAppSMB', '4'),
+    (DOMAIN_COLUMN, 'whatsapp', '2'),
+    ('file_Type', 'wal', '0')
+])
+def test_search(search_index, column, search_string, expected_file_ID):
+    assert search_index.search(column, search_string)['file_ID'][0] == expected_file_ID
+
+
+@pytest.mark.parametrize('column, search_string', [
+    (RELATIVE_PATH_COLUMN, 'Library/SMS/sms.db-shm'),
+    (DOMAIN_COLUMN, 'CameraRollDomain'),
+    ('file_Type', 'sqlite')
+])
+def test_search_without_match(search_index, column, search_string):
+    assert search_index.search(column, search_string) is False
+
+
+def test_get_file(search_index):
+    assert search_index.get_file('HomeDomain', 'Library/SMS/sms.db')['file_ID'] == '3' * 40
+    assert search_index.get_file('AppDomain-net.whatsapp.WhatsApp', 'Library/SMS/sms.db')['file_ID'] == '2' * 40
+    assert search_index.get_file('HomeDomain', 'SMS/sms.db') is None
+    assert search_index.get_file('HomeDomain', 'Library/mysms.db') is None
+
+
+@pytest.mark.parametrize('suffix, expected_file_IDs', [
+    ('sms.db', ['1', '2', '3']),
+    ('SMS/sms.db', ['2', '3']),
+    ('/Library/SMS/sms.db', ['2', '3']),
+    ('old/sms.db', ['1']),
+    ('sms.db-wal', ['0']),
+    ('ms.db', []),
+    ('Library/SMS', [])
+])
+def test_find_by_suffix(search_index, suffix, expected_file_IDs):
+    assert get_file_IDs(search_index.find_by_suffix(suffix)) == expected_file_IDs
+
+
+@pytest.mark.parametrize('domain_prefix, expected_file_IDs', [
+    ('AppDomain-net.whatsapp', ['2', '4']),
+    ('AppDomain-net.whatsapp.WhatsAppSMB', ['4']),
+    ('HomeDomain', ['0', '1', '3']),
+    ('Home', ['0', '1', '3']),
+    ('Media', []),
+    ('', ['5', '2', '4', '0', '1', '3'])
+])
+def test_find_by_domain_prefix(search_index, domain_prefix, expected_file_IDs):
+    assert get_file_IDs(search_index.find_by_domain_prefix(domain_prefix)) == expected_file_IDs
+
+
+def test_lookups_match_linear_scans_of_the_synthetic_backup(synthetic_backup_path, create_iphone_parser):
+    file_rows = create_iphone_parser(synthetic_backup_path).storage_master['iphone_file_contents']
+    search_index = manifest_search_index.ManifestSearchIndex(file_rows)
+    rows = [dict(file_row) for file_row in file_rows]
+
+    for suffix in ('sms.db', 'Library/SMS/sms.db', 'Voicemail/voicemail.db', 'file_37', 'Synthetic/37'):
+        assert [dict(file_row) for file_row in search_index.find_by_suffix(suffix)] == [
+            row for row in rows if row[RELATIVE_PATH_COLUMN] == suffix or row[RELATIVE_PATH_COLUMN].endswith('/' + suffix)
+        ]
+    for domain_prefix in ('HomeDomain', 'AppDomain', 'Media'):
+        assert sorted(file_row['file_ID'] for file_row in search_index.find_by_domain_prefix(domain_prefix)) == sorted(
+            row['file_ID'] for row in rows if row[DOMAIN_COLUMN].startswith(domain_prefix)
+        )
+    for row in rows[::20]:
+        assert dict(search_index.get_file(row[DOMAIN_COLUMN], row[RELATIVE_PATH_COLUMN])) == row
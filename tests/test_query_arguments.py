@@ -0,0 +1,42 @@
+import argparse
+import pytest
+import iminer
+
+
+@pytest.mark.parametrize('size, expected_size', [
+    ('512', 512),
+    ('64K', 64 * 1024),
+    ('64k', 64 * 1024),
+    ('10M', 10 * 1024 ** 2),
+    ('1.5G', int(1.5 * 1024 ** 3)),
+    ('2T', 2 * 1024 ** 4),
+    ('10MB', 10 * 1024 ** 2),
+    ('10MiB', 10 * 1024 ** 2),
+    (' 7 k ', 7 * 1024)
+])
+def test_parse_size_argument(size, expected_size):
+    assert iminer.parse_size_argument(size) == expected_size
+
+
+@pytest.mark.parametrize('size', ['', 'M', '-1', '10X', '1e3', 'ten'])
+def test_parse_size_argument_rejects_invalid_sizes(size):
+    with pytest.raises(argparse.ArgumentTypeError):
+        iminer.parse_size_argument(size)
+
+
+@pytest.mark.parametrize('time_string, expected_time', [
+    ('1577836800', 1577836800),
+    ('0', 0),
+    ('2020-01-01', 1577836800),
+    ('2020-01-01T12:30:00', 1577881800),
+    ('2020-01-01 12:30:00', 1577881800),
+    ('2020-01-01T12:30:00+01:00', 1577878200)
+])
+def test_parse_time_argument(time_string, expected_time):
+    assert iminer.parse_time_argument(time_string) == expected_time
+
+
+@pytest.mark.parametrize('time_string', ['', 'yesterday', '2020-13-01', '01/01/2020'])
+def test_parse_time_argument_rejects_invalid_times(time_string):
+    with pytest.raises(argparse.ArgumentTypeError):
+        iminer.parse_time_argument(time_string)